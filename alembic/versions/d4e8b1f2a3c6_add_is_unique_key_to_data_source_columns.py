@@ -0,0 +1,65 @@
+"""add is_unique_key to data_source_columns
+
+Revision ID: d4e8b1f2a3c6
+Revises: c1a2f7c9e5b4
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d4e8b1f2a3c6"
+down_revision: Union[str, Sequence[str], None] = "c1a2f7c9e5b4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Clave unica por fila de las vistas RSH sembradas (scripts/seed_all_datasources.py)
+_UNIQUE_KEYS = {
+    "rsh.vw_beneficios_x_hogar": ["hogar_id"],
+    "rsh.vw_beneficios_x_persona": ["personas_id"],
+    "rsh.vw_elcsa_hogar": ["hogar_id"],
+    "rsh.vw_hogar_carac": ["personas_id"],
+    "rsh.vw_hogar_fecs_v2": ["hogar_id"],
+    "rsh.vw_hogares_datos_demograficos": ["hogar_id", "anio_captura"],
+    "rsh.vw_pobreza_hogars": ["hogar_id"],
+    "rsh.w_personas_fecs_v2": ["personas_id"],
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "data_source_columns",
+        sa.Column("is_unique_key", sa.Boolean(), nullable=False, server_default=sa.text("false")),
+    )
+
+    # Solo se marca la clave si el datasource tiene todas sus columnas
+    bind = op.get_bind()
+    for ch_table, key in _UNIQUE_KEYS.items():
+        rows = bind.execute(
+            sa.text(
+                "SELECT c.datasource_id, c.id, c.column_name FROM data_source_columns c "
+                "JOIN data_sources d ON d.id = c.datasource_id "
+                "WHERE d.ch_table = :ch_table AND c.column_name = ANY(:key)"
+            ),
+            {"ch_table": ch_table, "key": key},
+        ).fetchall()
+        by_datasource = {}
+        for datasource_id, col_id, column_name in rows:
+            by_datasource.setdefault(datasource_id, {})[column_name] = col_id
+        for columns in by_datasource.values():
+            if set(columns) != set(key):
+                continue
+            bind.execute(
+                sa.text("UPDATE data_source_columns SET is_unique_key = true WHERE id = ANY(:ids)"),
+                {"ids": list(columns.values())},
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("data_source_columns", "is_unique_key")
@@ -0,0 +1,73 @@
+"""
+Ejecucion concurrente de consultas ClickHouse independientes.
+
+Los builders que lanzan muchas consultas sin dependencia entre si (dashboard,
+stats) las envian juntas sobre el cliente compartido: la latencia pasa a ser la
+de la consulta mas lenta en lugar de la suma. La concurrencia esta acotada por
+llamada (CH_FANOUT_CONCURRENCY) y por proceso (CH_FANOUT_WORKERS, que no
+deberia superar CH_POOL_SIZE). El pool de threads se crea con la primera
+llamada y se vuelve a crear si el shutdown de la app lo cerro (p.ej. un segundo
+ciclo de lifespan en el mismo proceso).
+"""
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from functools import partial
+
+from api.utils import validar_env_var_number
+
+CH_FANOUT_WORKERS = validar_env_var_number("CH_FANOUT_WORKERS", 12)
+CH_FANOUT_CONCURRENCY = validar_env_var_number("CH_FANOUT_CONCURRENCY", 6)
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=CH_FANOUT_WORKERS, thread_name_prefix="ch-fanout")
+        return _executor
+
+
+def call_many(calls: dict, max_concurrency: int | None = None) -> dict:
+    """Ejecuta `{clave: funcion sin argumentos}` en paralelo y devuelve `{clave: resultado}`.
+
+    Si una llamada falla se descartan las pendientes y se propaga el primer error.
+    """
+    limit = max(1, max_concurrency or CH_FANOUT_CONCURRENCY)
+    pending_items = list(calls.items())
+    results = {}
+    running = {}
+    executor = _get_executor()
+
+    try:
+        while pending_items or running:
+            while pending_items and len(running) < limit:
+                key, fn = pending_items.pop(0)
+                running[executor.submit(copy_context().run, fn)] = key
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+    finally:
+        for future in running:
+            future.cancel()
+    return results
+
+
+def query_many(client, queries: dict, max_concurrency: int | None = None) -> dict:
+    """Ejecuta `{clave: (sql, params)}` en paralelo y devuelve `{clave: QueryResult}`."""
+    return call_many(
+        {key: partial(client.query, sql, parameters=params) for key, (sql, params) in queries.items()},
+        max_concurrency,
+    )
+
+
+def shutdown() -> None:
+    """Cierra el pool actual; la proxima llamada crea uno nuevo."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,113 @@
+"""
+Cliente ClickHouse compartido por todo el proceso.
+
+Un solo `HttpClient` de clickhouse_connect sobre un PoolManager de urllib3 con
+conexiones keep-alive: los requests ya no pagan la conexion ni el handshake de
+version del servidor. El cliente se crea sin session_id para que pueda usarse
+desde varios threads a la vez (las sesiones HTTP de ClickHouse serializan las
+consultas); los settings por request viajan en cada consulta.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SharedClickHouseClient:
+    """Cliente perezoso con health check periodico (`ping`) y recreacion si falla."""
+
+    def __init__(self, factory, health_interval: int = 30):
+        """
+        Args:
+            factory: callable que devuelve (client, pool_mgr).
+            health_interval: segundos entre pings; 0 desactiva el health check.
+        """
+        self._factory = factory
+        self._health_interval = health_interval
+        self._lock = threading.Lock()
+        self._client = None
+        self._pool_mgr = None
+        self._last_check = 0.0
+        self.created = 0
+        self.health_failures = 0
+
+    def get(self):
+        """Cliente actual, recreado si el health check falla.
+
+        El ping corre fuera del lock y lo hace un solo caller por intervalo; mientras
+        tanto los demas usan el cliente actual.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._client is None:
+                return self._create_locked(now)
+            client = self._client
+            if not self._health_interval or now - self._last_check < self._health_interval:
+                return client
+            self._last_check = now
+
+        if client.ping():
+            return client
+        with self._lock:
+            # Otro caller pudo haberlo recreado mientras se hacia el ping
+            if self._client is client:
+                logger.warning("Health check de ClickHouse fallido; se recrea el cliente")
+                self.health_failures += 1
+                self._close_locked()
+            if self._client is None:
+                return self._create_locked(time.monotonic())
+            return self._client
+
+    def _create_locked(self, now: float):
+        self._client, self._pool_mgr = self._factory()
+        self._last_check = now
+        self.created += 1
+        return self._client
+
+    def _close_locked(self) -> None:
+        """Cierra el cliente y su pool.
+
+        `HttpClient.close()` solo limpia el PoolManager si es propio, y el nuestro se lo
+        pasa `get_clickhouse_client`: sin `clear()` quedarian abiertos sus sockets keep-alive.
+        """
+        client, pool_mgr = self._client, self._pool_mgr
+        self._client, self._pool_mgr = None, None
+        if client is not None:
+            try:
+                client.close()
+            except Exception:
+                logger.warning("Error cerrando el cliente ClickHouse", exc_info=True)
+        if pool_mgr is not None:
+            try:
+                pool_mgr.clear()
+            except Exception:
+                logger.warning("Error cerrando el pool HTTP de ClickHouse", exc_info=True)
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_locked()
+
+    def stats(self) -> dict:
+        """Conexiones creadas, ociosas y requests por pool HTTP (host)."""
+        with self._lock:
+            pools = []
+            if self._pool_mgr is not None:
+                for key in list(self._pool_mgr.pools.keys()):
+                    pool = self._pool_mgr.pools.get(key)
+                    if pool is None:
+                        continue
+                    queue = getattr(pool.pool, "queue", None) or []
+                    pools.append({
+                        "host": f"{pool.host}:{pool.port}",
+                        "maxsize": pool.pool.maxsize if pool.pool is not None else 0,
+                        "connections_created": pool.num_connections,
+                        "idle": sum(1 for conn in list(queue) if conn is not None),
+                        "requests": pool.num_requests,
+                    })
+            return {
+                "active": self._client is not None,
+                "clients_created": self.created,
+                "health_failures": self.health_failures,
+                "pools": pools,
+            }
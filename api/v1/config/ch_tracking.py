@@ -0,0 +1,147 @@
+"""
+Seguimiento y cancelacion de consultas ClickHouse por request.
+
+Cada llamada que pasa por el cliente de `get_ch_client` lleva un `query_id`
+generado. Mientras la ruta se ejecuta, un watcher revisa si el cliente HTTP se
+desconecto o si vencio el timeout de la ruta; en ese caso se lanza
+`KILL QUERY` sobre los query_id emitidos para liberar capacidad del cluster.
+"""
+import asyncio
+import logging
+import threading
+import uuid
+
+from api.utils import validar_env_var_number
+
+logger = logging.getLogger(__name__)
+
+# Timeout por defecto de las rutas con ClickHouse (0 = sin timeout)
+CH_QUERY_TIMEOUT = validar_env_var_number("CH_QUERY_TIMEOUT_SECONDS", 0)
+# Intervalo de sondeo de desconexion del cliente HTTP
+CH_DISCONNECT_POLL = 0.5
+# Margen sobre el timeout de la ruta para el max_execution_time del servidor
+CH_KILL_GRACE = 10
+
+CANCEL_DISCONNECT = "disconnect"
+CANCEL_TIMEOUT = "timeout"
+
+# Metodos de clickhouse_connect que aceptan `settings` y envian una consulta
+_QUERY_METHODS = frozenset({
+    "query",
+    "query_row_block_stream",
+    "query_rows_stream",
+    "query_column_block_stream",
+    "query_df",
+    "query_np",
+    "query_arrow",
+    "raw_query",
+    "raw_stream",
+    "command",
+})
+_STREAM_METHODS = frozenset({
+    "query_row_block_stream",
+    "query_rows_stream",
+    "query_column_block_stream",
+    "raw_stream",
+})
+
+
+def ch_timeout(seconds: int | None):
+    """Decorador de ruta: timeout (segundos) para las consultas ClickHouse del request.
+
+    Usage:
+        @router.post("/execute")
+        @ch_timeout(120)
+        def execute(..., client=Depends(get_ch_client)):
+            ...
+    """
+    def decorator(endpoint):
+        endpoint.ch_timeout = seconds
+        return endpoint
+    return decorator
+
+
+def route_timeout(request) -> int | None:
+    """Timeout declarado por la ruta con `@ch_timeout`, o el default de entorno."""
+    endpoint = getattr(request.scope.get("route"), "endpoint", None)
+    seconds = getattr(endpoint, "ch_timeout", CH_QUERY_TIMEOUT)
+    return seconds or None
+
+
+class QueryTracker:
+    """query_id emitidos durante un request y motivo de cancelacion (si lo hubo)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._query_ids: list[str] = []
+        self.cancelled: str | None = None
+
+    def new_query_id(self) -> str:
+        query_id = f"ventana-{uuid.uuid4()}"
+        with self._lock:
+            self._query_ids.append(query_id)
+        return query_id
+
+    @property
+    def query_ids(self) -> list[str]:
+        with self._lock:
+            return list(self._query_ids)
+
+
+class TrackedClient:
+    """Proxy del cliente ClickHouse que agrega un query_id (y los settings del request) a cada consulta."""
+
+    def __init__(self, client, tracker: QueryTracker, settings: dict | None = None):
+        self._client = client
+        self.tracker = tracker
+        self.settings = settings or {}
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name not in _QUERY_METHODS:
+            return attr
+
+        def call(*args, settings: dict | None = None, **kwargs):
+            settings = {**self.settings, **(settings or {})}
+            settings["query_id"] = self.tracker.new_query_id()
+            if name in _STREAM_METHODS:
+                # Un stream sigue leyendose despues de que la ruta responde: no aplica el
+                # limite de tiempo de la ruta, y si la respuesta se abandona ClickHouse corta
+                settings.pop("max_execution_time", None)
+                settings.setdefault("cancel_http_readonly_queries_on_client_close", 1)
+            return attr(*args, settings=settings, **kwargs)
+
+        return call
+
+
+def kill_queries(client, query_ids: list[str]) -> None:
+    """KILL QUERY asincrono sobre los query_id dados (los ya terminados se ignoran)."""
+    if not query_ids:
+        return
+    try:
+        client.command(
+            "KILL QUERY WHERE query_id IN {ids:Array(String)} ASYNC",
+            parameters={"ids": query_ids},
+        )
+    except Exception:
+        logger.warning("No se pudieron cancelar las consultas %s", query_ids, exc_info=True)
+
+
+async def watch_request(request, tracker: QueryTracker, timeout: int | None, on_cancel) -> None:
+    """Espera la desconexion del cliente o el timeout y llama `on_cancel(query_ids)`.
+
+    Debe correr como tarea mientras la ruta se ejecuta; se cancela al terminar el request.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout else None
+    while True:
+        await asyncio.sleep(CH_DISCONNECT_POLL)
+        if await request.is_disconnected():
+            tracker.cancelled = CANCEL_DISCONNECT
+            break
+        if deadline is not None and loop.time() >= deadline:
+            tracker.cancelled = CANCEL_TIMEOUT
+            break
+    query_ids = tracker.query_ids
+    logger.info("Cancelando %d consulta(s) ClickHouse por %s", len(query_ids), tracker.cancelled)
+    await asyncio.to_thread(on_cancel, query_ids)
@@ -1,4 +1,5 @@
 from collections.abc import AsyncGenerator
+from contextlib import contextmanager
 from sqlalchemy import create_engine
 from sqlalchemy.orm import declarative_base, sessionmaker, Session
 from sqlalchemy.engine import URL
@@ -209,36 +210,66 @@ def get_db_sql() -> Generator:
 
 
 # ─── ClickHouse (RSH) ───────────────────────────────────────────────
+import asyncio
+
 import clickhouse_connect
+from clickhouse_connect.driver import httputil
+from fastapi import HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+
+from api.v1.config.ch_pool import SharedClickHouseClient
+from api.v1.config.ch_tracking import (
+    CANCEL_TIMEOUT,
+    CH_KILL_GRACE,
+    QueryTracker,
+    TrackedClient,
+    kill_queries,
+    route_timeout,
+    watch_request,
+)
 
 def _ch_is_active() -> bool:
     return validar_env_var_bool(
         validar_env_var_string(f"{env_mode}_CH_ACTIVA", "false")
     )
 
+def _ch_connection_options() -> dict:
+    return dict(
+        host=validar_env_var_string(f"{env_mode}_CH_HOST", "localhost"),
+        port=int(validar_env_var_string(f"{env_mode}_CH_PORT", "8123")),
+        username=validar_env_var_string(f"{env_mode}_CH_USER", "default"),
+        password=validar_env_var_string(f"{env_mode}_CH_PASSWORD", ""),
+        database=validar_env_var_string(f"{env_mode}_CH_DATABASE", "rsh"),
+        secure=validar_env_var_bool(
+            validar_env_var_string(f"{env_mode}_CH_SECURE", "false")
+        ),
+    )
+
+
 def get_clickhouse_client():
-    """Crea y retorna un cliente ClickHouse."""
-    if not _ch_is_active():
-        return None
+    """Crea un cliente ClickHouse sin session_id sobre un pool HTTP keep-alive.
 
-    host = validar_env_var_string(f"{env_mode}_CH_HOST", "localhost")
-    port = int(validar_env_var_string(f"{env_mode}_CH_PORT", "8123"))
-    user = validar_env_var_string(f"{env_mode}_CH_USER", "default")
-    password = validar_env_var_string(f"{env_mode}_CH_PASSWORD", "")
-    database = validar_env_var_string(f"{env_mode}_CH_DATABASE", "rsh")
-    secure = validar_env_var_bool(
-        validar_env_var_string(f"{env_mode}_CH_SECURE", "false")
+    Devuelve (client, pool_mgr). El proceso usa una sola instancia via `shared_ch_client`.
+    """
+    pool_mgr = httputil.get_pool_manager(
+        maxsize=validar_env_var_number("CH_POOL_SIZE", 16),
+        num_pools=2,
+        block=validar_env_var_bool(validar_env_var_string("CH_POOL_BLOCK", "true")),
+        keep_idle=validar_env_var_number("CH_POOL_KEEP_IDLE", 30),
     )
-
-    return clickhouse_connect.get_client(
-        host=host,
-        port=port,
-        username=user,
-        password=password,
-        database=database,
-        secure=secure,
+    client = clickhouse_connect.get_client(
+        **_ch_connection_options(),
         query_limit=0,
+        pool_mgr=pool_mgr,
+        autogenerate_session_id=False,
     )
+    return client, pool_mgr
+
+
+shared_ch_client = SharedClickHouseClient(
+    get_clickhouse_client,
+    health_interval=validar_env_var_number("CH_POOL_HEALTH_INTERVAL", 30),
+)
 
 
 def _ch_is_mock() -> bool:
@@ -259,18 +290,55 @@ def _get_mock_ch_client():
     return _mock_ch_client
 
 
-def get_ch_client():
-    """FastAPI dependency que provee un cliente ClickHouse (o mock)."""
-    if _ch_is_mock():
-        yield _get_mock_ch_client()
-        return
+def ch_is_available() -> bool:
+    """ClickHouse real activo o mock habilitado."""
+    return _ch_is_mock() or _ch_is_active()
+
 
+def _open_ch_client():
+    if _ch_is_mock():
+        return _get_mock_ch_client()
     if not _ch_is_active():
         raise RuntimeError(
             f"ClickHouse no está activo (revisa {env_mode}_CH_ACTIVA) o falta configuración."
         )
-    client = get_clickhouse_client()
+    return shared_ch_client.get()
+
+
+@contextmanager
+def ch_client_session():
+    """Cliente ClickHouse compartido (o mock) para usar fuera de un request, p.ej. jobs en background."""
+    yield _open_ch_client()
+
+
+def _kill_ch_queries(query_ids: list[str]) -> None:
+    # El pool asigna otra conexion: la del request sigue ocupada esperando la consulta
+    kill_queries(_open_ch_client(), query_ids)
+
+
+async def get_ch_client(request: Request):
+    """FastAPI dependency que provee un cliente ClickHouse (o mock).
+
+    Cada consulta lleva un query_id; si el cliente HTTP se desconecta o vence el
+    timeout de la ruta (`@ch_timeout`), las consultas en curso se cancelan con KILL QUERY.
+    """
+    client = await run_in_threadpool(_open_ch_client)
+    timeout = route_timeout(request)
+    tracker = QueryTracker()
+    watcher = asyncio.create_task(
+        watch_request(request, tracker, timeout, _kill_ch_queries)
+    )
+    # Settings de la "sesion" del request: viajan en cada consulta del cliente compartido.
+    # max_execution_time queda como respaldo en el servidor si el KILL no llega.
+    settings = {"max_execution_time": timeout + CH_KILL_GRACE} if timeout else None
     try:
-        yield client
+        yield TrackedClient(client, tracker, settings)
+    except Exception:
+        if tracker.cancelled == CANCEL_TIMEOUT:
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="La consulta excedió el tiempo máximo permitido y fue cancelada.",
+            )
+        raise
     finally:
-        client.close()
\ No newline at end of file
+        watcher.cancel()
@@ -35,6 +35,9 @@ class ResponseEncryptionMiddleware(BaseHTTPMiddleware):
             return await call_next(request)
 
         resp = await call_next(request)
+        # 304 Not Modified no lleva cuerpo que cifrar
+        if resp.status_code == 304:
+            return resp
 
         body = b""
         async for chunk in resp.body_iterator:
@@ -5,11 +5,11 @@ from starlette.requests import Request
 
 
 class ResponseWrapperMiddleware(BaseHTTPMiddleware):
-    # Headers que deben preservarse (CORS, etc.)
-    _PASSTHROUGH_PREFIXES = ("access-control-",)
+    # Headers que deben preservarse (CORS, validacion de cache, etc.)
+    _PASSTHROUGH_PREFIXES = ("access-control-", "etag", "cache-control")
 
     def _carry_headers(self, original_response, new_response):
-        """Copia headers CORS del response original al nuevo."""
+        """Copia headers CORS y de cache del response original al nuevo."""
         for key, value in original_response.headers.items():
             if any(key.lower().startswith(p) for p in self._PASSTHROUGH_PREFIXES):
                 new_response.headers[key] = value
@@ -70,6 +70,8 @@ class DataSourceColumn(BasePG):
     is_selectable = Column(Boolean, default=True)
     is_filterable = Column(Boolean, default=True)
     is_groupable = Column(Boolean, default=False, server_default="false")
+    # Parte de la clave unica por fila del datasource (paginacion por cursor)
+    is_unique_key = Column(Boolean, default=False, server_default="false")
     display_order = Column(Integer, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
@@ -1,9 +1,10 @@
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from fastapi.responses import StreamingResponse
 
 from api.v1.config.database import get_ch_client, get_sync_db_pg
+from api.v1.config.ch_tracking import ch_timeout
 from api.v1.dependencies.permission_dependency import RequirePermission
 from api.v1.dependencies.beneficiario_dependency import beneficiario_filters_dep
 from api.v1.auth.permissions import PermissionCode
@@ -11,10 +12,13 @@ from api.v1.schemas.persona import PersonaResumen
 from api.v1.schemas.vivienda import ViviendaDetalle
 from api.v1.schemas.beneficiario import (
     BeneficiarioFilters,
+    BeneficiarioLookupRequest,
+    BeneficiarioLookupResponse,
     BeneficiarioDetalle,
     BeneficiarioResumen,
     BeneficiarioStats,
     DashboardStats,
+    HogarBundle,
     PaginatedBeneficiarios,
     CatalogosResponse,
     CatalogoItem,
@@ -23,25 +27,39 @@ from api.v1.schemas.beneficiario import (
     MunicipiosActualizadosResponse,
     LugarPobladoItem,
 )
+from api.v1.services.paginacion import decode_cursor, next_cursor
 from api.v1.services.rsh.queries import (
+    BENEFICIARIOS_CURSOR_TYPES,
+    BENEFICIARIOS_SORT_KEYS,
+    HOGAR_BUNDLE_SECTIONS,
+    count_beneficiarios,
+    stream_beneficiarios,
     query_beneficiarios_lista,
     query_beneficiario_detalle,
+    query_hogar_bundle,
     query_stats,
     query_dashboard,
     query_catalogos,
-    query_municipios,
     query_municipios_actualizados,
-    query_lugares_poblados,
     query_personas_hogar,
     query_vivienda_hogar,
 )
+from api.v1.services.rsh.geografia import GeoHierarchyUnavailable, geo_hierarchy
+from api.v1.services.rsh.lookup import lookup_beneficiarios
 from api.v1.services.rsh.mappers import (
     row_to_beneficiario_resumen,
     row_to_beneficiario_detalle,
     row_to_persona,
     row_to_vivienda,
 )
-from api.v1.services.beneficiario.export import generate_csv, generate_excel, generate_pdf
+from api.v1.services.beneficiario.export import (
+    generate_csv_streaming,
+    generate_excel_streaming,
+    generate_pdf,
+)
+from api.v1.services.query_engine.export import iter_file
+from api.v1.services.catalogos import catalog_service, etag_matches
+from api.utils import validar_env_var_number
 from api.v1.services.user_checkpoint import (
     get_user_query_checkpoint,
     upsert_user_query_checkpoint,
@@ -49,14 +67,27 @@ from api.v1.services.user_checkpoint import (
 
 router = APIRouter(prefix="/beneficiarios", tags=["Beneficiarios"])
 
+# Timeout (segundos) tras el que se cancelan las consultas ClickHouse de una exportacion
+_EXPORT_TIMEOUT = validar_env_var_number("BENEFICIARIOS_EXPORT_TIMEOUT_SECONDS", 300)
+# El PDF es un reporte para imprimir: se corta en este numero de filas (CSV y Excel no tienen tope)
+_PDF_MAX_ROWS = validar_env_var_number("BENEFICIARIOS_EXPORT_PDF_MAX_ROWS", 5000)
+# Maximo de ids por peticion de busqueda masiva
+_LOOKUP_MAX_IDS = validar_env_var_number("BENEFICIARIOS_LOOKUP_MAX_IDS", 5000)
+
 
 @router.get("/catalogos")
 def catalogos(
+    request: Request,
+    response: Response,
     current_user=Depends(RequirePermission(PermissionCode.BENEFICIARIES_READ)),
     client=Depends(get_ch_client),
 ):
-    """Obtener catalogos de filtros desde datos RSH."""
-    raw = query_catalogos(client)
+    """Obtener catalogos de filtros desde datos RSH (cacheados, con ETag)."""
+    entry = catalog_service.get("rsh", query_catalogos, client)
+    if etag_matches(request, entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=entry.headers)
+    response.headers.update(entry.headers)
+    raw = entry.payload
     return CatalogosResponse(
         departamentos=[
             CatalogoItem(code=d["codigo"], name=d["nombre"])
@@ -83,8 +114,11 @@ def municipios_por_departamento(
     current_user=Depends(RequirePermission(PermissionCode.BENEFICIARIES_READ)),
     client=Depends(get_ch_client),
 ):
-    """Obtener municipios por departamento (cascada)."""
-    raw = query_municipios(client, departamento_codigo)
+    """Obtener municipios por departamento (cascada, desde la jerarquia en memoria)."""
+    try:
+        raw = geo_hierarchy.municipios(client, departamento_codigo)
+    except GeoHierarchyUnavailable as exc:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(exc))
     return [MunicipioItem(code=m["codigo"], name=m["nombre"]) for m in raw]
 
 
@@ -133,8 +167,11 @@ def lugares_poblados_por_municipio(
     current_user=Depends(RequirePermission(PermissionCode.BENEFICIARIES_READ)),
     client=Depends(get_ch_client),
 ):
-    """Obtener lugares poblados por municipio (cascada)."""
-    raw = query_lugares_poblados(client, municipio_codigo)
+    """Obtener lugares poblados por municipio (cascada, desde la jerarquia en memoria)."""
+    try:
+        raw = geo_hierarchy.lugares_poblados(client, municipio_codigo)
+    except GeoHierarchyUnavailable as exc:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(exc))
     return [LugarPobladoItem(code=lp["codigo"], name=lp["nombre"]) for lp in raw]
 
 
@@ -193,59 +230,79 @@ def stats(
 
 
 @router.get("/export/excel")
+@ch_timeout(_EXPORT_TIMEOUT)
 def export_excel(
     filters: BeneficiarioFilters = Depends(beneficiario_filters_dep),
     current_user=Depends(RequirePermission(PermissionCode.BENEFICIARIES_EXPORT)),
     client=Depends(get_ch_client),
 ):
-    """Exportar beneficiarios filtrados a Excel (.xlsx)."""
+    """Exportar todos los beneficiarios filtrados a Excel (.xlsx). X-Rows-Written indica las filas escritas."""
     filter_kwargs = filters.model_dump(exclude_none=True)
-    rows, _ = query_beneficiarios_lista(client, offset=0, limit=10000, **filter_kwargs)
-    items = [row_to_beneficiario_resumen(r) for r in rows]
-    buf = generate_excel(items)
+    rows = stream_beneficiarios(client, **filter_kwargs)
+    buf, written = generate_excel_streaming(row_to_beneficiario_resumen(r) for r in rows)
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     return StreamingResponse(
-        buf,
+        iter_file(buf),
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f'attachment; filename="beneficiarios_{ts}.xlsx"'},
+        headers={
+            "Content-Disposition": f'attachment; filename="beneficiarios_{ts}.xlsx"',
+            "X-Rows-Written": str(written),
+        },
     )
 
 
 @router.get("/export/csv")
+@ch_timeout(_EXPORT_TIMEOUT)
 def export_csv(
     filters: BeneficiarioFilters = Depends(beneficiario_filters_dep),
     current_user=Depends(RequirePermission(PermissionCode.BENEFICIARIES_EXPORT)),
     client=Depends(get_ch_client),
 ):
-    """Exportar beneficiarios filtrados a CSV."""
+    """Exportar todos los beneficiarios filtrados a CSV (streaming).
+
+    Los headers salen antes que las filas, asi que no hay conteo en la respuesta:
+    las filas escritas son las lineas del archivo menos el encabezado. No se hace
+    un count() previo, que costaria otro recorrido filtrado y podria no coincidir
+    con el archivo si hay una carga durante la descarga.
+    """
     filter_kwargs = filters.model_dump(exclude_none=True)
-    rows, _ = query_beneficiarios_lista(client, offset=0, limit=10000, **filter_kwargs)
-    items = [row_to_beneficiario_resumen(r) for r in rows]
-    buf = generate_csv(items)
+    rows = stream_beneficiarios(client, **filter_kwargs)
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     return StreamingResponse(
-        buf,
+        generate_csv_streaming(row_to_beneficiario_resumen(r) for r in rows),
         media_type="text/csv; charset=utf-8",
-        headers={"Content-Disposition": f'attachment; filename="beneficiarios_{ts}.csv"'},
+        headers={
+            "Content-Disposition": f'attachment; filename="beneficiarios_{ts}.csv"',
+        },
     )
 
 
 @router.get("/export/pdf")
+@ch_timeout(_EXPORT_TIMEOUT)
 def export_pdf(
     filters: BeneficiarioFilters = Depends(beneficiario_filters_dep),
     current_user=Depends(RequirePermission(PermissionCode.BENEFICIARIES_EXPORT)),
     client=Depends(get_ch_client),
 ):
-    """Exportar beneficiarios filtrados a PDF."""
+    """Exportar beneficiarios filtrados a PDF (hasta BENEFICIARIOS_EXPORT_PDF_MAX_ROWS filas).
+
+    X-Total-Rows indica cuantos cumplen los filtros y X-Rows-Written cuantas
+    filas se escribieron en el reporte.
+    """
     filter_kwargs = filters.model_dump(exclude_none=True)
-    rows, _ = query_beneficiarios_lista(client, offset=0, limit=5000, **filter_kwargs)
-    items = [row_to_beneficiario_resumen(r) for r in rows]
+    total = count_beneficiarios(client, **filter_kwargs)
+    # Acotado por _PDF_MAX_ROWS; el PDF se arma en memoria de todas formas
+    items = [row_to_beneficiario_resumen(r) for r in stream_beneficiarios(client, limit=_PDF_MAX_ROWS, **filter_kwargs)]
     buf = generate_pdf(items)
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     return StreamingResponse(
         buf,
         media_type="application/pdf",
-        headers={"Content-Disposition": f'attachment; filename="beneficiarios_{ts}.pdf"'},
+        headers={
+            "Content-Disposition": f'attachment; filename="beneficiarios_{ts}.pdf"',
+            "X-Total-Rows": str(total),
+            "X-Rows-Written": str(len(items)),
+        },
     )
 
 
@@ -254,14 +311,80 @@ def listar(
     filters: BeneficiarioFilters = Depends(beneficiario_filters_dep),
     offset: int = Query(0, ge=0, description="Offset para paginacion"),
     limit: int = Query(20, ge=1, le=100, description="Limite de resultados"),
+    cursor: str | None = Query(None, description="Cursor de la pagina siguiente (next_cursor); ignora offset"),
     current_user=Depends(RequirePermission(PermissionCode.BENEFICIARIES_READ)),
     client=Depends(get_ch_client),
 ):
-    """Lista paginada de beneficiarios con filtros."""
+    """Lista paginada de beneficiarios con filtros (por offset o por cursor)."""
     filter_kwargs = filters.model_dump(exclude_none=True)
-    rows, total = query_beneficiarios_lista(client, offset=offset, limit=limit, **filter_kwargs)
+    try:
+        after = decode_cursor(cursor, BENEFICIARIOS_CURSOR_TYPES) if cursor else None
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    rows, total = query_beneficiarios_lista(client, offset=offset, limit=limit, cursor=after, **filter_kwargs)
     items = [row_to_beneficiario_resumen(r) for r in rows]
-    return PaginatedBeneficiarios(items=items, total=total, offset=offset, limit=limit)
+    return PaginatedBeneficiarios(
+        items=items,
+        total=total,
+        offset=0 if after else offset,
+        limit=limit,
+        next_cursor=next_cursor(rows, limit, BENEFICIARIOS_SORT_KEYS),
+    )
+
+
+@router.post("/lookup", response_model=BeneficiarioLookupResponse)
+def lookup(
+    body: BeneficiarioLookupRequest,
+    current_user=Depends(RequirePermission(PermissionCode.BENEFICIARIES_READ)),
+    client=Depends(get_ch_client),
+):
+    """Busqueda masiva por lista de hogar_id o CUI, en una sola consulta.
+
+    Devuelve los hogares en el orden de la lista, los ids sin resultado
+    (`no_encontrados`) y las entradas que no son numericas (`invalidos`).
+    """
+    if len(body.ids) > _LOOKUP_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Maximo {_LOOKUP_MAX_IDS} ids por busqueda (recibidos {len(body.ids)})",
+        )
+    return lookup_beneficiarios(client, body.campo, body.ids)
+
+
+@router.get("/{hogar_id}/bundle", response_model=HogarBundle, response_model_exclude_unset=True)
+def hogar_bundle(
+    hogar_id: int,
+    include: str | None = Query(
+        None, description="Secciones separadas por coma: detalle, personas, vivienda (por defecto todas)",
+    ),
+    current_user=Depends(RequirePermission(PermissionCode.BENEFICIARIES_READ)),
+    client=Depends(get_ch_client),
+):
+    """Ficha completa de un hogar (detalle, personas y vivienda) con las consultas en paralelo."""
+    sections = [s.strip() for s in include.split(",") if s.strip()] if include else list(HOGAR_BUNDLE_SECTIONS)
+    invalid = [s for s in sections if s not in HOGAR_BUNDLE_SECTIONS]
+    if invalid or not sections:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Secciones no validas: {', '.join(invalid) or include}. "
+                   f"Use: {', '.join(HOGAR_BUNDLE_SECTIONS)}",
+        )
+
+    raw = query_hogar_bundle(client, hogar_id, list(dict.fromkeys(sections)))
+    if "detalle" in raw and raw["detalle"] is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Hogar no encontrado",
+        )
+
+    bundle = {"hogar_id": hogar_id}
+    if "detalle" in raw:
+        bundle["detalle"] = row_to_beneficiario_detalle(raw["detalle"])
+    if "personas" in raw:
+        bundle["personas"] = [row_to_persona(r) for r in raw["personas"]]
+    if "vivienda" in raw:
+        bundle["vivienda"] = row_to_vivienda(raw["vivienda"]) if raw["vivienda"] else None
+    return HogarBundle(**bundle)
 
 
 @router.get("/{hogar_id}/personas", response_model=list[PersonaResumen])
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 
 from api.v1.config.database import get_ch_client
 from api.v1.config.institutional_presets import INSTITUTIONAL_PRESETS
@@ -15,11 +15,16 @@ from api.v1.schemas.consulta import (
     IntervencionCount,
 )
 from api.v1.services.consulta.queries import (
+    CONSULTA_CURSOR_TYPES,
+    CONSULTA_SORT_KEYS,
     query_consulta_lista,
     query_consulta_detalle,
     query_consulta_dashboard,
     query_consulta_catalogos,
 )
+from api.v1.services.catalogos import catalog_service, etag_matches
+from api.v1.services.paginacion import decode_cursor, next_cursor
+from api.v1.services.query_engine.cache import query_fingerprint
 from api.v1.services.consulta.mappers import (
     row_to_beneficio_resumen,
     row_to_beneficio_detalle,
@@ -109,12 +114,23 @@ def dashboard(
 
 @router.get("/catalogos", response_model=ConsultaCatalogosResponse)
 def catalogos(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_active_user),
     client=Depends(get_ch_client),
 ):
-    """Obtener catalogos de filtros scoped a la institucion."""
+    """Obtener catalogos de filtros scoped a la institucion (cacheados, con ETag)."""
     code, preset = _get_preset(current_user)
-    raw = query_consulta_catalogos(client, preset["base_filter_columns"], preset["base_filter_logic"])
+    base_columns, base_logic = preset["base_filter_columns"], preset["base_filter_logic"]
+    entry = catalog_service.get(
+        "consulta:" + query_fingerprint(base_columns, base_logic),
+        lambda c: query_consulta_catalogos(c, base_columns, base_logic),
+        client,
+    )
+    if etag_matches(request, entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=entry.headers)
+    response.headers.update(entry.headers)
+    raw = entry.payload
     return ConsultaCatalogosResponse(
         departamentos=[
             CatalogoItem(code=d["codigo"], name=d["nombre"])
@@ -129,22 +145,33 @@ def listar(
     filters: ConsultaFilters = Depends(consulta_filters_dep),
     offset: int = Query(0, ge=0, description="Offset para paginacion"),
     limit: int = Query(20, ge=1, le=100, description="Limite de resultados"),
+    cursor: str | None = Query(None, description="Cursor de la pagina siguiente (next_cursor); ignora offset"),
     current_user: User = Depends(get_current_active_user),
     client=Depends(get_ch_client),
 ):
-    """Lista paginada de hogares con filtros institucionales."""
+    """Lista paginada de hogares con filtros institucionales (por offset o por cursor)."""
     code, preset = _get_preset(current_user)
     interv_cols = preset["intervention_columns"]
 
     filter_kwargs = filters.model_dump(exclude_none=True)
     filter_kwargs.update(_extract_intervention_filters(request, preset))
+    try:
+        after = decode_cursor(cursor, CONSULTA_CURSOR_TYPES) if cursor else None
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
 
     rows, total = query_consulta_lista(
         client, preset["base_filter_columns"], preset["base_filter_logic"], interv_cols,
-        offset=offset, limit=limit, **filter_kwargs
+        offset=offset, limit=limit, cursor=after, **filter_kwargs
     )
     items = [row_to_beneficio_resumen(r, interv_cols) for r in rows]
-    return PaginatedConsulta(items=items, total=total, offset=offset, limit=limit)
+    return PaginatedConsulta(
+        items=items,
+        total=total,
+        offset=0 if after else offset,
+        limit=limit,
+        next_cursor=next_cursor(rows, limit, CONSULTA_SORT_KEYS),
+    )
 
 
 @router.get("/{hogar_id}")
@@ -1,11 +1,10 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from api.v1.config.database import get_sync_db_pg, get_ch_client
 from api.v1.dependencies.auth_dependency import get_current_active_user
 from api.v1.auth.permissions import PermissionCode
 from api.v1.models.user import User
-from api.v1.models.data_source import DataSource
 from api.v1.schemas.dashboard import (
     AdminDashboardStats,
     InstitutionalDashboardStats,
@@ -20,9 +19,16 @@ from api.v1.schemas.dashboard import (
 from api.v1.services.dashboard.queries import (
     query_system_stats,
     query_rsh_global_stats,
-    query_rsh_institutional_stats,
     query_institutional_pg_stats,
+    institution_base_filters,
 )
+from api.v1.services.dashboard.snapshots import (
+    GLOBAL_KEY,
+    dashboard_snapshots,
+    institutional_builder,
+    institutional_key,
+)
+from api.v1.services.rsh.geografia import GeoHierarchyUnavailable, geo_hierarchy
 
 router = APIRouter(prefix="/dashboard", tags=["Dashboard"])
 
@@ -38,22 +44,20 @@ def _get_user_base_filters(user: User, db: Session) -> tuple[list[str], str, lis
     """Get base_filter_columns and intervention_columns for user's institution."""
     if not user.institution_id:
         return None
-    ds = (
-        db.query(DataSource)
-        .filter(
-            DataSource.institution_id == user.institution_id,
-            DataSource.is_active == True,
-        )
-        .first()
-    )
-    if not ds or not ds.base_filter_columns:
-        return None
-    # Buscar intervention_columns del preset institucional
-    from api.v1.config.institutional_presets import INSTITUTIONAL_PRESETS
-    institution = user.institution
-    preset = INSTITUTIONAL_PRESETS.get(institution.code, {}) if institution else {}
-    intervention_cols = preset.get("intervention_columns", [])
-    return ds.base_filter_columns, ds.base_filter_logic or "OR", intervention_cols
+    return institution_base_filters(db, user.institution)
+
+
+def _departamento_valido(client, departamento: str) -> bool:
+    """True si el codigo esta en la jerarquia RSH.
+
+    Si la jerarquia no esta disponible no se rechaza: las claves por departamento
+    que vienen del request se calculan al vuelo sin registrarse ni guardarse.
+    """
+    try:
+        tree = geo_hierarchy.tree(client)
+    except GeoHierarchyUnavailable:
+        return True
+    return departamento in {d["codigo"] for d in tree.departamentos}
 
 
 @router.get("/")
@@ -70,8 +74,13 @@ def get_dashboard(
     """
     if _is_admin(current_user):
         return _build_admin_dashboard(db, client).model_dump()
-    else:
-        return _build_institutional_dashboard(current_user, db, client, departamento_codigo=departamento).model_dump()
+    departamento = (departamento or "").strip() or None
+    if departamento and not _departamento_valido(client, departamento):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Departamento no valido: {departamento}",
+        )
+    return _build_institutional_dashboard(current_user, db, client, departamento_codigo=departamento).model_dump()
 
 
 def _build_admin_dashboard(db: Session, client) -> AdminDashboardStats:
@@ -79,8 +88,9 @@ def _build_admin_dashboard(db: Session, client) -> AdminDashboardStats:
     # Stats del sistema (PG)
     sys_stats = query_system_stats(db)
 
-    # Stats RSH (ClickHouse)
-    rsh = query_rsh_global_stats(client)
+    # Stats RSH (ClickHouse) desde el snapshot materializado
+    snapshot = dashboard_snapshots.get(GLOBAL_KEY, query_rsh_global_stats, client)
+    rsh = snapshot.payload
 
     # Beneficiarios por institucion
     benef_map = rsh.get("beneficiarios_por_institucion", {})
@@ -98,6 +108,7 @@ def _build_admin_dashboard(db: Session, client) -> AdminDashboardStats:
     ]
 
     return AdminDashboardStats(
+        generated_at=snapshot.generated_at,
         # Sistema
         total_instituciones=sys_stats["total_instituciones"],
         total_usuarios=sys_stats["total_usuarios"],
@@ -168,18 +179,23 @@ def _build_institutional_dashboard(user: User, db: Session, client, departamento
     # Stats PG
     pg_stats = query_institutional_pg_stats(db, user.institution_id) if user.institution_id else {}
 
-    # Stats RSH scoped
+    # Stats RSH scoped desde el snapshot materializado
     base_filters = _get_user_base_filters(user, db)
+    generated_at = None
     if base_filters:
-        rsh = query_rsh_institutional_stats(
-            client, base_filters[0], base_filters[1],
-            intervention_columns=base_filters[2],
-            departamento_codigo=departamento_codigo,
+        # Los departamentos fuera de los precalculados se calculan al vuelo, sin registrarse
+        snapshot = dashboard_snapshots.get(
+            institutional_key(*base_filters, departamento_codigo),
+            institutional_builder(*base_filters, departamento_codigo),
+            client,
+            register=departamento_codigo is None,
         )
+        rsh, generated_at = snapshot.payload, snapshot.generated_at
     else:
         rsh = {}
 
     return InstitutionalDashboardStats(
+        generated_at=generated_at,
         institution_name=inst_name,
         institution_code=inst_code,
         # RSH scoped
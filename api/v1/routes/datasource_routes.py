@@ -3,6 +3,8 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query as QueryPar
 from sqlalchemy.orm import Session, joinedload
 from api.v1.config.database import get_sync_db_pg, get_ch_client
 from api.v1.services.query_engine.engine import _safe_identifier
+from api.v1.services.query_engine.cache import invalidate_datasource
+from api.v1.services.query_engine.metadata import metadata_cache
 from api.v1.dependencies.permission_dependency import RequirePermission
 from api.v1.dependencies.auth_dependency import get_current_active_user
 from api.v1.auth.permissions import PermissionCode
@@ -23,6 +25,12 @@ def _is_admin(user: User) -> bool:
     return PermissionCode.SYSTEM_CONFIG.value in user_permissions
 
 
+def _datasource_changed(ds_id: UUID) -> None:
+    """Invalida metadatos, totales y resultados cacheados tras mutar un datasource o sus columnas."""
+    metadata_cache.bump()
+    invalidate_datasource(ds_id)
+
+
 def _get_datasource(ds_id: UUID, db: Session) -> DataSource:
     ds = db.query(DataSource).options(joinedload(DataSource.columns_def)).filter(DataSource.id == ds_id).first()
     if not ds:
@@ -68,6 +76,7 @@ def create_datasource(
     ds = DataSource(**body.model_dump())
     db.add(ds)
     db.commit()
+    metadata_cache.bump()
     db.refresh(ds)
     return _datasource_to_out(ds)
 
@@ -212,6 +221,7 @@ def auto_discover_columns(
         new_count += 1
 
     db.commit()
+    _datasource_changed(ds.id)
     db.refresh(ds)
     return _datasource_to_out(ds)
 
@@ -240,6 +250,7 @@ def update_datasource(
     for key, value in body.model_dump(exclude_unset=True).items():
         setattr(ds, key, value)
     db.commit()
+    _datasource_changed(ds.id)
     db.refresh(ds)
     return _datasource_to_out(ds)
 
@@ -253,6 +264,7 @@ def delete_datasource(
     ds = _get_datasource(ds_id, db)
     ds.is_active = False
     db.commit()
+    _datasource_changed(ds.id)
 
 
 @router.post("/{ds_id}/columns", response_model=DataSourceColumnOut, status_code=status.HTTP_201_CREATED)
@@ -272,10 +284,12 @@ def create_column(
         is_selectable=body.is_selectable,
         is_filterable=body.is_filterable,
         is_groupable=body.is_groupable,
+        is_unique_key=body.is_unique_key,
         display_order=body.display_order,
     )
     db.add(col)
     db.commit()
+    _datasource_changed(ds.id)
     db.refresh(col)
     return _column_to_out(col)
 
@@ -301,6 +315,7 @@ def update_column(
             value = ColumnCategory(value)
         setattr(col, key, value)
     db.commit()
+    _datasource_changed(ds_id)
     db.refresh(col)
     return _column_to_out(col)
 
@@ -320,6 +335,7 @@ def delete_column(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Columna no encontrada")
     db.delete(col)
     db.commit()
+    _datasource_changed(ds_id)
 
 
 def _datasource_to_out(ds: DataSource) -> DataSourceOut:
@@ -347,5 +363,6 @@ def _column_to_out(col: DataSourceColumn) -> DataSourceColumnOut:
         is_selectable=col.is_selectable,
         is_filterable=col.is_filterable,
         is_groupable=col.is_groupable,
+        is_unique_key=bool(col.is_unique_key),
         display_order=col.display_order,
     )
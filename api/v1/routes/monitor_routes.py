@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends
+
+from api.v1.dependencies.permission_dependency import RequirePermission
+from api.v1.auth.permissions import PermissionCode
+from api.v1.models.user import User
+from api.v1.config.database import shared_ch_client
+from api.v1.services.catalogos import catalog_service
+from api.v1.services.dashboard.snapshots import dashboard_snapshots
+from api.v1.services.query_engine.cache import cache_stats
+from api.v1.services.rsh.geografia import geo_hierarchy
+from api.v1.services.query_engine.guardrails import estimate_cache
+from api.v1.services.query_engine.metadata import metadata_cache
+
+router = APIRouter(prefix="/monitor", tags=["Monitor"])
+
+_monitor_permission = RequirePermission(PermissionCode.SYSTEM_MONITOR)
+
+
+@router.get("/cache")
+def get_cache_stats(
+    current_user: User = Depends(_monitor_permission),
+):
+    """Contadores de hits/misses, entradas y memoria de los caches del Query Builder."""
+    return {
+        **cache_stats(),
+        "metadata": metadata_cache.stats(),
+        "estimates": estimate_cache.stats(),
+        "dashboard_snapshots": dashboard_snapshots.stats(),
+        "catalogos": catalog_service.stats(),
+        "geografia": geo_hierarchy.stats(),
+    }
+
+
+@router.get("/clickhouse")
+def get_clickhouse_pool_stats(
+    current_user: User = Depends(_monitor_permission),
+):
+    """Estado del cliente ClickHouse compartido: conexiones creadas, ociosas y requests por pool."""
+    return shared_ch_client.stats()
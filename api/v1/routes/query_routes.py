@@ -1,27 +1,35 @@
 from uuid import UUID
+from dataclasses import replace
 from datetime import datetime
 from enum import Enum
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from starlette.responses import StreamingResponse
+from starlette.responses import StreamingResponse, FileResponse
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import or_
 from api.v1.config.database import get_sync_db_pg, get_ch_client
+from api.v1.config.ch_tracking import ch_timeout
 from api.v1.dependencies.auth_dependency import get_current_active_user
 from api.v1.dependencies.permission_dependency import RequireAnyPermission
 from api.v1.models.user import User
-from api.v1.models.data_source import DataSource, SavedQuery, RoleDataSource
+from api.v1.models.data_source import SavedQuery
 from api.v1.schemas.query_builder import (
-    QueryExecuteRequest, QueryExecuteResponse, ColumnMeta,
+    QueryExecuteRequest, QueryExecuteResponse, QueryExplainResponse, ColumnMeta, ExportJobOut,
     SavedQueryCreate, SavedQueryUpdate, SavedQueryOut, SavedQueryListItem,
 )
 from api.v1.services.query_engine.validators import validate_columns, validate_filters, validate_group_by, validate_aggregations
-from api.v1.services.query_engine.engine import execute_query
+from api.v1.services.query_engine.engine import execute_query, execute_query_keyset, stream_query
+from api.v1.services.query_engine.cache import cached_result, normalize_filters, query_fingerprint
+from api.v1.services.query_engine.metadata import DataSourceSnapshot, metadata_cache
+from api.v1.services.query_engine import guardrails
+from api.v1.services.query_engine.export_jobs import export_job_manager
 from api.v1.services.query_engine.export import (
     generate_csv_streaming as gen_query_csv_stream,
     generate_excel as gen_query_excel,
     generate_pdf as gen_query_pdf,
+    iter_file,
 )
 from api.v1.auth.permissions import PermissionCode
+from api.utils import validar_env_var_number
 
 
 class ExportFormat(str, Enum):
@@ -31,6 +39,10 @@ class ExportFormat(str, Enum):
 
 router = APIRouter(prefix="/queries", tags=["Query Builder"])
 
+# Timeouts (segundos) tras los que se cancelan las consultas ClickHouse del request
+_EXECUTE_TIMEOUT = validar_env_var_number("QUERY_EXECUTE_TIMEOUT_SECONDS", 120)
+_EXPORT_TIMEOUT = validar_env_var_number("QUERY_EXPORT_TIMEOUT_SECONDS", 300)
+
 # Permission guard: read-only query routes (list, execute)
 _query_permission = RequireAnyPermission([
     PermissionCode.DATABASES_READ,
@@ -80,13 +92,9 @@ def _is_admin(user: User) -> bool:
     return PermissionCode.SYSTEM_CONFIG.value in user_permissions
 
 
-def _get_user_datasource(ds_id: UUID, user: User, db: Session) -> DataSource:
-    ds = (
-        db.query(DataSource)
-        .options(joinedload(DataSource.columns_def))
-        .filter(DataSource.id == ds_id, DataSource.is_active == True)
-        .first()
-    )
+def _get_user_datasource(ds_id: UUID, user: User, db: Session) -> DataSourceSnapshot:
+    """Datasource accesible por el usuario, servido desde el cache de metadatos (sin queries a PG)."""
+    ds = metadata_cache.get_datasource(db, ds_id)
     if not ds:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="DataSource no encontrado")
     if not _is_admin(user):
@@ -94,11 +102,7 @@ def _get_user_datasource(ds_id: UUID, user: User, db: Session) -> DataSource:
         if user.institution_id and ds.institution_id and user.institution_id == ds.institution_id:
             return ds
         # Otherwise check role-datasource mapping
-        has_access = db.query(RoleDataSource).filter(
-            RoleDataSource.role_id == user.role_id,
-            RoleDataSource.datasource_id == ds.id,
-        ).first()
-        if not has_access:
+        if ds.id not in metadata_cache.role_datasource_ids(db, user.role_id):
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No tiene acceso a este DataSource")
     return ds
 
@@ -168,26 +172,107 @@ def _can_access_saved_query(sq: SavedQuery, user: User) -> bool:
     return False
 
 
+def _guardrail_verdict(
+    client, ds, user: User, validated_cols, filters, group_by, aggregations, downgrade: bool = True,
+) -> str:
+    """Pre-flight con EXPLAIN ESTIMATE segun los limites del rol. Rechaza (400) o devuelve el veredicto.
+
+    Con `downgrade=False` (exportaciones, que no calculan total) solo se aplican los
+    limites de rechazo.
+    """
+    if not guardrails.GUARDRAILS_ENABLED:
+        return guardrails.VERDICT_OK
+    limits = guardrails.limits_for_role(user.role.code if user.role else None)
+    if not downgrade:
+        limits = replace(limits, downgrade_rows=None)
+    if not (limits.max_rows or limits.max_bytes or limits.downgrade_rows):
+        return guardrails.VERDICT_OK
+    estimate = guardrails.estimate_query(client, ds, validated_cols, filters, group_by, aggregations)
+    verdict = guardrails.evaluate(estimate, limits)
+    if verdict == guardrails.VERDICT_REJECT:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=(
+                f"La consulta leería aproximadamente {estimate.rows:,} filas y excede el límite "
+                "permitido para su rol. Agregue filtros más selectivos."
+            ),
+        )
+    return verdict
+
+
+def _apply_guardrails(
+    client, ds, user: User, validated_cols, filters, group_by, aggregations, count_mode: str,
+) -> str:
+    """Pre-flight con EXPLAIN ESTIMATE. Rechaza (400) o devuelve el count_mode a usar."""
+    verdict = _guardrail_verdict(client, ds, user, validated_cols, filters, group_by, aggregations)
+    if verdict == guardrails.VERDICT_DOWNGRADE:
+        return guardrails.downgrade_count_mode(count_mode, grouped=bool(group_by and aggregations))
+    return count_mode
+
+
+def _check_export_guardrails(client, ds, user: User, validated_cols, filters, group_by, aggregations) -> None:
+    """Pre-flight de exportaciones y jobs de exportacion: solo rechazo (400)."""
+    _guardrail_verdict(client, ds, user, validated_cols, filters, group_by, aggregations, downgrade=False)
+
+
+def _run_query(
+    client, ds, user: User, validated_cols, filters, *,
+    group_by=None, aggregations=None,
+    pagination="offset", offset=0, limit=20, cursor=None, count_mode="exact",
+) -> tuple[list[dict], int | None, str | None, str]:
+    """Ejecuta la pagina (offset o keyset) pasando por el cache de resultados.
+
+    Devuelve (filas, total, next_cursor, count_mode usado). El guardrail de costo
+    corre solo si la pagina no esta en cache: un acierto no lee ClickHouse, asi que
+    no hay nada que estimar ni rechazar.
+    """
+    key = query_fingerprint(
+        "result",
+        str(ds.id),
+        ds.ch_table,
+        ds.base_filter_columns or [],
+        ds.base_filter_logic,
+        [c.column_name for c in validated_cols],
+        normalize_filters(filters),
+        group_by or [],
+        aggregations or [],
+        pagination, offset, limit, cursor, count_mode,
+    )
+
+    def compute():
+        mode = _apply_guardrails(client, ds, user, validated_cols, filters, group_by, aggregations, count_mode)
+        if pagination == "cursor" or cursor:
+            try:
+                rows, total, next_cursor = execute_query_keyset(
+                    client, ds, validated_cols, filters, limit, cursor,
+                    group_by=group_by, aggregations=aggregations, count_mode=mode,
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+            return rows, total, next_cursor, mode
+        rows, total = execute_query(
+            client, ds, validated_cols, filters, offset, limit,
+            group_by=group_by, aggregations=aggregations, count_mode=mode,
+        )
+        return rows, total, None, mode
+
+    return cached_result(key, str(ds.id), compute)
+
+
 @router.get("/datasources")
 def list_available_datasources(
     current_user: User = Depends(_query_permission),
     db: Session = Depends(get_sync_db_pg),
 ):
-    query = db.query(DataSource).options(joinedload(DataSource.columns_def)).filter(DataSource.is_active == True)
+    sources = metadata_cache.list_datasources(db)
     if not _is_admin(current_user):
-        accessible_ids = db.query(RoleDataSource.datasource_id).filter(
-            RoleDataSource.role_id == current_user.role_id,
-        ).subquery()
-        if current_user.institution_id:
-            query = query.filter(
-                or_(
-                    DataSource.id.in_(accessible_ids),
-                    DataSource.institution_id == current_user.institution_id,
-                )
-            )
-        else:
-            query = query.filter(DataSource.id.in_(accessible_ids))
-    sources = query.order_by(DataSource.name).all()
+        accessible_ids = metadata_cache.role_datasource_ids(db, current_user.role_id)
+        sources = [
+            ds for ds in sources
+            if ds.id in accessible_ids
+            or (current_user.institution_id and ds.institution_id == current_user.institution_id)
+        ]
+    sources = sorted(sources, key=lambda ds: ds.name)
     return [
         {
             "id": str(ds.id),
@@ -204,6 +289,7 @@ def list_available_datasources(
                     "is_selectable": c.is_selectable,
                     "is_filterable": c.is_filterable,
                     "is_groupable": c.is_groupable,
+                    "is_unique_key": c.is_unique_key,
                 }
                 for c in sorted(ds.columns_def or [], key=lambda x: x.display_order)
             ],
@@ -213,6 +299,7 @@ def list_available_datasources(
 
 
 @router.post("/execute", response_model=QueryExecuteResponse)
+@ch_timeout(_EXECUTE_TIMEOUT)
 def execute_adhoc_query(
     body: QueryExecuteRequest,
     current_user: User = Depends(_query_permission),
@@ -237,16 +324,61 @@ def execute_adhoc_query(
     if agg_dicts:
         validate_aggregations(agg_dicts, ds.columns_def)
 
-    rows, total = execute_query(
-        client, ds, validated_cols, filters_dicts, body.offset, body.limit,
+    rows, total, next_cursor, count_mode = _run_query(
+        client, ds, current_user, validated_cols, filters_dicts,
         group_by=group_by_names or None,
         aggregations=agg_dicts or None,
+        pagination=body.pagination, offset=body.offset, limit=body.limit,
+        cursor=body.cursor, count_mode=body.count_mode,
     )
 
     columns_meta = _build_columns_meta(group_by_names or None, agg_dicts or None, ds.columns_def, validated_cols)
 
     return QueryExecuteResponse(
         items=rows, total=total, offset=body.offset, limit=body.limit, columns_meta=columns_meta,
+        next_cursor=next_cursor, count_mode=count_mode,
+    )
+
+
+@router.post("/explain", response_model=QueryExplainResponse)
+def explain_adhoc_query(
+    body: QueryExecuteRequest,
+    current_user: User = Depends(_query_permission),
+    db: Session = Depends(get_sync_db_pg),
+    client=Depends(get_ch_client),
+):
+    """Estimar filas/bytes a leer (EXPLAIN ESTIMATE) y el veredicto de los limites del rol, sin ejecutar."""
+    ds = _get_user_datasource(body.datasource_id, current_user, db)
+    validated_cols = validate_columns(body.columns, ds.columns_def)
+    filters_dicts = [f.model_dump() for f in body.filters]
+    validate_filters(filters_dicts, ds.columns_def)
+
+    group_by_names = body.group_by or []
+    agg_dicts = [a.model_dump() for a in body.aggregations] if body.aggregations else []
+    if bool(group_by_names) != bool(agg_dicts):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="group_by y aggregations deben proporcionarse juntos",
+        )
+    if group_by_names:
+        validate_group_by(group_by_names, ds.columns_def)
+    if agg_dicts:
+        validate_aggregations(agg_dicts, ds.columns_def)
+
+    estimate = guardrails.estimate_query(
+        client, ds, validated_cols, filters_dicts, group_by_names or None, agg_dicts or None,
+    )
+    limits = guardrails.limits_for_role(current_user.role.code if current_user.role else None)
+    return QueryExplainResponse(
+        rows=estimate.rows,
+        marks=estimate.marks,
+        parts=estimate.parts,
+        bytes=estimate.bytes,
+        verdict=guardrails.evaluate(estimate, limits),
+        guardrails_enabled=guardrails.GUARDRAILS_ENABLED,
+        max_rows=limits.max_rows,
+        downgrade_rows=limits.downgrade_rows,
+        max_bytes=limits.max_bytes,
     )
 
 
@@ -258,7 +390,31 @@ _MEDIA_TYPES = {
 _EXTENSIONS = {"csv": "csv", "excel": "xlsx", "pdf": "pdf"}
 
 
+def _export_response(rows, columns_meta: list[dict], formato: ExportFormat, title: str, filename: str):
+    """Arma la respuesta de descarga consumiendo las filas del stream de ClickHouse."""
+    disposition = f'attachment; filename="{filename}"'
+
+    if formato == ExportFormat.csv:
+        return StreamingResponse(
+            gen_query_csv_stream(rows, columns_meta),
+            media_type=_MEDIA_TYPES["csv"],
+            headers={"Content-Disposition": disposition},
+        )
+
+    if formato == ExportFormat.excel:
+        content = iter_file(gen_query_excel(rows, columns_meta, title=title))
+    else:
+        content = gen_query_pdf(rows, columns_meta, title=title)
+
+    return StreamingResponse(
+        content,
+        media_type=_MEDIA_TYPES[formato.value],
+        headers={"Content-Disposition": disposition},
+    )
+
+
 @router.post("/execute/export")
+@ch_timeout(_EXPORT_TIMEOUT)
 def export_adhoc_query(
     body: QueryExecuteRequest,
     formato: ExportFormat = Query(..., description="Formato de exportacion: csv, excel, pdf"),
@@ -284,8 +440,11 @@ def export_adhoc_query(
     if agg_dicts:
         validate_aggregations(agg_dicts, ds.columns_def)
 
-    rows, _ = execute_query(
-        client, ds, validated_cols, filters_dicts, 0, 2_000_000_000,
+    _check_export_guardrails(
+        client, ds, current_user, validated_cols, filters_dicts, group_by_names or None, agg_dicts or None,
+    )
+    rows = stream_query(
+        client, ds, validated_cols, filters_dicts,
         group_by=group_by_names or None,
         aggregations=agg_dicts or None,
     )
@@ -298,25 +457,7 @@ def export_adhoc_query(
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     ext = _EXTENSIONS[formato.value]
     filename = f"consulta_{ts}.{ext}"
-    disposition = f'attachment; filename="{filename}"'
-
-    if formato == ExportFormat.csv:
-        return StreamingResponse(
-            gen_query_csv_stream(rows, columns_meta),
-            media_type=_MEDIA_TYPES["csv"],
-            headers={"Content-Disposition": disposition},
-        )
-
-    if formato == ExportFormat.excel:
-        buf = gen_query_excel(rows, columns_meta, title="Consulta")
-    else:
-        buf = gen_query_pdf(rows, columns_meta, title="Consulta")
-
-    return StreamingResponse(
-        buf,
-        media_type=_MEDIA_TYPES[formato.value],
-        headers={"Content-Disposition": disposition},
-    )
+    return _export_response(rows, columns_meta, formato, "Consulta", filename)
 
 
 @router.post("/saved", status_code=status.HTTP_201_CREATED)
@@ -580,10 +721,14 @@ def delete_saved_query(
 
 
 @router.post("/saved/{query_id}/execute", response_model=QueryExecuteResponse)
+@ch_timeout(_EXECUTE_TIMEOUT)
 def execute_saved_query(
     query_id: UUID,
     offset: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=1000),
+    pagination: str = Query("offset", pattern="^(offset|cursor)$"),
+    cursor: str | None = Query(None, description="Cursor opaco devuelto como next_cursor"),
+    count_mode: str = Query("exact", pattern="^(exact|approx|none)$"),
     current_user: User = Depends(_query_permission),
     db: Session = Depends(get_sync_db_pg),
     client=Depends(get_ch_client),
@@ -601,16 +746,19 @@ def execute_saved_query(
     validated_cols = validate_columns(sq.selected_columns, ds.columns_def)
     validate_filters(sq.filters or [], ds.columns_def)
 
-    rows, total = execute_query(
-        client, ds, validated_cols, sq.filters or [], offset, limit,
+    rows, total, next_cursor, count_mode = _run_query(
+        client, ds, current_user, validated_cols, sq.filters or [],
         group_by=sq.group_by or None,
         aggregations=sq.aggregations or None,
+        pagination=pagination, offset=offset, limit=limit,
+        cursor=cursor, count_mode=count_mode,
     )
 
     columns_meta = _build_columns_meta(sq.group_by or None, sq.aggregations or None, ds.columns_def, validated_cols)
 
     return QueryExecuteResponse(
         items=rows, total=total, offset=offset, limit=limit, columns_meta=columns_meta,
+        next_cursor=next_cursor, count_mode=count_mode,
     )
 
 
@@ -618,6 +766,7 @@ def execute_saved_query(
 
 
 @router.get("/saved/{query_id}/export")
+@ch_timeout(_EXPORT_TIMEOUT)
 def export_saved_query(
     query_id: UUID,
     formato: ExportFormat = Query(..., description="Formato de exportacion: csv, excel, pdf"),
@@ -639,8 +788,11 @@ def export_saved_query(
     validated_cols = validate_columns(sq.selected_columns, ds.columns_def)
     validate_filters(sq.filters or [], ds.columns_def)
 
-    rows, _ = execute_query(
-        client, ds, validated_cols, sq.filters or [], 0, 2_000_000_000,
+    _check_export_guardrails(
+        client, ds, current_user, validated_cols, sq.filters or [], sq.group_by or None, sq.aggregations or None,
+    )
+    rows = stream_query(
+        client, ds, validated_cols, sq.filters or [],
         group_by=sq.group_by or None,
         aggregations=sq.aggregations or None,
     )
@@ -655,22 +807,137 @@ def export_saved_query(
     ext = _EXTENSIONS[formato.value]
     safe_name = "".join(c if c.isalnum() or c in "_- " else "_" for c in title).strip()[:50]
     filename = f"{safe_name}_{ts}.{ext}"
-    disposition = f'attachment; filename="{filename}"'
+    return _export_response(rows, columns_meta, formato, title, filename)
 
-    if formato == ExportFormat.csv:
-        return StreamingResponse(
-            gen_query_csv_stream(rows, columns_meta),
-            media_type=_MEDIA_TYPES["csv"],
-            headers={"Content-Disposition": disposition},
+
+# ── Jobs asincronos de exportacion ───────────────────────────────────
+
+
+def _submit_export_job(client, current_user: User, ds, validated_cols, filters, group_by, aggregations,
+                       formato: ExportFormat, title: str, filename: str) -> ExportJobOut:
+    _check_export_guardrails(client, ds, current_user, validated_cols, filters, group_by, aggregations)
+    columns_meta = [
+        {"column_name": c.column_name, "label": c.label, "data_type": c.data_type}
+        for c in _build_columns_meta(group_by, aggregations, ds.columns_def, validated_cols)
+    ]
+    try:
+        job = export_job_manager.submit(
+            current_user.id, ds, validated_cols, filters, group_by, aggregations,
+            columns_meta, formato.value, title, filename,
         )
+    except OverflowError as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+    return ExportJobOut(**job.to_dict())
 
-    if formato == ExportFormat.excel:
-        buf = gen_query_excel(rows, columns_meta, title=title)
-    else:
-        buf = gen_query_pdf(rows, columns_meta, title=title)
 
-    return StreamingResponse(
-        buf,
-        media_type=_MEDIA_TYPES[formato.value],
-        headers={"Content-Disposition": disposition},
+def _get_user_export_job(job_id: str, user: User):
+    job = export_job_manager.get(job_id)
+    if not job or (user.id not in job.user_ids and not _is_admin(user)):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Exportación no encontrada")
+    return job
+
+
+@router.post("/export-jobs", response_model=ExportJobOut, status_code=status.HTTP_202_ACCEPTED)
+def submit_adhoc_export_job(
+    body: QueryExecuteRequest,
+    formato: ExportFormat = Query(..., description="Formato de exportacion: csv, excel, pdf"),
+    current_user: User = Depends(_query_permission),
+    db: Session = Depends(get_sync_db_pg),
+    client=Depends(get_ch_client),
+):
+    """Encolar la exportacion de una consulta ad-hoc. Consultar estado en /export-jobs/{job_id}."""
+    ds = _get_user_datasource(body.datasource_id, current_user, db)
+    validated_cols = validate_columns(body.columns, ds.columns_def)
+    filters_dicts = [f.model_dump() for f in body.filters]
+    validate_filters(filters_dicts, ds.columns_def)
+
+    group_by_names = body.group_by or []
+    agg_dicts = [a.model_dump() for a in body.aggregations] if body.aggregations else []
+    if bool(group_by_names) != bool(agg_dicts):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="group_by y aggregations deben proporcionarse juntos",
+        )
+    if group_by_names:
+        validate_group_by(group_by_names, ds.columns_def)
+    if agg_dicts:
+        validate_aggregations(agg_dicts, ds.columns_def)
+
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"consulta_{ts}.{_EXTENSIONS[formato.value]}"
+    return _submit_export_job(
+        client, current_user, ds, validated_cols, filters_dicts,
+        group_by_names or None, agg_dicts or None, formato, "Consulta", filename,
+    )
+
+
+@router.post("/saved/{query_id}/export-jobs", response_model=ExportJobOut, status_code=status.HTTP_202_ACCEPTED)
+def submit_saved_export_job(
+    query_id: UUID,
+    formato: ExportFormat = Query(..., description="Formato de exportacion: csv, excel, pdf"),
+    current_user: User = Depends(_query_permission),
+    db: Session = Depends(get_sync_db_pg),
+    client=Depends(get_ch_client),
+):
+    """Encolar la exportacion de una consulta guardada."""
+    sq = (
+        db.query(SavedQuery)
+        .options(joinedload(SavedQuery.data_source))
+        .filter(SavedQuery.id == query_id)
+        .first()
+    )
+    if not sq or not _can_access_saved_query(sq, current_user):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Consulta no encontrada")
+
+    ds = _get_user_datasource(sq.datasource_id, current_user, db)
+    validated_cols = validate_columns(sq.selected_columns, ds.columns_def)
+    validate_filters(sq.filters or [], ds.columns_def)
+
+    title = sq.name or "Consulta"
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    safe_name = "".join(c if c.isalnum() or c in "_- " else "_" for c in title).strip()[:50]
+    filename = f"{safe_name}_{ts}.{_EXTENSIONS[formato.value]}"
+    return _submit_export_job(
+        client, current_user, ds, validated_cols, sq.filters or [],
+        sq.group_by or None, sq.aggregations or None, formato, title, filename,
     )
+
+
+@router.get("/export-jobs/{job_id}", response_model=ExportJobOut)
+def get_export_job(
+    job_id: str,
+    current_user: User = Depends(_query_permission),
+):
+    """Estado y progreso de una exportacion."""
+    job = _get_user_export_job(job_id, current_user)
+    return ExportJobOut(**job.to_dict())
+
+
+class _ExportFileResponse(FileResponse):
+    """FileResponse que libera la reserva del archivo al terminar, aun si el cliente se desconecta."""
+
+    def __init__(self, job_id: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.job_id = job_id
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            export_job_manager.release_download(self.job_id)
+
+
+@router.get("/export-jobs/{job_id}/download")
+def download_export_job(
+    job_id: str,
+    current_user: User = Depends(_query_permission),
+):
+    """Descargar el archivo de una exportacion terminada."""
+    job = _get_user_export_job(job_id, current_user)
+    path = export_job_manager.acquire_download(job)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"La exportación no está disponible (estado: {job.status})",
+        )
+    return _ExportFileResponse(job.id, path, media_type=_MEDIA_TYPES[job.formato], filename=job.filename)
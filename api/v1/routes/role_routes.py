@@ -28,6 +28,7 @@ from api.v1.services.role import (
 from api.v1.dependencies.permission_dependency import RequirePermission
 from api.v1.auth.permissions import PermissionCode
 from api.v1.models.user import User
+from api.v1.services.query_engine.metadata import metadata_cache
 
 router = APIRouter(prefix="/roles", tags=["Roles"])
 
@@ -150,6 +151,7 @@ def delete_existing_role(
         )
 
     delete_role(db, role)
+    metadata_cache.bump()
     return {"message": "Rol eliminado correctamente"}
 
 
@@ -234,6 +236,7 @@ def update_role_datasources(
         db.add(RoleDataSource(role_id=role_id, datasource_id=ds_id))
 
     db.commit()
+    metadata_cache.bump()
 
     # Return updated list
     assigned = (
@@ -1,6 +1,9 @@
 from datetime import datetime
 from pydantic import BaseModel
-from typing import Optional
+from typing import Literal, Optional, Union
+
+from api.v1.schemas.persona import PersonaResumen
+from api.v1.schemas.vivienda import ViviendaDetalle
 
 
 # ── Catalogos ─────────────────────────────────────────────────────────
@@ -171,6 +174,36 @@ class PaginatedBeneficiarios(BaseModel):
     total: int
     offset: int
     limit: int
+    next_cursor: str | None = None
+
+
+# ── Busqueda masiva ───────────────────────────────────────────────────
+
+class BeneficiarioLookupRequest(BaseModel):
+    """Lista pegada de hogar_id o CUI (enteros o texto con espacios/guiones)."""
+    campo: Literal["hogar_id", "cui"] = "hogar_id"
+    ids: list[Union[int, str]]
+
+
+class BeneficiarioLookupItem(BaseModel):
+    id: int
+    beneficiarios: list[BeneficiarioResumen]
+
+
+class BeneficiarioLookupResponse(BaseModel):
+    """Encontrados en el orden de la lista, ids sin resultado y entradas no numericas."""
+    items: list[BeneficiarioLookupItem]
+    encontrados: int
+    no_encontrados: list[int]
+    invalidos: list[str]
+
+
+class HogarBundle(BaseModel):
+    """Ficha de un hogar en una sola respuesta; solo trae las secciones pedidas en `include`."""
+    hogar_id: int
+    detalle: Optional[dict] = None
+    personas: Optional[list[PersonaResumen]] = None
+    vivienda: Optional[ViviendaDetalle] = None
 
 
 # ── Estadisticas ──────────────────────────────────────────────────────
@@ -19,6 +19,7 @@ class PaginatedConsulta(BaseModel):
     total: int
     offset: int
     limit: int
+    next_cursor: str | None = None
 
 
 # -- Dashboard stats ----------------------------------------------------------
@@ -1,3 +1,4 @@
+from datetime import datetime
 from pydantic import BaseModel
 from typing import Optional
 
@@ -49,6 +50,9 @@ class InstitutionBeneficiariosCount(BaseModel):
 
 class AdminDashboardStats(BaseModel):
     """Dashboard completo para Super Admin."""
+    # Momento en que se calculo el snapshot de datos RSH (marca de frescura)
+    generated_at: Optional[datetime] = None
+
     # Sistema
     total_instituciones: int = 0
     total_usuarios: int = 0
@@ -94,6 +98,8 @@ class AdminDashboardStats(BaseModel):
 
 class InstitutionalDashboardStats(BaseModel):
     """Dashboard para Admin Institucional y Usuario Institucional."""
+    # Momento en que se calculo el snapshot de datos RSH (marca de frescura)
+    generated_at: Optional[datetime] = None
     institution_name: str = ""
     institution_code: str = ""
 
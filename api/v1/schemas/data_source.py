@@ -12,6 +12,7 @@ class DataSourceColumnCreate(BaseModel):
     is_selectable: bool = True
     is_filterable: bool = True
     is_groupable: bool = False
+    is_unique_key: bool = False
     display_order: int = 0
 
 
@@ -23,6 +24,7 @@ class DataSourceColumnUpdate(BaseModel):
     is_selectable: Optional[bool] = None
     is_filterable: Optional[bool] = None
     is_groupable: Optional[bool] = None
+    is_unique_key: Optional[bool] = None
     display_order: Optional[int] = None
 
 
@@ -36,6 +38,7 @@ class DataSourceColumnOut(BaseModel):
     is_selectable: bool
     is_filterable: bool
     is_groupable: bool = False
+    is_unique_key: bool = False
     display_order: int
 
     class Config:
@@ -5,6 +5,8 @@ from uuid import UUID
 
 ALLOWED_OPERATORS = {"eq", "neq", "gt", "lt", "gte", "lte", "like", "in"}
 ALLOWED_AGGREGATIONS = {"COUNT", "SUM"}
+ALLOWED_PAGINATION_MODES = {"offset", "cursor"}
+ALLOWED_COUNT_MODES = {"exact", "approx", "none"}
 
 
 class Aggregation(BaseModel):
@@ -41,6 +43,25 @@ class QueryExecuteRequest(BaseModel):
     aggregations: list[Aggregation] = []
     offset: int = 0
     limit: int = 20
+    # Paginacion keyset: "cursor" ignora offset y devuelve next_cursor
+    pagination: str = "offset"
+    cursor: Optional[str] = None
+    # exact: total exacto; approx: estimado/cacheado; none: sin total
+    count_mode: str = "exact"
+
+    @field_validator("pagination")
+    @classmethod
+    def validate_pagination(cls, v: str) -> str:
+        if v not in ALLOWED_PAGINATION_MODES:
+            raise ValueError(f"Modo de paginación no soportado: {v}. Permitidos: {ALLOWED_PAGINATION_MODES}")
+        return v
+
+    @field_validator("count_mode")
+    @classmethod
+    def validate_count_mode(cls, v: str) -> str:
+        if v not in ALLOWED_COUNT_MODES:
+            raise ValueError(f"Modo de conteo no soportado: {v}. Permitidos: {ALLOWED_COUNT_MODES}")
+        return v
 
 
 class ColumnMeta(BaseModel):
@@ -51,10 +72,39 @@ class ColumnMeta(BaseModel):
 
 class QueryExecuteResponse(BaseModel):
     items: list[dict]
-    total: int
+    total: Optional[int] = None
     offset: int
     limit: int
     columns_meta: list[ColumnMeta]
+    next_cursor: Optional[str] = None
+    # Modo de total aplicado (puede diferir del pedido si los guardrails degradan la consulta)
+    count_mode: Optional[str] = None
+
+
+class QueryExplainResponse(BaseModel):
+    rows: int
+    marks: int
+    parts: int
+    bytes: Optional[int] = None
+    verdict: str
+    guardrails_enabled: bool
+    max_rows: Optional[int] = None
+    downgrade_rows: Optional[int] = None
+    max_bytes: Optional[int] = None
+
+
+class ExportJobOut(BaseModel):
+    id: str
+    status: str
+    formato: str
+    filename: str
+    rows_written: int = 0
+    total_rows: Optional[int] = None
+    progress: Optional[float] = None
+    size_bytes: int = 0
+    error: Optional[str] = None
+    created_at: str
+    finished_at: Optional[str] = None
 
 
 class SavedQueryCreate(BaseModel):
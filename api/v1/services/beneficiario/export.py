@@ -1,12 +1,21 @@
 """
 Generacion de reportes de beneficiarios en Excel y PDF.
+
+Las exportaciones completas usan las variantes `*_streaming`: reciben las filas
+como iterador (bloques de ClickHouse), CSV se emite por chunks y Excel se
+escribe en modo write_only sobre un archivo temporal, con memoria constante
+sin importar cuantas filas haya.
 """
 from io import BytesIO
 from io import StringIO
 from datetime import datetime
+from collections.abc import Generator, Iterable
+from itertools import islice
+from tempfile import SpooledTemporaryFile
 import csv
 
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
 
@@ -69,6 +78,24 @@ def generate_csv(rows: list[dict]) -> BytesIO:
     return output
 
 
+_CSV_CHUNK_SIZE = 1000
+
+
+def generate_csv_streaming(rows: Iterable[dict]) -> Generator[bytes, None, None]:
+    """Genera el CSV por chunks para StreamingResponse, sin cargar todo en RAM."""
+    buf = StringIO()
+    csv.writer(buf, lineterminator="\n").writerow(COLUMNS)
+    yield b"\xef\xbb\xbf" + buf.getvalue().encode("utf-8")
+
+    it = iter(rows)
+    while chunk := list(islice(it, _CSV_CHUNK_SIZE)):
+        chunk_buf = StringIO()
+        writer = csv.writer(chunk_buf, lineterminator="\n")
+        for beneficiario in chunk:
+            writer.writerow(_row(beneficiario))
+        yield chunk_buf.getvalue().encode("utf-8")
+
+
 # ── Excel ────────────────────────────────────────────────────────────
 
 def generate_excel(rows: list[dict]) -> BytesIO:
@@ -123,6 +150,55 @@ def generate_excel(rows: list[dict]) -> BytesIO:
     return buf
 
 
+# Anchos fijos por columna: en write_only no se puede ajustar despues de escribir
+_EXCEL_WIDTHS = [14, 16, 40, 12, 20, 24, 30, 10, 12, 10, 22, 10, 22]
+# Filas de datos por hoja (limite de Excel: 1.048.576 incluyendo el header)
+EXCEL_MAX_ROWS_PER_SHEET = 1_048_575
+_SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+
+def generate_excel_streaming(
+    rows: Iterable[dict], max_rows_per_sheet: int = EXCEL_MAX_ROWS_PER_SHEET,
+) -> tuple[SpooledTemporaryFile, int]:
+    """Genera el .xlsx en modo write_only; devuelve (archivo temporal al inicio, filas escritas).
+
+    Si las filas no caben en una hoja se continua en "Beneficiarios (2)", etc.
+    """
+    wb = Workbook(write_only=True)
+    header_font = Font(bold=True, color="FFFFFF", size=11)
+    header_fill = PatternFill(start_color="1F4E79", end_color="1F4E79", fill_type="solid")
+    header_alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
+
+    def new_sheet(number: int):
+        ws = wb.create_sheet(title="Beneficiarios" if number == 1 else f"Beneficiarios ({number})")
+        for col_idx, width in enumerate(_EXCEL_WIDTHS, 1):
+            ws.column_dimensions[get_column_letter(col_idx)].width = width
+        ws.freeze_panes = "A2"
+        header = []
+        for title in COLUMNS:
+            cell = WriteOnlyCell(ws, value=title)
+            cell.font = header_font
+            cell.fill = header_fill
+            cell.alignment = header_alignment
+            header.append(cell)
+        ws.append(header)
+        return ws
+
+    sheets, written = 1, 0
+    ws = new_sheet(sheets)
+    for beneficiario in rows:
+        if written and written % max_rows_per_sheet == 0:
+            sheets += 1
+            ws = new_sheet(sheets)
+        ws.append(_row(beneficiario))
+        written += 1
+
+    buf = SpooledTemporaryFile(max_size=_SPOOL_MAX_MEMORY)
+    wb.save(buf)
+    buf.seek(0)
+    return buf, written
+
+
 # ── PDF ──────────────────────────────────────────────────────────────
 
 class _BeneficiarioPDF(FPDF):
@@ -145,7 +221,7 @@ class _BeneficiarioPDF(FPDF):
         self.cell(0, 10, f"Pagina {self.page_no()}/{{nb}}", align="C")
 
 
-def generate_pdf(rows: list[dict]) -> BytesIO:
+def generate_pdf(rows: Iterable[dict]) -> BytesIO:
     """Genera un archivo PDF landscape en memoria."""
     pdf = _BeneficiarioPDF(orientation="L", unit="mm", format="A4")
     pdf.alias_nb_pages()
@@ -0,0 +1,114 @@
+"""
+Cache de catalogos de filtros con ETag.
+
+Los catalogos (departamentos, clasificaciones, etc.) casi nunca cambian y se
+piden cada vez que se abre el panel de filtros. Se guardan en proceso por
+CATALOG_CACHE_TTL_SECONDS; al vencer se compara la version de datos (marca de
+agua de system.parts, la misma de los snapshots del dashboard) y solo se
+recargan si cambio. Cada entrada lleva un ETag derivado de su contenido para
+que los clientes revaliden con If-None-Match y reciban 304.
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Callable
+
+from fastapi import Request
+
+from api.utils import validar_env_var_number
+from api.v1.services.dashboard.snapshots import dashboard_snapshots
+from api.v1.services.query_engine.cache import TTLCache, query_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    payload: Any
+    etag: str
+    version: list | None
+    checked_at: float
+
+    @property
+    def headers(self) -> dict:
+        return {"ETag": self.etag, "Cache-Control": "private, no-cache"}
+
+
+class CatalogService:
+    def __init__(self, ttl: float, version_reader: Callable, max_entries: int = 256):
+        self.ttl = ttl
+        self.version_reader = version_reader
+        # Las entradas vencidas se conservan para revalidarlas contra la version de datos
+        self._cache = TTLCache(max_entries=max_entries, ttl=float("inf"))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidations = 0
+        self.loads = 0
+
+    def get(self, key: str, loader: Callable, client) -> CatalogEntry:
+        """Catalogo `key`; si vencio se recarga con `loader(client)` solo si cambiaron los datos."""
+        entry = self._cache.get(key)
+        if entry is not None and time.monotonic() - entry.checked_at <= self.ttl:
+            self.hits += 1
+            return entry
+
+        with self._lock:
+            entry = self._cache.get(key)
+            now = time.monotonic()
+            if entry is not None and now - entry.checked_at <= self.ttl:
+                self.hits += 1
+                return entry
+            try:
+                version = self.version_reader(client)
+            except Exception:
+                logger.warning("No se pudo leer la version de datos de catalogos", exc_info=True)
+                version = None
+            if entry is not None and version is not None and entry.version == version:
+                self.revalidations += 1
+                entry = replace(entry, checked_at=now)
+            else:
+                self.loads += 1
+                payload = loader(client)
+                entry = CatalogEntry(
+                    payload=payload,
+                    etag=f'W/"{query_fingerprint(payload)[:32]}"',
+                    version=version,
+                    checked_at=now,
+                )
+            self._cache.set(key, entry)
+            return entry
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self.hits = 0
+        self.revalidations = 0
+        self.loads = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": self._cache.stats()["entries"],
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "revalidations": self.revalidations,
+            "loads": self.loads,
+        }
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True si If-None-Match incluye `etag` (comparacion debil, admite '*')."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    opaque = etag.removeprefix("W/")
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+catalog_service = CatalogService(
+    ttl=validar_env_var_number("CATALOG_CACHE_TTL_SECONDS", 300),
+    version_reader=dashboard_snapshots.read_watermark,
+)
@@ -1,17 +1,28 @@
 """Queries a ClickHouse para consulta institucional (vw_beneficios_x_hogar)."""
 
+from api.v1.services.paginacion import keyset_condition
 from api.v1.services.query_engine.engine import build_where_from_columns, _safe_identifier
+from api.v1.services.rsh.codigos import code_equals, code_operand, fixed_string_widths
+
+# Orden natural de la lista (columnas devueltas por query_consulta_lista)
+CONSULTA_SORT_KEYS = ("ig3_codigo_departamento", "ig4_codigo_municipio", "hogar_id")
+CONSULTA_CURSOR_TYPES = (str, str, int)
 
 
 def build_consulta_filters(
     base_filter_columns: list[str],
     base_filter_logic: str,
     intervention_columns: list[str],
+    code_widths: dict[str, int] | None = None,
     **kwargs,
 ) -> tuple[str, dict]:
     """
     Construye clausula WHERE combinando base_filter institucional + filtros del usuario.
 
+    `code_widths` son los anchos FixedString de vw_beneficios_x_hogar; sin ellos los
+    codigos geograficos se comparan con trim(). Los codigos van calificados con el
+    alias `b` de la tabla (ver `query_consulta_lista`).
+
     Returns:
         (where_clause, parameters)
     """
@@ -22,13 +33,15 @@ def build_consulta_filters(
     if base_clause:
         conditions.append(base_clause)
 
-    if departamento := kwargs.get("departamento_codigo"):
-        conditions.append("trim(ig3_codigo_departamento) = {depto:String}")
-        params["depto"] = str(departamento).strip()
-
-    if municipio := kwargs.get("municipio_codigo"):
-        conditions.append("trim(ig4_codigo_municipio) = {muni:String}")
-        params["muni"] = str(municipio).strip()
+    code_widths = code_widths or {}
+    for column, name, value in (
+        ("ig3_codigo_departamento", "depto", kwargs.get("departamento_codigo")),
+        ("ig4_codigo_municipio", "muni", kwargs.get("municipio_codigo")),
+    ):
+        if value:
+            condition, condition_params = code_equals(column, name, value, code_widths, alias="b.")
+            conditions.append(condition)
+            params.update(condition_params)
 
     if buscar := kwargs.get("buscar"):
         conditions.append("toString(hogar_id) ILIKE {buscar:String}")
@@ -69,34 +82,58 @@ def query_consulta_lista(
     intervention_columns: list[str],
     offset: int = 0,
     limit: int = 100,
+    cursor: list | None = None,
     **filter_kwargs,
 ) -> tuple[list[dict], int]:
-    """Lista paginada de hogares con base_filter + filtros usuario."""
+    """Lista paginada de hogares con base_filter + filtros usuario.
+
+    La tabla va con alias `b`: el SELECT define `trim(...) as ig3_codigo_departamento`
+    (e ig4), y sin calificar ORDER BY y el keyset usarian esa expresion en lugar
+    de la columna cruda de la clave de orden.
+    Con `cursor` (valores de CONSULTA_SORT_KEYS de la ultima fila vista) la
+    pagina empieza despues de esa fila y se ignora `offset`.
+    """
+    code_widths = fixed_string_widths(client, "vw_beneficios_x_hogar")
     where_clause, params = build_consulta_filters(
-        base_filter_columns, base_filter_logic, intervention_columns, **filter_kwargs
+        base_filter_columns, base_filter_logic, intervention_columns,
+        code_widths=code_widths,
+        **filter_kwargs,
     )
 
     count_query = f"""
         SELECT count() as total
-        FROM rsh.vw_beneficios_x_hogar
+        FROM rsh.vw_beneficios_x_hogar AS b
         WHERE {where_clause}
     """
     count_result = client.query(count_query, parameters=params)
     total = count_result.result_rows[0][0] if count_result.result_rows else 0
 
-    params["offset"] = offset
+    # Keyset con cursor, OFFSET sin el
     params["limit"] = limit
+    page_where, page_clause = where_clause, "OFFSET {offset:Int32}"
+    if cursor is not None:
+        depto, muni, hogar_id = cursor
+        keyset, keyset_params = keyset_condition([
+            code_operand("ig3_codigo_departamento", "after_depto", depto, code_widths, alias="b."),
+            code_operand("ig4_codigo_municipio", "after_muni", muni, code_widths, alias="b."),
+            ("b.hogar_id", "{after_hogar:Int64}", {"after_hogar": hogar_id}),
+        ])
+        page_where = f"{where_clause} AND {keyset}" if where_clause else keyset
+        params.update(keyset_params)
+        page_clause = ""
+    else:
+        params["offset"] = offset
 
     select_cols = _build_select_columns(intervention_columns)
 
     data_query = f"""
         SELECT
             {select_cols}
-        FROM rsh.vw_beneficios_x_hogar
-        WHERE {where_clause}
-        ORDER BY ig3_codigo_departamento, ig4_codigo_municipio, hogar_id
+        FROM rsh.vw_beneficios_x_hogar AS b
+        WHERE {page_where}
+        ORDER BY b.ig3_codigo_departamento, b.ig4_codigo_municipio, b.hogar_id
         LIMIT {{limit:Int32}}
-        OFFSET {{offset:Int32}}
+        {page_clause}
     """
 
     data_result = client.query(data_query, parameters=params)
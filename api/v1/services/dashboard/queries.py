@@ -4,6 +4,8 @@ from sqlalchemy import func as sa_func
 from api.v1.models.user import User
 from api.v1.models.institution import Institution
 from api.v1.models.data_source import DataSource, SavedQuery
+from api.v1.config.ch_fanout import query_many
+from api.v1.services.rsh.codigos import code_equals, fixed_string_widths
 
 
 # ── PostgreSQL queries ───────────────────────────────────────────────
@@ -79,142 +81,216 @@ def query_institutional_pg_stats(db: Session, institution_id) -> dict:
     return {"total_consultas": total_queries, "total_fuentes_datos": total_ds}
 
 
+def institution_base_filters(db: Session, institution: Institution | None) -> tuple[list[str], str, list[str]] | None:
+    """base_filter_columns, logica e intervention_columns del datasource activo de la institucion."""
+    if institution is None:
+        return None
+    ds = (
+        db.query(DataSource)
+        .filter(
+            DataSource.institution_id == institution.id,
+            DataSource.is_active == True,
+        )
+        .first()
+    )
+    if not ds or not ds.base_filter_columns:
+        return None
+    # Buscar intervention_columns del preset institucional
+    from api.v1.config.institutional_presets import INSTITUTIONAL_PRESETS
+    preset = INSTITUTIONAL_PRESETS.get(institution.code, {})
+    intervention_cols = preset.get("intervention_columns", [])
+    return ds.base_filter_columns, ds.base_filter_logic or "OR", intervention_cols
+
+
 # ── ClickHouse queries ───────────────────────────────────────────────
 
-def query_rsh_global_stats(client) -> dict:
-    """Estadisticas globales RSH desde ClickHouse."""
-    # Stats generales
-    r = client.query("""
-        SELECT
-            count() as total_hogares,
-            uniq(departamento_codigo) as deptos,
-            uniq(municipio_codigo) as munis,
-            uniq(lugarpoblado_codigo) as lugares,
-            round(avg(ipm_gt), 4) as ipm_avg,
-            round(avg(pmt), 4) as pmt_avg,
-            round(avg(nbi), 4) as nbi_avg,
-            sum(hombres) as total_hombres,
-            sum(mujeres) as total_mujeres
-        FROM rsh.vw_pobreza_hogars
-    """)
-    stats = dict(zip(r.column_names, r.result_rows[0]))
-
-    # Total personas distintas por CUI
-    r_personas = client.query("""
-        SELECT count(DISTINCT pd4_numero_documento_identificacion) as total_personas
-        FROM rsh.vw_beneficios_x_persona
-    """)
-    stats["total_personas"] = r_personas.result_rows[0][0]
-
-    # Municipios finalizados vs en progreso
-    r2 = client.query("""
-        SELECT
-            countIf(ultimo_estado = 'Finalizado') as finalizados,
-            countIf(ultimo_estado = 'En Proceso') as en_progreso
-        FROM (
-            SELECT
-                municipio_codigo,
-                argMax(fase_estado, fecha) as ultimo_estado
-            FROM rsh.vw_pobreza_hogars
-            WHERE fase_estado != ''
-            GROUP BY municipio_codigo
+def _rows(result) -> list[dict]:
+    return [dict(zip(result.column_names, row)) for row in result.result_rows]
+
+
+def _first_row(result) -> dict:
+    return dict(zip(result.column_names, result.result_rows[0]))
+
+
+# (clave de la clasificacion en la pasada GROUPING SETS, clave de stats por departamento)
+_POBREZA_FIELDS = [
+    ("ipm", "ipm_por_departamento"),
+    ("pmt", "pmt_por_departamento"),
+    ("nbi", "nbi_por_departamento"),
+]
+
+_GENERAL_COLUMNS = (
+    "deptos", "munis", "lugares", "ipm_avg", "pmt_avg", "nbi_avg", "total_hombres", "total_mujeres",
+)
+
+
+def _demux_grouping_sets(result, stats: dict, extra_columns: list[str] | None = None) -> None:
+    """Reparte las filas de la pasada GROUPING SETS en las claves de `stats`.
+
+    Con group_by_use_nulls las claves que no forman parte del grouping set vienen NULL,
+    lo que identifica a que set pertenece cada fila. `cantidad` es el conteo en el
+    alcance de la consulta y `cantidad_total` el conteo por departamento sin filtro de
+    departamento (igual a `cantidad` en el dashboard global).
+    """
+    extra_columns = extra_columns or []
+    stats.update({"total_hogares": 0, **{col: 0 for col in _GENERAL_COLUMNS}})
+    stats.update({"por_ipm": [], "por_nbi": [], "por_pmt": [], "por_departamento": []})
+    for _, key in _POBREZA_FIELDS:
+        stats[key] = []
+    bonos_por_departamento = []
+
+    for row in _rows(result):
+        departamento, codigo = row["departamento"], row["codigo"]
+        clasificaciones = {field: row[field] for field, _ in _POBREZA_FIELDS}
+        grouped = [field for field, value in clasificaciones.items() if value is not None]
+
+        if departamento is None and not grouped:
+            stats["total_hogares"] = row["cantidad"]
+            stats.update({col: row[col] for col in _GENERAL_COLUMNS})
+            if extra_columns:
+                stats["bonos"] = {col: row[col] for col in extra_columns}
+            continue
+
+        if departamento is None:
+            field = grouped[0]
+            value = clasificaciones[field]
+            if value == "" or not row["cantidad"]:
+                continue
+            if field == "ipm":
+                stats["por_ipm"].append({"ipm_gt_clasificacion": value, "cantidad": row["cantidad"]})
+            else:
+                stats[f"por_{field}"].append({"clasificacion": value, "cantidad": row["cantidad"]})
+            continue
+
+        if not grouped:
+            if row["cantidad_total"]:
+                stats["por_departamento"].append(
+                    {"departamento": departamento, "codigo": codigo, "cantidad": row["cantidad_total"]}
+                )
+            if extra_columns and row["cantidad"]:
+                bonos_por_departamento.append(
+                    {"departamento": departamento, "codigo": codigo, **{col: row[col] for col in extra_columns}}
+                )
+            continue
+
+        field = grouped[0]
+        value = clasificaciones[field]
+        if value == "" or not row["cantidad"]:
+            continue
+        stats[f"{field}_por_departamento"].append(
+            {"departamento": departamento, "codigo": codigo, "clasificacion": value, "cantidad": row["cantidad"]}
         )
-    """)
-    muni_stats = dict(zip(r2.column_names, r2.result_rows[0]))
-    stats["municipios_finalizados"] = muni_stats.get("finalizados", 0)
-    stats["municipios_en_progreso"] = muni_stats.get("en_progreso", 0)
 
-    # Distribucion IPM
-    r3 = client.query("""
-        SELECT ipm_gt_clasificacion, count() as cantidad
-        FROM rsh.vw_pobreza_hogars
-        WHERE ipm_gt_clasificacion != ''
-        GROUP BY ipm_gt_clasificacion
-        ORDER BY cantidad DESC
-    """)
-    stats["por_ipm"] = [dict(zip(r3.column_names, row)) for row in r3.result_rows]
-
-    # Distribucion NBI
-    r3b = client.query("""
-        SELECT nbi_clasificacion as clasificacion, count() as cantidad
-        FROM rsh.vw_pobreza_hogars
-        WHERE nbi_clasificacion != ''
-        GROUP BY nbi_clasificacion
-        ORDER BY cantidad DESC
-    """)
-    stats["por_nbi"] = [dict(zip(r3b.column_names, row)) for row in r3b.result_rows]
-
-    # Distribucion PMT
-    r3c = client.query("""
-        SELECT pmt_clasificacion as clasificacion, count() as cantidad
-        FROM rsh.vw_pobreza_hogars
-        WHERE pmt_clasificacion != ''
-        GROUP BY pmt_clasificacion
-        ORDER BY cantidad DESC
-    """)
-    stats["por_pmt"] = [dict(zip(r3c.column_names, row)) for row in r3c.result_rows]
-
-    # Pobreza por departamento (IPM / PMT / NBI) — una query por indice
-    for field, key in [
-        ("ipm_gt_clasificacion", "ipm_por_departamento"),
-        ("pmt_clasificacion", "pmt_por_departamento"),
-        ("nbi_clasificacion", "nbi_por_departamento"),
-    ]:
-        rp = client.query(f"""
+    for key in ("por_ipm", "por_nbi", "por_pmt", "por_departamento"):
+        stats[key].sort(key=lambda r: r["cantidad"], reverse=True)
+    for _, key in _POBREZA_FIELDS:
+        stats[key].sort(key=lambda r: (r["departamento"], -r["cantidad"]))
+    if extra_columns:
+        bonos_por_departamento.sort(key=lambda r: r["total_intervenciones"], reverse=True)
+        stats["bonos_por_departamento"] = bonos_por_departamento
+
+
+def query_rsh_global_stats(client) -> dict:
+    """Estadisticas globales RSH desde ClickHouse.
+
+    Totales, distribuciones IPM/NBI/PMT, conteo por departamento y cruces por departamento
+    salen de una sola lectura de vw_pobreza_hogars con GROUPING SETS. Las consultas con
+    JOIN a otras vistas son independientes y se envian en paralelo con `query_many`.
+    """
+    queries = {
+        "pobreza": ("""
             SELECT
                 departamento,
                 trim(departamento_codigo) as codigo,
-                {field} as clasificacion,
-                count() as cantidad
+                ipm_gt_clasificacion as ipm,
+                nbi_clasificacion as nbi,
+                pmt_clasificacion as pmt,
+                count() as cantidad,
+                count() as cantidad_total,
+                uniq(departamento_codigo) as deptos,
+                uniq(municipio_codigo) as munis,
+                uniq(lugarpoblado_codigo) as lugares,
+                round(avg(ipm_gt), 4) as ipm_avg,
+                round(avg(pmt), 4) as pmt_avg,
+                round(avg(nbi), 4) as nbi_avg,
+                sum(hombres) as total_hombres,
+                sum(mujeres) as total_mujeres
             FROM rsh.vw_pobreza_hogars
-            WHERE {field} != ''
-            GROUP BY departamento, departamento_codigo, {field}
-            ORDER BY departamento, cantidad DESC
-        """)
-        stats[key] = [dict(zip(rp.column_names, row)) for row in rp.result_rows]
-
-    # Por departamento
-    r4 = client.query("""
-        SELECT
-            departamento,
-            trim(departamento_codigo) as codigo,
-            count() as cantidad
-        FROM rsh.vw_pobreza_hogars
-        GROUP BY departamento, departamento_codigo
-        ORDER BY cantidad DESC
-    """)
-    stats["por_departamento"] = [dict(zip(r4.column_names, row)) for row in r4.result_rows]
-
-    # Inseguridad alimentaria
-    r5 = client.query("""
-        SELECT
-            nivel_inseguridad_alimentaria as nivel,
-            count() as cantidad
-        FROM rsh.vw_elcsa_hogar
-        WHERE nivel_inseguridad_alimentaria != ''
-        GROUP BY nivel_inseguridad_alimentaria
-        ORDER BY cantidad DESC
-    """)
-    stats["inseguridad"] = [dict(zip(r5.column_names, row)) for row in r5.result_rows]
-
-    # Potenciales beneficiarios por institucion (distinct personas por CUI)
-    r6 = client.query("""
-        SELECT
-            uniqIf(p.pd4_numero_documento_identificacion, h.prog_fodes = 1) as FODES,
-            uniqIf(p.pd4_numero_documento_identificacion, h.prog_maga = 1) as MAGA,
-            uniqIf(p.pd4_numero_documento_identificacion,
-                   h.prog_bono_social = 1 OR h.prog_bolsa_social = 1 OR h.prog_bono_unico = 1) as MIDES
-        FROM rsh.vw_beneficios_x_persona AS p
-        INNER JOIN rsh.vw_beneficios_x_hogar AS h ON p.hogar_id = h.hogar_id
-    """)
-    benef_row = dict(zip(r6.column_names, r6.result_rows[0]))
-    stats["beneficiarios_por_institucion"] = benef_row
+            GROUP BY GROUPING SETS (
+                (),
+                (ipm_gt_clasificacion),
+                (nbi_clasificacion),
+                (pmt_clasificacion),
+                (departamento, departamento_codigo),
+                (departamento, departamento_codigo, ipm_gt_clasificacion),
+                (departamento, departamento_codigo, pmt_clasificacion),
+                (departamento, departamento_codigo, nbi_clasificacion)
+            )
+            SETTINGS group_by_use_nulls = 1
+        """, None),
+        # Total personas distintas por CUI
+        "personas": ("""
+            SELECT count(DISTINCT pd4_numero_documento_identificacion) as total_personas
+            FROM rsh.vw_beneficios_x_persona
+        """, None),
+        # Municipios finalizados vs en progreso
+        "municipios": ("""
+            SELECT
+                countIf(ultimo_estado = 'Finalizado') as finalizados,
+                countIf(ultimo_estado = 'En Proceso') as en_progreso
+            FROM (
+                SELECT
+                    municipio_codigo,
+                    argMax(fase_estado, fecha) as ultimo_estado
+                FROM rsh.vw_pobreza_hogars
+                WHERE fase_estado != ''
+                GROUP BY municipio_codigo
+            )
+        """, None),
+        # Inseguridad alimentaria
+        "inseguridad": ("""
+            SELECT
+                nivel_inseguridad_alimentaria as nivel,
+                count() as cantidad
+            FROM rsh.vw_elcsa_hogar
+            WHERE nivel_inseguridad_alimentaria != ''
+            GROUP BY nivel_inseguridad_alimentaria
+            ORDER BY cantidad DESC
+        """, None),
+        # Potenciales beneficiarios por institucion (distinct personas por CUI)
+        "beneficiarios_por_institucion": ("""
+            SELECT
+                uniqIf(p.pd4_numero_documento_identificacion, h.prog_fodes = 1) as FODES,
+                uniqIf(p.pd4_numero_documento_identificacion, h.prog_maga = 1) as MAGA,
+                uniqIf(p.pd4_numero_documento_identificacion,
+                       h.prog_bono_social = 1 OR h.prog_bolsa_social = 1 OR h.prog_bono_unico = 1) as MIDES
+            FROM rsh.vw_beneficios_x_persona AS p
+            INNER JOIN rsh.vw_beneficios_x_hogar AS h ON p.hogar_id = h.hogar_id
+        """, None),
+    }
+
+    results = query_many(client, queries)
+
+    stats = {}
+    _demux_grouping_sets(results["pobreza"], stats)
+    stats["total_personas"] = results["personas"].result_rows[0][0]
+    muni_stats = _first_row(results["municipios"])
+    stats["municipios_finalizados"] = muni_stats.get("finalizados", 0)
+    stats["municipios_en_progreso"] = muni_stats.get("en_progreso", 0)
+    stats["inseguridad"] = _rows(results["inseguridad"])
+    stats["beneficiarios_por_institucion"] = _first_row(results["beneficiarios_por_institucion"])
 
     return stats
 
 
 def query_rsh_institutional_stats(client, base_filter_columns: list[str], base_filter_logic: str = "OR", intervention_columns: list[str] | None = None, departamento_codigo: str | None = None) -> dict:
-    """Estadisticas RSH scoped a una institucion via base_filter_columns."""
+    """Estadisticas RSH scoped a una institucion via base_filter_columns.
+
+    Totales, distribuciones, cruces por departamento y bonos salen de una sola lectura de
+    vw_beneficios_x_hogar con GROUPING SETS. El filtro de departamento se aplica con
+    combinadores -If para que el conteo por departamento siga cubriendo todos. Las
+    consultas con JOIN se envian en paralelo con `query_many`.
+    """
     if not base_filter_columns:
         return {}
 
@@ -226,153 +302,96 @@ def query_rsh_institutional_stats(client, base_filter_columns: list[str], base_f
     # Filtro opcional por departamento
     depto_filter = ""
     depto_params = {}
+    in_depto = "1"
     if departamento_codigo:
-        depto_filter = " AND trim(ig3_codigo_departamento) = {depto:String}"
-        depto_params = {"depto": departamento_codigo}
-
-    # Stats generales scoped
-    r = client.query(f"""
-        SELECT
-            count() as total_hogares,
-            uniq(ig3_codigo_departamento) as deptos,
-            uniq(ig4_codigo_municipio) as munis,
-            uniq(ig6_codigo_del_lugar_poblado) as lugares,
-            round(avg(ipm_gt), 4) as ipm_avg,
-            round(avg(pmt), 4) as pmt_avg,
-            round(avg(nbi), 4) as nbi_avg,
-            sum(hombres) as total_hombres,
-            sum(mujeres) as total_mujeres
-        FROM rsh.vw_beneficios_x_hogar
-        WHERE {where}{depto_filter}
-    """, parameters=depto_params)
-    stats = dict(zip(r.column_names, r.result_rows[0]))
-
-    # Total personas distintas por CUI
-    r_personas = client.query(f"""
-        SELECT count(DISTINCT p.pd4_numero_documento_identificacion) as total_personas
-        FROM rsh.vw_beneficios_x_persona AS p
-        INNER JOIN rsh.vw_beneficios_x_hogar AS h ON p.hogar_id = h.hogar_id
-        WHERE {where}{depto_filter}
-    """, parameters=depto_params)
-    stats["total_personas"] = r_personas.result_rows[0][0]
-
-    # Municipios estado - join con pobreza_hogars para fase_estado
-    r2 = client.query(f"""
-        SELECT
-            countIf(ultimo_estado = 'Finalizado') as finalizados,
-            countIf(ultimo_estado = 'En Proceso') as en_progreso
-        FROM (
-            SELECT
-                b.ig4_codigo_municipio as municipio_codigo,
-                argMax(p.fase_estado, p.fecha) as ultimo_estado
-            FROM rsh.vw_beneficios_x_hogar AS b
-            INNER JOIN rsh.vw_pobreza_hogars AS p ON b.hogar_id = p.hogar_id
-            WHERE ({where}){depto_filter} AND p.fase_estado != ''
-            GROUP BY municipio_codigo
+        in_depto, depto_params = code_equals(
+            "ig3_codigo_departamento", "depto", departamento_codigo,
+            fixed_string_widths(client, "vw_beneficios_x_hogar"),
         )
-    """, parameters=depto_params)
-    muni_stats = dict(zip(r2.column_names, r2.result_rows[0]))
-    stats["municipios_finalizados"] = muni_stats.get("finalizados", 0)
-    stats["municipios_en_progreso"] = muni_stats.get("en_progreso", 0)
-
-    # IPM clasificacion
-    r3 = client.query(f"""
-        SELECT ipm_gt_clasificacion, count() as cantidad
-        FROM rsh.vw_beneficios_x_hogar
-        WHERE ({where}){depto_filter} AND ipm_gt_clasificacion != ''
-        GROUP BY ipm_gt_clasificacion
-        ORDER BY cantidad DESC
-    """, parameters=depto_params)
-    stats["por_ipm"] = [dict(zip(r3.column_names, row)) for row in r3.result_rows]
-
-    # NBI clasificacion
-    r3b = client.query(f"""
-        SELECT nbi_clasificacion as clasificacion, count() as cantidad
-        FROM rsh.vw_beneficios_x_hogar
-        WHERE ({where}){depto_filter} AND nbi_clasificacion != ''
-        GROUP BY nbi_clasificacion
-        ORDER BY cantidad DESC
-    """, parameters=depto_params)
-    stats["por_nbi"] = [dict(zip(r3b.column_names, row)) for row in r3b.result_rows]
-
-    # PMT clasificacion
-    r3c = client.query(f"""
-        SELECT pmt_clasificacion as clasificacion, count() as cantidad
-        FROM rsh.vw_beneficios_x_hogar
-        WHERE ({where}){depto_filter} AND pmt_clasificacion != ''
-        GROUP BY pmt_clasificacion
-        ORDER BY cantidad DESC
-    """, parameters=depto_params)
-    stats["por_pmt"] = [dict(zip(r3c.column_names, row)) for row in r3c.result_rows]
-
-    # Pobreza por departamento (IPM / PMT / NBI) scoped
-    for field, key in [
-        ("ipm_gt_clasificacion", "ipm_por_departamento"),
-        ("pmt_clasificacion", "pmt_por_departamento"),
-        ("nbi_clasificacion", "nbi_por_departamento"),
-    ]:
-        rp = client.query(f"""
-            SELECT
-                ig3_departamento as departamento,
-                trim(ig3_codigo_departamento) as codigo,
-                {field} as clasificacion,
-                count() as cantidad
-            FROM rsh.vw_beneficios_x_hogar
-            WHERE ({where}){depto_filter} AND {field} != ''
-            GROUP BY ig3_departamento, ig3_codigo_departamento, {field}
-            ORDER BY departamento, cantidad DESC
-        """, parameters=depto_params)
-        stats[key] = [dict(zip(rp.column_names, row)) for row in rp.result_rows]
-
-    # Por departamento (siempre sin filtro de depto para que el front tenga la lista completa)
-    r4 = client.query(f"""
-        SELECT
-            ig3_departamento as departamento,
-            trim(ig3_codigo_departamento) as codigo,
-            count() as cantidad
-        FROM rsh.vw_beneficios_x_hogar
-        WHERE {where}
-        GROUP BY ig3_departamento, ig3_codigo_departamento
-        ORDER BY cantidad DESC
-    """)
-    stats["por_departamento"] = [dict(zip(r4.column_names, row)) for row in r4.result_rows]
-
-    # Inseguridad alimentaria scoped
-    r5 = client.query(f"""
-        SELECT
-            i.nivel_inseguridad_alimentaria as nivel,
-            count() as cantidad
-        FROM rsh.vw_beneficios_x_hogar AS b
-        INNER JOIN rsh.vw_elcsa_hogar AS i ON b.hogar_id = i.hogar_id
-        WHERE ({where}){depto_filter} AND i.nivel_inseguridad_alimentaria != ''
-        GROUP BY nivel
-        ORDER BY cantidad DESC
-    """, parameters=depto_params)
-    stats["inseguridad"] = [dict(zip(r5.column_names, row)) for row in r5.result_rows]
+        depto_filter = f" AND {in_depto}"
 
     # Bonos e intervenciones scoped (solo columnas de la institucion)
+    bono_columns = []
+    bono_sums = ""
     if intervention_columns:
-        sums = ", ".join(f"sum({col}) as {col}" for col in intervention_columns)
-        # Totales (con filtro de depto si aplica)
-        r6 = client.query(f"""
-            SELECT {sums}, sum(total_intervenciones) as total_intervenciones
-            FROM rsh.vw_beneficios_x_hogar
-            WHERE {where}{depto_filter}
-        """, parameters=depto_params)
-        stats["bonos"] = dict(zip(r6.column_names, r6.result_rows[0]))
+        bono_columns = [*intervention_columns, "total_intervenciones"]
+        bono_sums = "".join(f",\n                sumIf({col}, {in_depto}) as {col}" for col in bono_columns)
 
-        # Bonos por departamento (con filtro de depto si aplica)
-        r7 = client.query(f"""
+    queries = {
+        "pobreza": (f"""
             SELECT
                 ig3_departamento as departamento,
                 trim(ig3_codigo_departamento) as codigo,
-                {sums},
-                sum(total_intervenciones) as total_intervenciones
+                ipm_gt_clasificacion as ipm,
+                nbi_clasificacion as nbi,
+                pmt_clasificacion as pmt,
+                countIf({in_depto}) as cantidad,
+                count() as cantidad_total,
+                uniqIf(ig3_codigo_departamento, {in_depto}) as deptos,
+                uniqIf(ig4_codigo_municipio, {in_depto}) as munis,
+                uniqIf(ig6_codigo_del_lugar_poblado, {in_depto}) as lugares,
+                round(avgIf(ipm_gt, {in_depto}), 4) as ipm_avg,
+                round(avgIf(pmt, {in_depto}), 4) as pmt_avg,
+                round(avgIf(nbi, {in_depto}), 4) as nbi_avg,
+                sumIf(hombres, {in_depto}) as total_hombres,
+                sumIf(mujeres, {in_depto}) as total_mujeres{bono_sums}
             FROM rsh.vw_beneficios_x_hogar
+            WHERE {where}
+            GROUP BY GROUPING SETS (
+                (),
+                (ipm_gt_clasificacion),
+                (nbi_clasificacion),
+                (pmt_clasificacion),
+                (ig3_departamento, ig3_codigo_departamento),
+                (ig3_departamento, ig3_codigo_departamento, ipm_gt_clasificacion),
+                (ig3_departamento, ig3_codigo_departamento, pmt_clasificacion),
+                (ig3_departamento, ig3_codigo_departamento, nbi_clasificacion)
+            )
+            SETTINGS group_by_use_nulls = 1
+        """, depto_params),
+        # Total personas distintas por CUI
+        "personas": (f"""
+            SELECT count(DISTINCT p.pd4_numero_documento_identificacion) as total_personas
+            FROM rsh.vw_beneficios_x_persona AS p
+            INNER JOIN rsh.vw_beneficios_x_hogar AS h ON p.hogar_id = h.hogar_id
             WHERE {where}{depto_filter}
-            GROUP BY ig3_departamento, ig3_codigo_departamento
-            ORDER BY total_intervenciones DESC
-        """, parameters=depto_params)
-        stats["bonos_por_departamento"] = [dict(zip(r7.column_names, row)) for row in r7.result_rows]
+        """, depto_params),
+        # Municipios estado - join con pobreza_hogars para fase_estado
+        "municipios": (f"""
+            SELECT
+                countIf(ultimo_estado = 'Finalizado') as finalizados,
+                countIf(ultimo_estado = 'En Proceso') as en_progreso
+            FROM (
+                SELECT
+                    b.ig4_codigo_municipio as municipio_codigo,
+                    argMax(p.fase_estado, p.fecha) as ultimo_estado
+                FROM rsh.vw_beneficios_x_hogar AS b
+                INNER JOIN rsh.vw_pobreza_hogars AS p ON b.hogar_id = p.hogar_id
+                WHERE ({where}){depto_filter} AND p.fase_estado != ''
+                GROUP BY municipio_codigo
+            )
+        """, depto_params),
+        # Inseguridad alimentaria scoped
+        "inseguridad": (f"""
+            SELECT
+                i.nivel_inseguridad_alimentaria as nivel,
+                count() as cantidad
+            FROM rsh.vw_beneficios_x_hogar AS b
+            INNER JOIN rsh.vw_elcsa_hogar AS i ON b.hogar_id = i.hogar_id
+            WHERE ({where}){depto_filter} AND i.nivel_inseguridad_alimentaria != ''
+            GROUP BY nivel
+            ORDER BY cantidad DESC
+        """, depto_params),
+    }
+
+    results = query_many(client, queries)
+
+    stats = {}
+    _demux_grouping_sets(results["pobreza"], stats, bono_columns)
+    stats["total_personas"] = results["personas"].result_rows[0][0]
+    muni_stats = _first_row(results["municipios"])
+    stats["municipios_finalizados"] = muni_stats.get("finalizados", 0)
+    stats["municipios_en_progreso"] = muni_stats.get("en_progreso", 0)
+    stats["inseguridad"] = _rows(results["inseguridad"])
 
     return stats
@@ -0,0 +1,317 @@
+"""
+Snapshots materializados del dashboard.
+
+Los agregados RSH del dashboard (global del admin y por institucion, con y sin
+filtro de departamento) solo cambian cuando se cargan datos de encuestas. En
+lugar de recalcularlos en cada request se guardan en memoria (y en disco, para
+sobrevivir reinicios y compartirse entre workers) con su `generated_at`.
+
+Un hilo de fondo revisa cada DASHBOARD_SNAPSHOT_REFRESH_SECONDS una marca de
+agua barata (partes activas de la base RSH en system.parts) y recalcula todos
+los snapshots registrados si la marca cambio o si superaron
+DASHBOARD_SNAPSHOT_MAX_AGE_SECONDS. El primer request de una clave sin snapshot
+lo calcula en linea y la registra para el refresco; las claves por departamento
+solo se guardan si el snapshot general de la institucion las registro.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable
+
+from api.utils import validar_env_var_bool, validar_env_var_number, validar_env_var_string
+from api.v1.services.dashboard.queries import (
+    institution_base_filters,
+    query_rsh_global_stats,
+    query_rsh_institutional_stats,
+)
+from api.v1.services.query_engine.cache import query_fingerprint
+
+logger = logging.getLogger(__name__)
+
+_WATERMARK_SQL = (
+    "SELECT toString(max(modification_time)), sum(rows), count() "
+    "FROM system.parts WHERE active AND database = {db:String}"
+)
+
+GLOBAL_KEY = "global"
+
+
+@dataclass(frozen=True)
+class DashboardSnapshot:
+    payload: dict
+    generated_at: datetime
+    watermark: list | None = None
+
+
+def institutional_key(
+    base_filter_columns: list[str],
+    base_filter_logic: str,
+    intervention_columns: list[str] | None,
+    departamento_codigo: str | None = None,
+) -> str:
+    return "inst:" + query_fingerprint(
+        list(base_filter_columns), base_filter_logic, list(intervention_columns or []), departamento_codigo,
+    )
+
+
+def institutional_builder(
+    base_filter_columns: list[str],
+    base_filter_logic: str,
+    intervention_columns: list[str] | None,
+    departamento_codigo: str | None = None,
+) -> Callable:
+    """Builder del snapshot institucional; el general registra ademas uno por departamento."""
+    def build(client) -> dict:
+        stats = query_rsh_institutional_stats(
+            client, base_filter_columns, base_filter_logic,
+            intervention_columns=intervention_columns,
+            departamento_codigo=departamento_codigo,
+        )
+        if departamento_codigo is None and PRECOMPUTE_DEPARTAMENTOS:
+            for depto in stats.get("por_departamento", []):
+                dashboard_snapshots.register(
+                    institutional_key(base_filter_columns, base_filter_logic, intervention_columns, depto["codigo"]),
+                    institutional_builder(base_filter_columns, base_filter_logic, intervention_columns, depto["codigo"]),
+                )
+        return stats
+    return build
+
+
+class DashboardSnapshotStore:
+    def __init__(self, snapshot_dir: str | None, refresh_interval: int, max_age: int, database: str):
+        self.snapshot_dir = snapshot_dir
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.database = database
+        self._snapshots: dict[str, DashboardSnapshot] = {}
+        self._builders: dict[str, Callable] = {}
+        self._lock = threading.Lock()
+        self._key_locks: dict[str, threading.Lock] = {}
+        self._watermark: list | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.last_refresh_at: datetime | None = None
+
+    # ── Lectura ──────────────────────────────────────────────────────
+
+    def get(self, key: str, builder: Callable, client, register: bool = True) -> DashboardSnapshot:
+        """Snapshot de `key`; si no existe se calcula con `builder(client)` y queda registrado.
+
+        Con `register=False` una clave que no este registrada se calcula al vuelo,
+        sin guardarla ni registrarla para el refresco (claves que vienen del request).
+        """
+        with self._lock:
+            registered = key in self._builders
+            if register and not registered:
+                self._builders[key] = builder
+                registered = True
+            snapshot = self._snapshots.get(key)
+        if not registered:
+            self.misses += 1
+            return DashboardSnapshot(payload=builder(client), generated_at=datetime.now(timezone.utc))
+        if snapshot is None:
+            snapshot = self._load(key)
+        if snapshot is not None:
+            self.hits += 1
+            return snapshot
+
+        # Un solo calculo por clave aunque lleguen varios requests a la vez
+        with self._key_lock(key):
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None:
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+            watermark = self._watermark
+            if watermark is None:
+                try:
+                    watermark = self.read_watermark(client)
+                except Exception:
+                    logger.warning("No se pudo leer la marca de agua del dashboard", exc_info=True)
+            return self._build(key, builder, client, watermark)
+
+    def register(self, key: str, builder: Callable) -> None:
+        """Registra una clave para que el refresco de fondo la precalcule."""
+        with self._lock:
+            self._builders.setdefault(key, builder)
+
+    # ── Refresco ─────────────────────────────────────────────────────
+
+    def read_watermark(self, client) -> list | None:
+        result = client.query(_WATERMARK_SQL, parameters={"db": self.database})
+        if not result.result_rows:
+            return None
+        return [str(v) for v in result.result_rows[0]]
+
+    def refresh(self, client, force: bool = False) -> int:
+        """Recalcula los snapshots desactualizados. Devuelve cuantos se recalcularon."""
+        watermark = self.read_watermark(client)
+        changed = watermark != self._watermark
+        self._watermark = watermark
+        now = datetime.now(timezone.utc)
+
+        refreshed = 0
+        # El callback de un builder puede registrar mas claves (p.ej. por departamento)
+        done: set[str] = set()
+        while True:
+            with self._lock:
+                pending = [(k, b) for k, b in self._builders.items() if k not in done]
+            if not pending:
+                break
+            for key, builder in pending:
+                done.add(key)
+                snapshot = self._snapshots.get(key) or self._load(key)
+                stale = (
+                    force
+                    or snapshot is None
+                    or snapshot.watermark != watermark
+                    or (self.max_age and (now - snapshot.generated_at).total_seconds() > self.max_age)
+                )
+                if not stale:
+                    continue
+                try:
+                    with self._key_lock(key):
+                        self._build(key, builder, client, watermark)
+                    refreshed += 1
+                except Exception:
+                    self.refresh_errors += 1
+                    logger.exception("No se pudo refrescar el snapshot de dashboard %s", key)
+
+        if changed or refreshed:
+            logger.info("Snapshots de dashboard: %d recalculados (marca de agua %s)", refreshed, watermark)
+        self.refreshes += 1
+        self.last_refresh_at = now
+        return refreshed
+
+    def start(self, client_session) -> None:
+        """Inicia el hilo de refresco; `client_session` es un context manager que entrega un cliente."""
+        if not self.refresh_interval or self._thread is not None:
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    with client_session() as client:
+                        self.refresh(client)
+                except Exception:
+                    self.refresh_errors += 1
+                    logger.exception("Error en el refresco de snapshots de dashboard")
+                self._stop.wait(self.refresh_interval)
+
+        self._thread = threading.Thread(target=loop, name="dashboard-snapshots", daemon=True)
+        self._thread.start()
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def clear(self) -> None:
+        """Descarta snapshots (memoria y disco) y claves registradas."""
+        with self._lock:
+            self._snapshots.clear()
+            self._builders.clear()
+            self._watermark = None
+            if self.snapshot_dir and os.path.isdir(self.snapshot_dir):
+                for name in os.listdir(self.snapshot_dir):
+                    if name.endswith(".json"):
+                        os.remove(os.path.join(self.snapshot_dir, name))
+
+    def stats(self) -> dict:
+        return {
+            "snapshots": len(self._snapshots),
+            "registered": len(self._builders),
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "last_refresh_at": self.last_refresh_at.isoformat() if self.last_refresh_at else None,
+            "watermark": self._watermark,
+        }
+
+    # ── Internos ─────────────────────────────────────────────────────
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _build(self, key: str, builder: Callable, client, watermark) -> DashboardSnapshot:
+        snapshot = DashboardSnapshot(
+            payload=builder(client),
+            generated_at=datetime.now(timezone.utc),
+            watermark=watermark,
+        )
+        with self._lock:
+            self._snapshots[key] = snapshot
+        self._save(key, snapshot)
+        return snapshot
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.snapshot_dir, f"{key.replace(':', '_')}.json")
+
+    def _save(self, key: str, snapshot: DashboardSnapshot) -> None:
+        if not self.snapshot_dir:
+            return
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            tmp = self._path(key) + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({
+                    "payload": snapshot.payload,
+                    "generated_at": snapshot.generated_at.isoformat(),
+                    "watermark": snapshot.watermark,
+                }, f, default=str)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            logger.warning("No se pudo guardar el snapshot %s en disco", key, exc_info=True)
+
+    def _load(self, key: str) -> DashboardSnapshot | None:
+        if not self.snapshot_dir or not os.path.exists(self._path(key)):
+            return None
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                data = json.load(f)
+            snapshot = DashboardSnapshot(
+                payload=data["payload"],
+                generated_at=datetime.fromisoformat(data["generated_at"]),
+                watermark=data.get("watermark"),
+            )
+        except (OSError, ValueError, KeyError):
+            logger.warning("Snapshot %s en disco invalido; se ignora", key, exc_info=True)
+            return None
+        with self._lock:
+            self._snapshots.setdefault(key, snapshot)
+        return snapshot
+
+
+PRECOMPUTE_DEPARTAMENTOS = validar_env_var_bool(
+    validar_env_var_string("DASHBOARD_SNAPSHOT_PRECOMPUTE_DEPTOS"), True,
+)
+
+dashboard_snapshots = DashboardSnapshotStore(
+    snapshot_dir=validar_env_var_string(
+        "DASHBOARD_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "ventana_dashboard"),
+    ),
+    refresh_interval=validar_env_var_number("DASHBOARD_SNAPSHOT_REFRESH_SECONDS", 60),
+    max_age=validar_env_var_number("DASHBOARD_SNAPSHOT_MAX_AGE_SECONDS", 6 * 3600),
+    database=validar_env_var_string("DASHBOARD_SNAPSHOT_WATERMARK_DB", "rsh"),
+)
+
+
+def prime_dashboard_snapshots(db) -> None:
+    """Registra el snapshot global y el de cada institucion activa para precalcularlos."""
+    from api.v1.models.institution import Institution
+
+    dashboard_snapshots.register(GLOBAL_KEY, query_rsh_global_stats)
+    for institution in db.query(Institution).filter(Institution.is_active == True).all():
+        base_filters = institution_base_filters(db, institution)
+        if base_filters:
+            dashboard_snapshots.register(institutional_key(*base_filters), institutional_builder(*base_filters))
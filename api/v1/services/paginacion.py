@@ -0,0 +1,56 @@
+"""
+Paginacion por cursor (keyset) para listas ordenadas por una clave natural.
+
+Con OFFSET ClickHouse lee y descarta todas las filas anteriores a la pagina, asi
+que la pagina 5.000 cuesta mucho mas que la primera. Con cursor cada pagina
+pide "las siguientes `limit` filas despues de la ultima clave vista", una
+condicion que puede usar el orden de la tabla. El cursor es opaco para el
+cliente: los valores de la clave de la ultima fila en JSON y base64 url-safe.
+"""
+import base64
+import binascii
+import json
+
+
+def encode_cursor(values: list) -> str:
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, types: tuple[type, ...]) -> list:
+    """Valores de la clave guardados en `cursor`, convertidos con `types`; ValueError si no es valido."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError("Cursor invalido")
+        return [cast(value) for cast, value in zip(types, values)]
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError) as exc:
+        raise ValueError("Cursor invalido") from exc
+
+
+def next_cursor(rows: list[dict], limit: int, keys: tuple[str, ...]) -> str | None:
+    """Cursor para la pagina siguiente; None si esta pagina fue la ultima."""
+    if not rows or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor([last[key] for key in keys])
+
+
+def keyset_condition(operands: list[tuple[str, str, dict]]) -> tuple[str, dict]:
+    """Condicion `clave > cursor` para una clave compuesta.
+
+    `operands` es una lista `(expresion, placeholder, parametros)` en el orden
+    del ORDER BY. Se expande en comparaciones por columna
+    (`a > x OR (a = x AND (b > y OR ...))`) en lugar de comparar tuplas, para
+    que ClickHouse pueda usarla contra la clave de orden.
+    """
+    params = {}
+    condition = ""
+    for expr, placeholder, operand_params in reversed(operands):
+        params.update(operand_params)
+        if condition:
+            condition = f"({expr} > {placeholder} OR ({expr} = {placeholder} AND {condition}))"
+        else:
+            condition = f"{expr} > {placeholder}"
+    return condition, params
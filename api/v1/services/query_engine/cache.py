@@ -0,0 +1,159 @@
+"""
+Caches en proceso para el Query Builder.
+
+TTLCache es un LRU con expiracion por entrada, presupuesto opcional de memoria,
+invalidacion por tag (id del datasource) y contadores de hits/misses. Es seguro
+entre threads (los endpoints sync corren en el threadpool de FastAPI).
+"""
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Any
+
+from api.utils import validar_env_var_number
+
+
+class TTLCache:
+    """LRU acotado por cantidad de entradas (y bytes estimados), con expiracion por antiguedad."""
+
+    def __init__(self, max_entries: int, ttl: float, max_bytes: int | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        # key -> (timestamp, value, size, tag)
+        self._data: OrderedDict[str, tuple[float, Any, int, str | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, max_age: float | None = None) -> Any | None:
+        """Devuelve el valor si existe y su antiguedad no supera max_age (por defecto el TTL)."""
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or time.monotonic() - entry[0] > max_age:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any, size: int = 0, tag: str | None = None) -> None:
+        with self._lock:
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._discard(key)
+            self._data[key] = (time.monotonic(), value, size, tag)
+            self._bytes += size
+            while len(self._data) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                _, (_, _, old_size, _) = self._data.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+
+    def invalidate_tag(self, tag: str) -> int:
+        """Elimina todas las entradas con el tag dado. Devuelve cuantas se eliminaron."""
+        with self._lock:
+            keys = [k for k, entry in self._data.items() if entry[3] == tag]
+            for k in keys:
+                self._discard(k)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _discard(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+
+def query_fingerprint(*parts) -> str:
+    """Hash estable de las partes normalizadas de una consulta."""
+    raw = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def normalize_filters(filters: list[dict]) -> list[dict]:
+    """Ordena filtros para que el mismo conjunto produzca el mismo fingerprint."""
+    return sorted(filters, key=lambda f: json.dumps(f, sort_keys=True, default=str))
+
+
+def estimate_rows_size(rows: list[dict]) -> int:
+    """Estimacion barata (bytes) del tamano en memoria de una lista de filas."""
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for value in row.values():
+            size += sys.getsizeof(value)
+    return size
+
+
+# Totales (count) por consulta normalizada: datasource + filtros + group_by.
+# En modo approx se aceptan totales mas antiguos (QUERY_COUNT_APPROX_TTL).
+COUNT_CACHE_TTL = validar_env_var_number("QUERY_COUNT_CACHE_TTL", 300)
+COUNT_APPROX_TTL = validar_env_var_number("QUERY_COUNT_APPROX_TTL", 3600)
+count_cache = TTLCache(
+    max_entries=validar_env_var_number("QUERY_COUNT_CACHE_MAX_ENTRIES", 2048),
+    ttl=COUNT_CACHE_TTL,
+)
+
+# Paginas completas de resultados (filas + total + next_cursor).
+# Una sola entrada no puede ocupar mas de 1/8 del presupuesto.
+result_cache = TTLCache(
+    max_entries=validar_env_var_number("QUERY_RESULT_CACHE_MAX_ENTRIES", 1024),
+    ttl=validar_env_var_number("QUERY_RESULT_CACHE_TTL", 60),
+    max_bytes=validar_env_var_number("QUERY_RESULT_CACHE_MAX_MB", 64) * 1024 * 1024,
+)
+_RESULT_MAX_ENTRY_BYTES = result_cache.max_bytes // 8
+
+
+def cached_result(key: str, tag: str, compute: Callable[[], tuple]) -> tuple:
+    """Devuelve la tupla de `compute` (filas primero) desde result_cache o la calcula y la guarda."""
+    cached = result_cache.get(key)
+    if cached is not None:
+        return cached
+    result = compute()
+    size = estimate_rows_size(result[0])
+    if size <= _RESULT_MAX_ENTRY_BYTES:
+        result_cache.set(key, result, size=size, tag=tag)
+    return result
+
+
+def invalidate_datasource(ds_id) -> None:
+    """Descarta totales y resultados cacheados de un datasource (cambio de definicion/columnas)."""
+    tag = str(ds_id)
+    count_cache.invalidate_tag(tag)
+    result_cache.invalidate_tag(tag)
+
+
+def cache_stats() -> dict:
+    return {
+        "count": count_cache.stats(),
+        "results": result_cache.stats(),
+    }
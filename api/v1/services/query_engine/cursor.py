@@ -0,0 +1,34 @@
+"""
+Cursores opacos para paginacion keyset.
+
+El cursor codifica la tupla ORDER BY de la ultima fila entregada junto con los
+nombres de las columnas de orden, para rechazar cursores de otra consulta.
+"""
+import base64
+import binascii
+import json
+
+
+def encode_cursor(order_columns: list[str], values: list) -> str:
+    """Serializa la clave de la ultima fila como token base64url."""
+    payload = json.dumps(
+        {"o": order_columns, "k": list(values)},
+        default=str,
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, order_columns: list[str]) -> list:
+    """Decodifica un cursor y valida que corresponda a las columnas de orden. Raises ValueError."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, binascii.Error, UnicodeError):
+        raise ValueError("Cursor no válido")
+    if not isinstance(payload, dict) or payload.get("o") != order_columns:
+        raise ValueError("Cursor no válido para esta consulta")
+    values = payload.get("k")
+    if not isinstance(values, list) or len(values) != len(order_columns):
+        raise ValueError("Cursor no válido")
+    return values
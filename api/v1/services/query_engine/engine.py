@@ -1,6 +1,12 @@
 import re
+from collections.abc import Iterator
 
+from api.utils import validar_env_var_number
 from api.v1.models.data_source import DataSource, DataSourceColumn
+from api.v1.services.query_engine.cursor import encode_cursor, decode_cursor
+from api.v1.services.query_engine.cache import (
+    COUNT_APPROX_TTL, COUNT_CACHE_TTL, count_cache, normalize_filters, query_fingerprint,
+)
 
 _CH_TYPE_MAP = {
     "TEXT": "String",
@@ -24,6 +30,10 @@ _AGG_ALIAS = {
     "SUM": "sum",
 }
 
+# Filtros `in` con mas valores que este umbral viajan como un solo parametro Array(T)
+# en lugar de un placeholder por valor (ver scripts/bench_in_filters.py); 0 = siempre array
+IN_ARRAY_THRESHOLD = validar_env_var_number("QUERY_IN_ARRAY_THRESHOLD", 32)
+
 # ClickHouse identifiers: letters, digits, underscores, dots (for schema.table)
 _IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_.]*$")
 
@@ -101,7 +111,10 @@ def build_where(
         param_name = f"p_{i}"
 
         if op == "in":
-            if isinstance(value, list):
+            if isinstance(value, list) and len(value) > IN_ARRAY_THRESHOLD:
+                conditions.append(f"{col_name} IN {{{param_name}:Array({ch_type})}}")
+                params[param_name] = list(value)
+            elif isinstance(value, list):
                 placeholders = ", ".join(
                     f"{{{param_name}_{j}:{ch_type}}}" for j in range(len(value))
                 )
@@ -123,16 +136,14 @@ def build_where(
     return where, params
 
 
-def execute_query(
-    client,
+def _compile_query(
     ds: DataSource,
     columns: list[DataSourceColumn],
     filters: list[dict],
-    offset: int,
-    limit: int,
     group_by: list[str] | None = None,
     aggregations: list[dict] | None = None,
-) -> tuple[list[dict], int]:
+) -> tuple[str, str, str, str | None, str, dict]:
+    """Compila las partes de la consulta: (tabla, select, where, group by, order, params)."""
     col_map = {c.column_name: c for c in ds.columns_def}
     table_name = _safe_identifier(ds.ch_table)
     where_clause, params = build_where(
@@ -140,47 +151,116 @@ def execute_query(
     )
 
     if group_by and aggregations:
-        # Grouped query
         group_cols = [col_map[name] for name in group_by if name in col_map]
         select_clause = build_select_grouped(group_cols, aggregations)
         group_clause = build_group_by(group_by)
+        order_col = _safe_identifier(group_by[0])
+    else:
+        select_clause = build_select(columns)
+        group_clause = None
+        order_col = _safe_identifier(columns[0].column_name)
+
+    return table_name, select_clause, where_clause, group_clause, order_col, params
+
+
+def _data_sql(
+    table_name: str,
+    select_clause: str,
+    where_clause: str,
+    group_clause: str | None,
+    order_col: str,
+) -> str:
+    sql = f"SELECT {select_clause} FROM {table_name} WHERE {where_clause} "
+    if group_clause:
+        sql += f"GROUP BY {group_clause} "
+    return sql + f"ORDER BY {order_col}"
+
 
-        count_sql = (
+def build_data_query(
+    ds: DataSource,
+    columns: list[DataSourceColumn],
+    filters: list[dict],
+    group_by: list[str] | None = None,
+    aggregations: list[dict] | None = None,
+) -> tuple[str, dict]:
+    """SQL de datos sin paginar (para EXPLAIN). Devuelve (sql, params)."""
+    table_name, select_clause, where_clause, group_clause, order_col, params = _compile_query(
+        ds, columns, filters, group_by, aggregations
+    )
+    return _data_sql(table_name, select_clause, where_clause, group_clause, order_col), params
+
+
+def _count_sql(table_name: str, where_clause: str, group_clause: str | None, approx: bool = False) -> str:
+    if group_clause:
+        if approx:
+            # HyperLogLog sobre la tupla de agrupacion: evita materializar los grupos
+            return f"SELECT uniq({group_clause}) FROM {table_name} WHERE {where_clause}"
+        return (
             f"SELECT count() FROM ("
             f"SELECT {group_clause} FROM {table_name} "
             f"WHERE {where_clause} GROUP BY {group_clause}"
             f") AS sub"
         )
-        count_result = client.query(count_sql, parameters=params)
-        total = count_result.result_rows[0][0]
+    return f"SELECT count() FROM {table_name} WHERE {where_clause}"
+
+
+def count_fingerprint(ds: DataSource, filters: list[dict], group_by: list[str] | None) -> str:
+    """Fingerprint del total: no depende de columnas, orden ni paginacion."""
+    return query_fingerprint(
+        "count",
+        str(ds.id),
+        ds.ch_table,
+        ds.base_filter_columns or [],
+        ds.base_filter_logic,
+        normalize_filters(filters),
+        list(group_by or []),
+    )
 
-        params["_offset"] = offset
-        params["_limit"] = limit
-        order_col = _safe_identifier(group_by[0])
-        data_sql = (
-            f"SELECT {select_clause} FROM {table_name} "
-            f"WHERE {where_clause} "
-            f"GROUP BY {group_clause} "
-            f"ORDER BY {order_col} "
-            f"LIMIT {{_limit:Int32}} OFFSET {{_offset:Int32}}"
-        )
-    else:
-        # Non-grouped query (existing behavior)
-        select_clause = build_select(columns)
 
-        count_sql = f"SELECT count() FROM {table_name} WHERE {where_clause}"
-        count_result = client.query(count_sql, parameters=params)
-        total = count_result.result_rows[0][0]
+def _cached_total(fingerprint: str, count_mode: str) -> int | None:
+    cached = count_cache.get(
+        fingerprint,
+        max_age=COUNT_APPROX_TTL if count_mode == "approx" else COUNT_CACHE_TTL,
+    )
+    if cached is None:
+        return None
+    total, is_exact = cached
+    if count_mode == "exact" and not is_exact:
+        return None
+    return total
 
-        params["_offset"] = offset
-        params["_limit"] = limit
-        order_col = _safe_identifier(columns[0].column_name)
+
+def _run_page(
+    client,
+    table_name: str,
+    select_clause: str,
+    where_clause: str,
+    count_where: str,
+    group_clause: str | None,
+    order_by: str,
+    params: dict,
+    page_sql: str,
+    fingerprint: str,
+    count_mode: str,
+    tag: str,
+) -> tuple[list[dict], int | None]:
+    """Ejecuta la pagina y resuelve el total en el mismo round trip.
+
+    Si el total no esta en cache se calcula como subconsulta escalar (`WITH (...) AS _total`)
+    dentro de la misma query de datos, en lugar de una query count separada.
+    """
+    total = None if count_mode == "none" else _cached_total(fingerprint, count_mode)
+    inline_count = count_mode != "none" and total is None
+
+    if inline_count:
+        count_sql = _count_sql(table_name, count_where, group_clause, approx=count_mode == "approx")
         data_sql = (
-            f"SELECT {select_clause} FROM {table_name} "
-            f"WHERE {where_clause} "
-            f"ORDER BY {order_col} "
-            f"LIMIT {{_limit:Int32}} OFFSET {{_offset:Int32}}"
+            f"WITH ({count_sql}) AS _total "
+            + _data_sql(table_name, f"{select_clause}, _total", where_clause, group_clause, order_by)
+            + page_sql
         )
+    else:
+        data_sql = _data_sql(table_name, select_clause, where_clause, group_clause, order_by) + page_sql
 
     data_result = client.query(data_sql, parameters=params)
     rows = [
@@ -188,4 +268,187 @@ def execute_query(
         for row in data_result.result_rows
     ]
 
+    if inline_count:
+        for row in rows:
+            total = row.pop("_total", total)
+        if total is None:
+            # Pagina vacia: el total no viaja en ninguna fila
+            count_result = client.query(
+                _count_sql(table_name, count_where, group_clause, approx=count_mode == "approx"),
+                parameters=params,
+            )
+            total = count_result.result_rows[0][0]
+        count_cache.set(fingerprint, (total, count_mode == "exact"), tag=tag)
+
     return rows, total
+
+
+def execute_query(
+    client,
+    ds: DataSource,
+    columns: list[DataSourceColumn],
+    filters: list[dict],
+    offset: int,
+    limit: int,
+    group_by: list[str] | None = None,
+    aggregations: list[dict] | None = None,
+    count_mode: str = "exact",
+) -> tuple[list[dict], int | None]:
+    """Ejecuta una pagina (LIMIT/OFFSET). Devuelve (filas, total).
+
+    count_mode: "exact" (default), "approx" (uniq para agrupadas y totales en cache mas
+    antiguos) o "none" (sin total; devuelve None).
+    """
+    table_name, select_clause, where_clause, group_clause, order_col, params = _compile_query(
+        ds, columns, filters, group_by, aggregations
+    )
+    params["_offset"] = offset
+    params["_limit"] = limit
+
+    return _run_page(
+        client, table_name, select_clause, where_clause, where_clause, group_clause, order_col,
+        params, " LIMIT {_limit:Int32} OFFSET {_offset:Int32}",
+        count_fingerprint(ds, filters, group_by), count_mode, str(ds.id),
+    )
+
+
+def count_query(
+    client,
+    ds: DataSource,
+    filters: list[dict],
+    group_by: list[str] | None = None,
+    aggregations: list[dict] | None = None,
+) -> int:
+    """Total exacto de filas (o grupos) de la consulta, reutilizando el cache de totales."""
+    fingerprint = count_fingerprint(ds, filters, group_by)
+    total = _cached_total(fingerprint, "exact")
+    if total is not None:
+        return total
+
+    col_map = {c.column_name: c for c in ds.columns_def}
+    where_clause, params = build_where(ds.base_filter_columns, ds.base_filter_logic, filters, col_map)
+    group_clause = build_group_by(group_by) if group_by and aggregations else None
+    count_result = client.query(
+        _count_sql(_safe_identifier(ds.ch_table), where_clause, group_clause),
+        parameters=params,
+    )
+    total = count_result.result_rows[0][0]
+    count_cache.set(fingerprint, (total, True), tag=str(ds.id))
+    return total
+
+
+def keyset_order_columns(
+    ds: DataSource,
+    group_by: list[str] | None = None,
+    aggregations: list[dict] | None = None,
+) -> list[str]:
+    """Columnas ORDER BY para paginacion keyset.
+
+    En consultas agrupadas la tupla de group_by ya es unica. En consultas simples se
+    ordena por la clave unica declarada del datasource (columnas con is_unique_key):
+    cualquier otra columna puede repetirse o ser NULL y el cursor saltaria filas.
+    Raises ValueError si el datasource no declara clave.
+    """
+    if group_by and aggregations:
+        return [_safe_identifier(name) for name in group_by]
+
+    key = [c.column_name for c in ds.columns_def if c.is_unique_key]
+    if not key:
+        raise ValueError(
+            "El datasource no declara una clave unica; la paginacion por cursor no esta disponible"
+        )
+    return [_safe_identifier(name) for name in key]
+
+
+def execute_query_keyset(
+    client,
+    ds: DataSource,
+    columns: list[DataSourceColumn],
+    filters: list[dict],
+    limit: int,
+    cursor: str | None = None,
+    group_by: list[str] | None = None,
+    aggregations: list[dict] | None = None,
+    count_mode: str = "exact",
+) -> tuple[list[dict], int | None, str | None]:
+    """Pagina con keyset: `(orden) > (clave del cursor)` en lugar de OFFSET.
+
+    Devuelve (filas, total, next_cursor). next_cursor es None en la ultima pagina.
+    Raises ValueError si el cursor no corresponde a la consulta.
+    """
+    col_map = {c.column_name: c for c in ds.columns_def}
+    table_name, select_clause, where_clause, group_clause, _, params = _compile_query(
+        ds, columns, filters, group_by, aggregations
+    )
+    order_columns = keyset_order_columns(ds, group_by, aggregations)
+    selected = list(group_by) if group_clause else [c.column_name for c in columns]
+
+    # Columnas de orden no seleccionadas se piden ocultas y se quitan de la respuesta
+    hidden = [name for name in order_columns if name not in selected]
+    if hidden:
+        select_clause = f"{select_clause}, {', '.join(hidden)}"
+
+    # El total se calcula sin la condicion del cursor
+    count_where = where_clause
+    if cursor:
+        key_values = decode_cursor(cursor, order_columns)
+        placeholders = []
+        for i, (name, value) in enumerate(zip(order_columns, key_values)):
+            col_def = col_map.get(name)
+            data_type = getattr(col_def.data_type, "value", col_def.data_type) if col_def else "TEXT"
+            placeholders.append(f"{{_k_{i}:{_CH_TYPE_MAP.get(data_type, 'String')}}}")
+            params[f"_k_{i}"] = value
+        where_clause = (
+            f"{where_clause} AND ({', '.join(order_columns)}) > ({', '.join(placeholders)})"
+        )
+
+    # Se pide una fila extra para saber si hay pagina siguiente
+    params["_limit"] = limit + 1
+    rows, total = _run_page(
+        client, table_name, select_clause, where_clause, count_where, group_clause,
+        ", ".join(order_columns), params, " LIMIT {_limit:Int32}",
+        count_fingerprint(ds, filters, group_by), count_mode, str(ds.id),
+    )
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(order_columns, [last[name] for name in order_columns])
+
+    if hidden:
+        for row in rows:
+            for name in hidden:
+                row.pop(name, None)
+
+    return rows, total, next_cursor
+
+
+def stream_query(
+    client,
+    ds: DataSource,
+    columns: list[DataSourceColumn],
+    filters: list[dict],
+    group_by: list[str] | None = None,
+    aggregations: list[dict] | None = None,
+) -> Iterator[dict]:
+    """Ejecuta la consulta completa (sin count ni LIMIT) y devuelve un iterador de filas.
+
+    La consulta se envia a ClickHouse al invocar esta funcion, de modo que los errores
+    se propagan antes de empezar a responder. Las filas se leen bloque a bloque desde
+    `query_row_block_stream`, sin materializar el resultado completo en memoria.
+    """
+    table_name, select_clause, where_clause, group_clause, order_col, params = _compile_query(
+        ds, columns, filters, group_by, aggregations
+    )
+    data_sql = _data_sql(table_name, select_clause, where_clause, group_clause, order_col)
+    stream = client.query_row_block_stream(data_sql, parameters=params)
+    return _iter_stream_rows(stream)
+
+
+def _iter_stream_rows(stream) -> Iterator[dict]:
+    with stream:
+        column_names = stream.source.column_names
+        for block in stream:
+            for row in block:
+                yield dict(zip(column_names, row))
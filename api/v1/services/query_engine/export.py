@@ -1,11 +1,14 @@
 """
 Generacion de reportes CSV, Excel y PDF para consultas del Query Builder.
-Optimizado para datasets grandes: CSV usa streaming, Excel usa write_only,
-PDF pre-calcula anchos una sola vez.
+Optimizado para datasets grandes: las filas llegan como iterador (stream de
+bloques de ClickHouse), CSV se emite por chunks, Excel usa write_only sobre un
+archivo temporal y PDF pre-calcula anchos una sola vez.
 """
 from io import BytesIO, StringIO
 from datetime import datetime
-from collections.abc import Generator
+from collections.abc import Generator, Iterable
+from itertools import islice
+from tempfile import SpooledTemporaryFile
 import csv
 
 from openpyxl import Workbook
@@ -19,7 +22,7 @@ from fpdf import FPDF
 _CSV_CHUNK_SIZE = 1000
 
 
-def generate_csv_streaming(rows: list[dict], columns_meta: list[dict]) -> Generator[bytes, None, None]:
+def generate_csv_streaming(rows: Iterable[dict], columns_meta: list[dict]) -> Generator[bytes, None, None]:
     """Genera CSV en chunks para StreamingResponse. No carga todo en RAM."""
     headers = [c["label"] for c in columns_meta]
     keys = [c["column_name"] for c in columns_meta]
@@ -31,18 +34,31 @@ def generate_csv_streaming(rows: list[dict], columns_meta: list[dict]) -> Genera
     yield b"\xef\xbb\xbf" + buf.getvalue().encode("utf-8")
 
     # Datos en chunks
-    for i in range(0, len(rows), _CSV_CHUNK_SIZE):
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, _CSV_CHUNK_SIZE))
+        if not chunk:
+            break
         chunk_buf = StringIO()
         chunk_writer = csv.writer(chunk_buf, lineterminator="\n")
-        for row in rows[i:i + _CSV_CHUNK_SIZE]:
+        for row in chunk:
             chunk_writer.writerow([row.get(k, "") for k in keys])
         yield chunk_buf.getvalue().encode("utf-8")
 
 
 # ── Excel (write-only mode para menor uso de RAM) ────────────────────
 
-def generate_excel(rows: list[dict], columns_meta: list[dict], title: str = "Consulta") -> BytesIO:
-    """Genera Excel (.xlsx) en modo write_only para eficiencia con datasets grandes."""
+_EXCEL_WIDTH_SAMPLE = 100
+_SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+_FILE_CHUNK_SIZE = 64 * 1024
+
+
+def generate_excel(rows: Iterable[dict], columns_meta: list[dict], title: str = "Consulta", dest=None):
+    """Genera Excel (.xlsx) en modo write_only para eficiencia con datasets grandes.
+
+    Escribe en `dest` (ruta o archivo) si se indica; si no, devuelve un archivo
+    temporal (en disco si supera unos MB) posicionado al inicio.
+    """
     headers = [c["label"] for c in columns_meta]
     keys = [c["column_name"] for c in columns_meta]
 
@@ -53,6 +69,18 @@ def generate_excel(rows: list[dict], columns_meta: list[dict], title: str = "Con
     # pero si se pueden pasar listas de celdas con estilo.
     from openpyxl.cell import WriteOnlyCell
 
+    # Anchos de columna estimados (header + muestreo de las primeras filas).
+    # En write_only deben fijarse antes del primer append o se ignoran.
+    it = iter(rows)
+    sample = list(islice(it, _EXCEL_WIDTH_SAMPLE))
+    for col_idx, key in enumerate(keys, 1):
+        max_len = len(headers[col_idx - 1])
+        for row in sample:
+            val = row.get(key, "")
+            if val is not None:
+                max_len = max(max_len, len(str(val)))
+        ws.column_dimensions[get_column_letter(col_idx)].width = min(max_len + 4, 60)
+
     header_font = Font(bold=True, color="FFFFFF", size=11)
     header_fill = PatternFill(start_color="1F4E79", end_color="1F4E79", fill_type="solid")
     header_alignment = Alignment(horizontal="center", vertical="center")
@@ -68,25 +96,33 @@ def generate_excel(rows: list[dict], columns_meta: list[dict], title: str = "Con
     ws.append(header_cells)
 
     # Data rows (sin estilos individuales para velocidad)
-    for row in rows:
+    for row in sample:
+        ws.append([row.get(k, "") for k in keys])
+    for row in it:
         ws.append([row.get(k, "") for k in keys])
 
-    # Anchos de columna estimados (basado en header + muestreo)
-    sample_size = min(100, len(rows))
-    for col_idx, key in enumerate(keys, 1):
-        max_len = len(headers[col_idx - 1])
-        for row in rows[:sample_size]:
-            val = row.get(key, "")
-            if val is not None:
-                max_len = max(max_len, len(str(val)))
-        ws.column_dimensions[get_column_letter(col_idx)].width = min(max_len + 4, 60)
+    if dest is not None:
+        wb.save(dest)
+        return dest
 
-    buf = BytesIO()
+    buf = SpooledTemporaryFile(max_size=_SPOOL_MAX_MEMORY)
     wb.save(buf)
     buf.seek(0)
     return buf
 
 
+def iter_file(fileobj, chunk_size: int = _FILE_CHUNK_SIZE) -> Generator[bytes, None, None]:
+    """Lee un archivo por chunks para StreamingResponse y lo cierra al terminar."""
+    try:
+        while True:
+            chunk = fileobj.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fileobj.close()
+
+
 # ── PDF ──────────────────────────────────────────────────────────────
 
 class _QueryPDF(FPDF):
@@ -126,7 +162,7 @@ class _QueryPDF(FPDF):
         self.cell(0, 10, f"Pagina {self.page_no()}/{{nb}}", align="C")
 
 
-def generate_pdf(rows: list[dict], columns_meta: list[dict], title: str = "Consulta") -> BytesIO:
+def generate_pdf(rows: Iterable[dict], columns_meta: list[dict], title: str = "Consulta") -> BytesIO:
     """Genera PDF landscape. Header de tabla se repite en cada pagina."""
     headers = [c["label"] for c in columns_meta]
     keys = [c["column_name"] for c in columns_meta]
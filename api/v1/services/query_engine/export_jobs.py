@@ -0,0 +1,298 @@
+"""
+Jobs asincronos de exportacion del Query Builder.
+
+Las exportaciones grandes se encolan en un pool acotado de workers, que escriben
+el archivo en un directorio de spool. El cliente consulta estado/progreso y
+descarga el archivo al terminar. Solicitudes identicas mientras un job esta
+pendiente o en curso se adjuntan al mismo job; una vez terminado, una nueva
+solicitud genera un archivo nuevo (los datos o el datasource pudieron cambiar).
+
+La limpieza recorre tambien el directorio de spool: los archivos que no
+pertenecen a un job de este proceso (restos de un reinicio o caida) se borran.
+Los archivos que se estan descargando no se borran hasta que la descarga termina.
+"""
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from uuid import UUID
+
+from api.utils import validar_env_var_number, validar_env_var_string
+from api.v1.config.database import ch_client_session
+from api.v1.services.query_engine.cache import normalize_filters, query_fingerprint
+from api.v1.services.query_engine.engine import count_query, stream_query
+from api.v1.services.query_engine.export import (
+    generate_csv_streaming, generate_excel, generate_pdf,
+)
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_ERROR = "error"
+JOB_EXPIRED = "expired"
+
+_ACTIVE_STATES = (JOB_PENDING, JOB_RUNNING)
+
+# Nombre de los archivos de spool: <job.id>.<ext>
+_SPOOL_FILE = re.compile(r"([0-9a-f]{32})\.[a-z]+")
+
+
+@dataclass
+class ExportJob:
+    id: str
+    fingerprint: str
+    formato: str
+    filename: str
+    title: str
+    user_ids: set[UUID] = field(default_factory=set)
+    status: str = JOB_PENDING
+    rows_written: int = 0
+    total_rows: int | None = None
+    size_bytes: int = 0
+    path: str | None = None
+    error: str | None = None
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    finished_at: datetime | None = None
+    finished_monotonic: float | None = None
+
+    @property
+    def progress(self) -> float | None:
+        if self.status == JOB_DONE:
+            return 1.0
+        if not self.total_rows:
+            return None
+        return min(self.rows_written / self.total_rows, 0.99)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "formato": self.formato,
+            "filename": self.filename,
+            "rows_written": self.rows_written,
+            "total_rows": self.total_rows,
+            "progress": self.progress,
+            "size_bytes": self.size_bytes,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class ExportJobManager:
+    def __init__(self, spool_dir: str, max_workers: int, max_pending: int, max_spool_bytes: int, retention: float):
+        self.spool_dir = spool_dir
+        self.max_pending = max_pending
+        self.max_spool_bytes = max_spool_bytes
+        self.retention = retention
+        self._jobs: dict[str, ExportJob] = {}
+        self._by_fingerprint: dict[str, str] = {}
+        self._downloads: dict[str, int] = {}
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        # Se crea con el primer job y se vuelve a crear despues de shutdown()
+        self._executor: ThreadPoolExecutor | None = None
+
+    def submit(
+        self,
+        user_id: UUID,
+        ds,
+        columns: list,
+        filters: list[dict],
+        group_by: list[str] | None,
+        aggregations: list[dict] | None,
+        columns_meta: list[dict],
+        formato: str,
+        title: str,
+        filename: str,
+    ) -> ExportJob:
+        """Encola un job o adjunta el usuario a uno identico pendiente o en curso. Raises OverflowError si la cola esta llena."""
+        fingerprint = query_fingerprint(
+            "export",
+            str(ds.id),
+            ds.ch_table,
+            ds.base_filter_columns or [],
+            ds.base_filter_logic,
+            [c.column_name for c in columns],
+            normalize_filters(filters),
+            group_by or [],
+            aggregations or [],
+            formato,
+            title,
+        )
+        self.cleanup()
+        with self._lock:
+            existing = self._jobs.get(self._by_fingerprint.get(fingerprint, ""))
+            if existing and existing.status in _ACTIVE_STATES:
+                existing.user_ids.add(user_id)
+                return existing
+
+            pending = sum(1 for j in self._jobs.values() if j.status in _ACTIVE_STATES)
+            if pending >= self.max_pending:
+                raise OverflowError("Demasiadas exportaciones en curso")
+
+            job = ExportJob(
+                id=uuid.uuid4().hex,
+                fingerprint=fingerprint,
+                formato=formato,
+                filename=filename,
+                title=title,
+                user_ids={user_id},
+            )
+            self._jobs[job.id] = job
+            self._by_fingerprint[fingerprint] = job.id
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="export-job")
+            executor = self._executor
+
+        executor.submit(
+            self._run, job, ds, columns, filters, group_by, aggregations, columns_meta,
+        )
+        return job
+
+    def get(self, job_id: str) -> ExportJob | None:
+        return self._jobs.get(job_id)
+
+    def acquire_download(self, job: ExportJob) -> str | None:
+        """Reserva el archivo del job para una descarga; None si ya no esta disponible.
+
+        Mientras haya descargas reservadas, cleanup() no borra el archivo. Cada
+        reserva se libera con release_download() al terminar la respuesta.
+        """
+        with self._lock:
+            if job.status != JOB_DONE or not job.path:
+                return None
+            self._downloads[job.id] = self._downloads.get(job.id, 0) + 1
+            return job.path
+
+    def release_download(self, job_id: str) -> None:
+        with self._lock:
+            remaining = self._downloads.get(job_id, 0) - 1
+            if remaining > 0:
+                self._downloads[job_id] = remaining
+            else:
+                self._downloads.pop(job_id, None)
+
+    def _run(self, job: ExportJob, ds, columns, filters, group_by, aggregations, columns_meta) -> None:
+        job.status = JOB_RUNNING
+        os.makedirs(self.spool_dir, exist_ok=True)
+        ext = os.path.splitext(job.filename)[1]
+        path = os.path.join(self.spool_dir, f"{job.id}{ext}")
+        try:
+            with ch_client_session() as client:
+                job.total_rows = count_query(client, ds, filters, group_by, aggregations)
+                rows = self._track(job, stream_query(
+                    client, ds, columns, filters, group_by=group_by, aggregations=aggregations,
+                ))
+                if job.formato == "csv":
+                    with open(path, "wb") as f:
+                        for chunk in generate_csv_streaming(rows, columns_meta):
+                            f.write(chunk)
+                elif job.formato == "excel":
+                    generate_excel(rows, columns_meta, title=job.title, dest=path)
+                else:
+                    buf = generate_pdf(rows, columns_meta, title=job.title)
+                    with open(path, "wb") as f:
+                        f.write(buf.getbuffer())
+            job.path = path
+            job.size_bytes = os.path.getsize(path)
+            job.status = JOB_DONE
+        except Exception:
+            logger.exception("Export job %s failed", job.id)
+            job.status = JOB_ERROR
+            job.error = "Error al generar la exportación"
+            if os.path.exists(path):
+                os.remove(path)
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+            job.finished_monotonic = time.monotonic()
+            self.cleanup()
+
+    @staticmethod
+    def _track(job: ExportJob, rows):
+        for row in rows:
+            job.rows_written += 1
+            yield row
+
+    def cleanup(self) -> None:
+        """Expira jobs terminados fuera de retencion y libera spool hasta quedar bajo el limite de bytes.
+
+        Primero borra los archivos huerfanos del directorio de spool. Los jobs con
+        descargas en curso conservan su archivo (y siguen contando para el limite).
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._sweep_spool_locked()
+            finished = sorted(
+                (j for j in self._jobs.values() if j.finished_monotonic is not None),
+                key=lambda j: j.finished_monotonic,
+            )
+            spool_bytes = sum(j.size_bytes for j in finished if j.status == JOB_DONE)
+            for job in finished:
+                if job.id in self._downloads:
+                    continue
+                expired = now - job.finished_monotonic > self.retention
+                over_budget = job.status == JOB_DONE and spool_bytes > self.max_spool_bytes
+                if not (expired or over_budget):
+                    continue
+                if job.status == JOB_DONE:
+                    spool_bytes -= job.size_bytes
+                    self._remove_file(job)
+                    job.status = JOB_EXPIRED
+                if expired:
+                    self._jobs.pop(job.id, None)
+                    if self._by_fingerprint.get(job.fingerprint) == job.id:
+                        self._by_fingerprint.pop(job.fingerprint, None)
+
+    def _sweep_spool_locked(self) -> None:
+        """Borra del spool los archivos de jobs que este proceso no conoce."""
+        try:
+            names = os.listdir(self.spool_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            match = _SPOOL_FILE.fullmatch(name)
+            if not match or match.group(1) in self._jobs:
+                continue
+            try:
+                os.remove(os.path.join(self.spool_dir, name))
+            except OSError:
+                logger.warning("No se pudo borrar el archivo de spool %s", name)
+
+    @staticmethod
+    def _remove_file(job: ExportJob) -> None:
+        if job.path and os.path.exists(job.path):
+            os.remove(job.path)
+        job.path = None
+
+    def shutdown(self) -> None:
+        """Cierra el pool de workers; los jobs que no llegaron a empezar quedan con error."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            for job in self._jobs.values():
+                if job.status == JOB_PENDING:
+                    job.status = JOB_ERROR
+                    job.error = "Exportación cancelada por reinicio del servicio"
+                    job.finished_at = datetime.now(timezone.utc)
+                    job.finished_monotonic = time.monotonic()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+export_job_manager = ExportJobManager(
+    spool_dir=validar_env_var_string(
+        "EXPORT_JOB_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "ventana_exports"),
+    ),
+    max_workers=validar_env_var_number("EXPORT_JOB_WORKERS", 2),
+    max_pending=validar_env_var_number("EXPORT_JOB_MAX_PENDING", 20),
+    max_spool_bytes=validar_env_var_number("EXPORT_JOB_SPOOL_MAX_MB", 2048) * 1024 * 1024,
+    retention=validar_env_var_number("EXPORT_JOB_RETENTION_SECONDS", 3600),
+)
@@ -0,0 +1,162 @@
+"""
+Guardrails de costo para el Query Builder.
+
+Antes de ejecutar la consulta real se estima cuantas filas/bytes leeria con
+EXPLAIN ESTIMATE (solo analisis de indices y particiones, no lee datos). Segun
+los limites del rol del usuario la consulta se acepta, se degrada (sin total
+exacto, que duplicaria el escaneo) o se rechaza.
+
+Limites configurables por entorno (0 = sin limite); cada uno admite override
+por codigo de rol con sufijo `__<ROL>`, p.ej. QUERY_MAX_ROWS_TO_READ__ANALYST.
+"""
+import logging
+from dataclasses import dataclass
+
+from api.utils import validar_env_var_bool, validar_env_var_number, validar_env_var_string
+from api.v1.services.query_engine.cache import TTLCache, query_fingerprint
+from api.v1.services.query_engine.engine import build_data_query
+
+logger = logging.getLogger(__name__)
+
+VERDICT_OK = "ok"
+VERDICT_DOWNGRADE = "downgrade"
+VERDICT_REJECT = "reject"
+
+GUARDRAILS_ENABLED = validar_env_var_bool(validar_env_var_string("QUERY_GUARDRAILS_ENABLED"), False)
+
+# Estimaciones por SQL + params, y bytes/fila por tabla y columnas referenciadas
+estimate_cache = TTLCache(
+    max_entries=1024,
+    ttl=validar_env_var_number("QUERY_ESTIMATE_CACHE_TTL", 300),
+)
+_table_stats_cache = TTLCache(max_entries=256, ttl=600)
+
+_TABLE_STATS_SQL = (
+    "SELECT sumIf(data_uncompressed_bytes, has({cols:Array(String)}, name)), "
+    "sum(data_uncompressed_bytes), "
+    "(SELECT sum(rows) FROM system.parts "
+    "WHERE active AND database = {db:String} AND table = {tbl:String}) "
+    "FROM system.columns WHERE database = {db:String} AND table = {tbl:String}"
+)
+
+
+@dataclass(frozen=True)
+class CostEstimate:
+    rows: int
+    marks: int
+    parts: int
+    bytes: int | None
+
+
+@dataclass(frozen=True)
+class CostLimits:
+    max_rows: int | None
+    downgrade_rows: int | None
+    max_bytes: int | None
+
+
+def _role_limit(name: str, role_code: str | None) -> int | None:
+    value = None
+    if role_code:
+        value = validar_env_var_number(f"{name}__{role_code.upper()}")
+    if value is None:
+        value = validar_env_var_number(name, 0)
+    return value or None
+
+
+def limits_for_role(role_code: str | None) -> CostLimits:
+    max_mb = _role_limit("QUERY_MAX_BYTES_TO_READ_MB", role_code)
+    return CostLimits(
+        max_rows=_role_limit("QUERY_MAX_ROWS_TO_READ", role_code),
+        downgrade_rows=_role_limit("QUERY_DOWNGRADE_ROWS_TO_READ", role_code),
+        max_bytes=max_mb * 1024 * 1024 if max_mb else None,
+    )
+
+
+def _referenced_columns(ds, columns, filters, group_by, aggregations) -> list[str]:
+    if group_by and aggregations:
+        names = list(group_by) + [a["column"] for a in aggregations if a["column"] != "*"]
+    else:
+        names = [c.column_name for c in columns]
+    names += [f["column"] for f in filters]
+    names += list(ds.base_filter_columns or [])
+    return sorted(set(names))
+
+
+def _bytes_per_row(client, database: str, table: str, columns: list[str]) -> float | None:
+    key = query_fingerprint(database, table, columns)
+    cached = _table_stats_cache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        result = client.query(
+            _TABLE_STATS_SQL, parameters={"cols": columns, "db": database, "tbl": table},
+        )
+    except Exception:
+        logger.warning("No se pudieron leer estadisticas de %s.%s", database, table, exc_info=True)
+        return None
+    selected, total, rows = result.result_rows[0]
+    if not rows:
+        return None
+    # Si ninguna columna coincide (vistas), se asume la fila completa
+    per_row = (selected or total or 0) / rows
+    _table_stats_cache.set(key, per_row)
+    return per_row
+
+
+def estimate_query(
+    client,
+    ds,
+    columns: list,
+    filters: list[dict],
+    group_by: list[str] | None = None,
+    aggregations: list[dict] | None = None,
+) -> CostEstimate:
+    """Filas, marks y partes a leer segun EXPLAIN ESTIMATE; bytes estimados con system.columns."""
+    sql, params = build_data_query(ds, columns, filters, group_by, aggregations)
+    key = query_fingerprint("estimate", sql, params)
+    cached = estimate_cache.get(key)
+    if cached is not None:
+        return cached
+
+    result = client.query(f"EXPLAIN ESTIMATE {sql}", parameters=params)
+    referenced = _referenced_columns(ds, columns, filters, group_by, aggregations)
+
+    rows = marks = parts = 0
+    total_bytes: float | None = 0
+    for row in result.result_rows:
+        info = dict(zip(result.column_names, row))
+        rows += int(info["rows"])
+        marks += int(info["marks"])
+        parts += int(info["parts"])
+        per_row = _bytes_per_row(client, info["database"], info["table"], referenced)
+        if per_row is None or total_bytes is None:
+            total_bytes = None
+        else:
+            total_bytes += per_row * int(info["rows"])
+
+    estimate = CostEstimate(
+        rows=rows,
+        marks=marks,
+        parts=parts,
+        bytes=int(total_bytes) if total_bytes is not None else None,
+    )
+    estimate_cache.set(key, estimate)
+    return estimate
+
+
+def evaluate(estimate: CostEstimate, limits: CostLimits) -> str:
+    if limits.max_rows and estimate.rows > limits.max_rows:
+        return VERDICT_REJECT
+    if limits.max_bytes and estimate.bytes and estimate.bytes > limits.max_bytes:
+        return VERDICT_REJECT
+    if limits.downgrade_rows and estimate.rows > limits.downgrade_rows:
+        return VERDICT_DOWNGRADE
+    return VERDICT_OK
+
+
+def downgrade_count_mode(count_mode: str, grouped: bool) -> str:
+    """Modo de total para una consulta degradada: uniq() si es agrupada, sin total si no."""
+    if count_mode == "none":
+        return count_mode
+    return "approx" if grouped else "none"
@@ -0,0 +1,160 @@
+"""
+Cache en proceso de metadatos del Query Builder: datasources activos con sus
+columnas y asignaciones rol -> datasource.
+
+Se guardan snapshots inmutables (no instancias ORM, que quedarian desligadas de
+la sesion). El cache se recarga completo cuando cambia el contador de version
+(bump() desde los endpoints que mutan datasources, columnas o asignaciones) o
+cuando vence el TTL, que cubre cambios hechos en otros procesos.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from uuid import UUID
+
+from sqlalchemy.orm import Session, selectinload
+
+from api.utils import validar_env_var_number
+from api.v1.models.data_source import ColumnCategory, ColumnDataType, DataSource, RoleDataSource
+
+# Un id desconocido fuerza una recarga como maximo cada N segundos
+_MISS_RELOAD_INTERVAL = 5
+
+
+@dataclass(frozen=True)
+class ColumnSnapshot:
+    id: UUID
+    column_name: str
+    label: str
+    description: str | None
+    data_type: ColumnDataType
+    category: ColumnCategory
+    is_selectable: bool
+    is_filterable: bool
+    is_groupable: bool
+    is_unique_key: bool
+    display_order: int
+
+
+@dataclass(frozen=True)
+class DataSourceSnapshot:
+    id: UUID
+    code: str
+    name: str
+    description: str | None
+    ch_table: str
+    base_filter_columns: list[str]
+    base_filter_logic: str
+    institution_id: UUID | None
+    is_active: bool
+    columns_def: list[ColumnSnapshot]
+
+
+def _snapshot(ds: DataSource) -> DataSourceSnapshot:
+    return DataSourceSnapshot(
+        id=ds.id,
+        code=ds.code,
+        name=ds.name,
+        description=ds.description,
+        ch_table=ds.ch_table,
+        base_filter_columns=list(ds.base_filter_columns or []),
+        base_filter_logic=ds.base_filter_logic or "OR",
+        institution_id=ds.institution_id,
+        is_active=bool(ds.is_active),
+        columns_def=[
+            ColumnSnapshot(
+                id=c.id,
+                column_name=c.column_name,
+                label=c.label,
+                description=c.description,
+                data_type=c.data_type,
+                category=c.category,
+                is_selectable=bool(c.is_selectable),
+                is_filterable=bool(c.is_filterable),
+                is_groupable=bool(c.is_groupable),
+                is_unique_key=bool(c.is_unique_key),
+                display_order=c.display_order or 0,
+            )
+            for c in (ds.columns_def or [])
+        ],
+    )
+
+
+class MetadataCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.version = 0
+        self.loads = 0
+        self._loaded_version: int | None = None
+        self._loaded_at = 0.0
+        self._datasources: dict[UUID, DataSourceSnapshot] = {}
+        self._grants: dict[UUID, frozenset[UUID]] = {}
+        self._lock = threading.Lock()
+
+    def bump(self) -> None:
+        """Marca el cache como obsoleto; la siguiente lectura recarga desde PG."""
+        with self._lock:
+            self.version += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._loaded_version = None
+            self._datasources = {}
+            self._grants = {}
+
+    def get_datasource(self, db: Session, ds_id: UUID) -> DataSourceSnapshot | None:
+        """Datasource activo por id (None si no existe o esta inactivo)."""
+        self._ensure_loaded(db)
+        ds = self._datasources.get(ds_id)
+        if ds is None and time.monotonic() - self._loaded_at > _MISS_RELOAD_INTERVAL:
+            # Puede haberse creado en otro proceso despues de la ultima carga
+            self._reload(db)
+            ds = self._datasources.get(ds_id)
+        return ds
+
+    def list_datasources(self, db: Session) -> list[DataSourceSnapshot]:
+        self._ensure_loaded(db)
+        return list(self._datasources.values())
+
+    def role_datasource_ids(self, db: Session, role_id: UUID | None) -> frozenset[UUID]:
+        self._ensure_loaded(db)
+        if role_id is None:
+            return frozenset()
+        return self._grants.get(role_id, frozenset())
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "loaded_version": self._loaded_version,
+            "loads": self.loads,
+            "datasources": len(self._datasources),
+            "roles_with_grants": len(self._grants),
+            "ttl_seconds": self.ttl,
+        }
+
+    def _ensure_loaded(self, db: Session) -> None:
+        if self._loaded_version == self.version and time.monotonic() - self._loaded_at <= self.ttl:
+            return
+        self._reload(db)
+
+    def _reload(self, db: Session) -> None:
+        with self._lock:
+            version = self.version
+            sources = (
+                db.query(DataSource)
+                .options(selectinload(DataSource.columns_def))
+                .filter(DataSource.is_active == True)
+                .all()
+            )
+            grants: dict[UUID, set[UUID]] = {}
+            for role_id, ds_id in db.query(RoleDataSource.role_id, RoleDataSource.datasource_id).all():
+                grants.setdefault(role_id, set()).add(ds_id)
+
+            self._datasources = {ds.id: _snapshot(ds) for ds in sources}
+            self._grants = {role_id: frozenset(ids) for role_id, ids in grants.items()}
+            self._loaded_version = version
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+
+
+metadata_cache = MetadataCache(ttl=validar_env_var_number("QUERY_METADATA_CACHE_TTL", 300))
@@ -0,0 +1,134 @@
+"""
+Busqueda de beneficiarios por CUI o nombre del jefe de hogar.
+
+`buscar` ya no se resuelve con `nombre ILIKE '%x%' OR toString(cui) ILIKE '%x%'`
+(recorrido completo con conversion por fila). El texto se clasifica:
+
+- Solo digitos ASCII (se ignoran espacios y guiones entre grupos): CUI. Con 13 digitos es una
+  igualdad; con menos, un prefijo expresado como rango sobre el entero.
+- Cualquier otro texto: nombre. Se normaliza (minusculas, sin tildes) y se
+  parte en palabras; el hogar debe contener todas, en cualquier orden.
+
+Ambos modos leen una tabla de busqueda mantenida por la app (una fila por
+hogar, ordenada por CUI y con un skip index de n-gramas sobre el nombre
+normalizado) que se reconstruye con `scripts/rebuild_search_index.py` despues
+de cada carga. Mientras no exista o sea mas vieja que los datos de origen (o
+BUSQUEDA_INDEX_ENABLED=false) las condiciones van directo sobre
+rsh.vw_pobreza_hogars.
+"""
+import re
+import unicodedata
+
+from api.utils import validar_env_var_bool, validar_env_var_string
+from api.v1.services.rsh.derived_tables import derived_table_available, rebuild_derived_table
+
+BUSQUEDA_INDEX_ENABLED = validar_env_var_bool(validar_env_var_string("BUSQUEDA_INDEX_ENABLED"), True)
+BUSQUEDA_INDEX_TABLE = validar_env_var_string("BUSQUEDA_INDEX_TABLE", "rsh.beneficiarios_busqueda")
+HOGARES_TABLE = "rsh.vw_pobreza_hogars"
+
+CUI_DIGITOS = 13
+# Grupos de digitos ASCII separados por espacios o guiones ("1234 56789-0101")
+_CUI_TEXTO = re.compile(r"[0-9]+(?:[\s-]+[0-9]+)*")
+_SEPARADORES_CUI = re.compile(r"[\s-]+")
+
+# Misma normalizacion que `normalizar_nombre`, del lado de ClickHouse
+_NOMBRE_NORM_SQL = (
+    "lowerUTF8(translateUTF8(ifNull(p.nombre_jefe_hogar, ''), "
+    "'ÁÉÍÓÚÜÑáéíóúüñ', 'AEIOUUNaeiouun'))"
+)
+
+
+def normalizar_nombre(texto: str) -> str:
+    """Minusculas, sin tildes ni dieresis (ñ -> n) y con espacios simples."""
+    sin_tildes = "".join(
+        c for c in unicodedata.normalize("NFD", texto) if not unicodedata.combining(c)
+    )
+    return " ".join(sin_tildes.lower().split())
+
+
+def solo_digitos(texto: str) -> str | None:
+    """Digitos de un CUI o id escrito con separadores; None si el texto no es uno.
+
+    Solo acepta digitos ASCII (`str.isdigit()` tambien acepta "²", que int()
+    rechaza) y no admite signo ni separadores al inicio o al final.
+    """
+    texto = str(texto).strip()
+    if not _CUI_TEXTO.fullmatch(texto):
+        return None
+    return _SEPARADORES_CUI.sub("", texto)
+
+
+def cui_rango(digitos: str) -> tuple[int, int] | None:
+    """Rango de CUIs que empiezan con `digitos`; None si no puede haber ninguno."""
+    faltan = CUI_DIGITOS - len(digitos)
+    if faltan < 0:
+        return None
+    escala = 10 ** faltan
+    inicio = int(digitos) * escala
+    return inicio, inicio + escala - 1
+
+
+def busqueda_table(client) -> str | None:
+    """Nombre de la tabla de busqueda si esta habilitada y al dia; None si hay que usar la vista."""
+    if not BUSQUEDA_INDEX_ENABLED or not derived_table_available(client, BUSQUEDA_INDEX_TABLE, [HOGARES_TABLE]):
+        return None
+    return BUSQUEDA_INDEX_TABLE
+
+
+def busqueda_conditions(search_table: str | None, buscar: str) -> tuple[list[str], dict]:
+    """Condiciones sobre `p` (y sus parametros) para el texto `buscar`."""
+    texto = str(buscar).strip()
+    if not texto:
+        return [], {}
+    digitos = solo_digitos(texto)
+
+    if digitos is not None:
+        rango = cui_rango(digitos)
+        if rango is None:
+            return ["1 = 0"], {}
+        if rango[0] == rango[1]:
+            condition, params = "= {buscar_cui:Int64}", {"buscar_cui": rango[0]}
+        else:
+            condition = "BETWEEN {buscar_cui_min:Int64} AND {buscar_cui_max:Int64}"
+            params = {"buscar_cui_min": rango[0], "buscar_cui_max": rango[1]}
+        if search_table:
+            return [
+                f"p.hogar_id IN (SELECT bs.hogar_id FROM {search_table} AS bs "
+                f"WHERE bs.cui_jefe_hogar {condition})"
+            ], params
+        return [f"p.cui_jefe_hogar {condition}"], params
+
+    if search_table:
+        palabras = normalizar_nombre(texto).split()
+        params = {f"buscar_nombre_{i}": f"%{palabra}%" for i, palabra in enumerate(palabras)}
+        where = " AND ".join(f"bs.nombre_norm LIKE {{{name}:String}}" for name in params)
+        return [f"p.hogar_id IN (SELECT bs.hogar_id FROM {search_table} AS bs WHERE {where})"], params
+
+    # Sin tabla: una condicion por palabra sobre el nombre original
+    params = {f"buscar_nombre_{i}": f"%{palabra}%" for i, palabra in enumerate(texto.split())}
+    return [f"p.nombre_jefe_hogar ILIKE {{{name}:String}}" for name in params], params
+
+
+def rebuild_search_index(client) -> int:
+    """Reconstruye la tabla de busqueda y la publica de forma atomica. Devuelve cuantos hogares tiene."""
+    return rebuild_derived_table(client, BUSQUEDA_INDEX_TABLE, [
+        """
+        CREATE TABLE {staging}
+        (
+            hogar_id Int64,
+            cui_jefe_hogar Int64,
+            nombre_norm String,
+            INDEX idx_nombre_norm nombre_norm TYPE ngrambf_v1(3, 65536, 3, 0) GRANULARITY 1
+        )
+        ENGINE = MergeTree
+        ORDER BY (cui_jefe_hogar, hogar_id)
+        """,
+        f"""
+        INSERT INTO {{staging}}
+        SELECT
+            p.hogar_id,
+            ifNull(p.cui_jefe_hogar, 0),
+            {_NOMBRE_NORM_SQL}
+        FROM {HOGARES_TABLE} AS p
+        """,
+    ], [HOGARES_TABLE])
@@ -0,0 +1,98 @@
+"""
+Filtros sobre columnas de codigo FixedString que conservan el uso de indices.
+
+`trim(columna) = valor` obliga a ClickHouse a evaluar la funcion fila por fila
+y descarta la clave primaria y los skip indexes. Aqui se compara la columna
+cruda contra un parametro tipado `FixedString(N)` con el codigo limpio (ver
+`clean_code`): ClickHouse lo completa con `\0` hasta el ancho, el mismo relleno
+que aplica al guardar un valor corto en FixedString. Los anchos se leen una vez
+por vista de system.columns; si no se conocen (o la columna no es FixedString)
+se mantiene la comparacion con trim().
+"""
+import logging
+import re
+
+from api.utils import validar_env_var_number
+from api.v1.services.query_engine.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_WIDTHS_SQL = (
+    "SELECT name, type FROM system.columns "
+    "WHERE database = {db:String} AND table = {table:String}"
+)
+_FIXED_STRING_RE = re.compile(r"^(?:LowCardinality\()?FixedString\((\d+)\)\)?$")
+
+# Anchos por vista; los tipos casi nunca cambian, el TTL cubre un ALTER
+code_width_cache = TTLCache(
+    max_entries=64,
+    ttl=validar_env_var_number("CH_CODE_WIDTH_CACHE_TTL", 3600),
+)
+
+
+def fixed_string_widths(client, table: str, database: str = "rsh") -> dict[str, int]:
+    """`{columna: N}` de las columnas FixedString(N) de `database.table` (vacio si no se pudo leer)."""
+    key = f"{database}.{table}"
+    widths = code_width_cache.get(key)
+    if widths is not None:
+        return widths
+    try:
+        result = client.query(_WIDTHS_SQL, parameters={"db": database, "table": table})
+        widths = {
+            name: int(match.group(1))
+            for name, col_type in result.result_rows
+            if (match := _FIXED_STRING_RE.match(col_type))
+        }
+    except Exception:
+        logger.warning("No se pudieron leer los tipos de %s; se filtra con trim()", key, exc_info=True)
+        widths = {}
+    code_width_cache.set(key, widths)
+    return widths
+
+
+def _fits(value: str, width: int) -> bool:
+    return len(value.encode("utf-8")) <= width
+
+
+def clean_code(value) -> str:
+    """Codigo sin el relleno de FixedString (`\0`) ni espacios."""
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", errors="ignore")
+    return str(value or "").replace("\x00", "").strip()
+
+
+def code_equals(column: str, name: str, value, widths: dict[str, int], alias: str = "") -> tuple[str, dict]:
+    """Condicion `columna = valor` sobre un codigo y sus parametros."""
+    expr = f"{alias}{column}"
+    value = clean_code(value)
+    width = widths.get(column)
+    if width is None:
+        return f"trim({expr}) = {{{name}:String}}", {name: value}
+    if not _fits(value, width):
+        return "1 = 0", {}
+    return f"{expr} = {{{name}:FixedString({width})}}", {name: value}
+
+
+def code_operand(column: str, name: str, value, widths: dict[str, int], alias: str = "") -> tuple[str, str, dict]:
+    """`(expresion, placeholder, parametros)` para comparar un codigo con <, = o > (p. ej. en keyset)."""
+    expr = f"{alias}{column}"
+    value = clean_code(value)
+    width = widths.get(column)
+    if width is None or not _fits(value, width):
+        return f"trim({expr})", f"{{{name}:String}}", {name: value}
+    return expr, f"{{{name}:FixedString({width})}}", {name: value}
+
+
+def code_in(column: str, name: str, values: list[str], widths: dict[str, int], alias: str = "") -> tuple[str, dict]:
+    """Condicion `columna IN (valores)` sobre un codigo y sus parametros."""
+    expr = f"{alias}{column}"
+    values = [clean_code(v) for v in values]
+    width = widths.get(column)
+    if width is None:
+        return f"has({{{name}:Array(String)}}, trim({expr}))", {name: values}
+    fitting = [v for v in values if _fits(v, width)]
+    if not fitting:
+        return "1 = 0", {}
+    params = {f"{name}_{i}": v for i, v in enumerate(fitting)}
+    placeholders = ", ".join(f"{{{p}:FixedString({width})}}" for p in params)
+    return f"{expr} IN ({placeholders})", params
@@ -0,0 +1,170 @@
+"""
+Tablas derivadas de RSH mantenidas por la aplicacion.
+
+Algunas consultas leen tablas que la app construye a partir de las vistas RSH
+(banderas por hogar, indice de busqueda). Se reconstruyen con los scripts de
+`scripts/` despues de cada carga: la version nueva se arma en `<tabla>_new` y
+se publica con EXCHANGE TABLES (o RENAME la primera vez), asi las consultas
+nunca ven una tabla a medio llenar. Mientras una tabla no exista las consultas
+usan su alternativa sobre las vistas originales.
+
+Cada tabla guarda en su COMMENT la marca de agua de las tablas que lee (las
+vistas se resuelven a sus tablas fisicas con EXPLAIN ESTIMATE): el total de
+filas de sus partes activas y el `modification_time` mas reciente de las partes
+de nivel 0 en system.parts. Una carga agrega partes de nivel 0 (o cambia el
+total de filas) y la tabla pasa a considerarse vieja: las consultas vuelven a
+las vistas hasta que se vuelva a correr su script. Los merges de fondo reemplazan
+partes sin cambiar filas ni agregar partes de nivel 0, asi que no cuentan. Las
+tablas armadas antes de guardar la marca tampoco se usan hasta reconstruirlas.
+"""
+import logging
+import re
+from dataclasses import dataclass
+
+from api.utils import validar_env_var_number
+from api.v1.services.query_engine.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_COMMENT_PREFIX = "rsh_derived:"
+_COMMENT_FORMAT = re.compile(r"rows=(\d+);level0=(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})")
+
+_SOURCE_WATERMARK_SQL = (
+    "SELECT sum(rows), toString(maxIf(modification_time, level = 0)) FROM system.parts "
+    "WHERE active AND has({tables:Array(String)}, concat(database, '.', table))"
+)
+_TABLE_COMMENT_SQL = (
+    "SELECT comment FROM system.tables WHERE database = {db:String} AND name = {name:String}"
+)
+
+
+@dataclass(frozen=True)
+class SourceWatermark:
+    rows: int
+    level0: str
+
+    def encode(self) -> str:
+        return f"{_COMMENT_PREFIX}rows={self.rows};level0={self.level0}"
+
+    @classmethod
+    def decode(cls, comment: str) -> "SourceWatermark | None":
+        if not comment.startswith(_COMMENT_PREFIX):
+            return None
+        match = _COMMENT_FORMAT.fullmatch(comment[len(_COMMENT_PREFIX):])
+        return cls(int(match.group(1)), match.group(2)) if match else None
+
+    def newer_than(self, built: "SourceWatermark") -> bool:
+        """True si hubo una carga despues de `built` (filas distintas o partes de nivel 0 nuevas)."""
+        return self.rows != built.rows or self.level0 > built.level0
+
+
+# Disponibilidad (existe y esta al dia) de cada tabla derivada, para no preguntarla en cada request
+_exists_cache = TTLCache(
+    max_entries=16,
+    ttl=validar_env_var_number("RSH_DERIVED_TABLE_CHECK_TTL", 300),
+)
+
+
+def _exists(client, table: str) -> bool:
+    result = client.query(f"EXISTS TABLE {table}")
+    return bool(result.result_rows and result.result_rows[0][0])
+
+
+def _split(table: str) -> tuple[str, str]:
+    database, _, name = table.rpartition(".")
+    return database, name
+
+
+def physical_tables(client, sources: list[str]) -> list[str]:
+    """Tablas MergeTree que se leen al consultar `sources` (vistas incluidas)."""
+    tables = []
+    for source in sources:
+        result = client.query(f"EXPLAIN ESTIMATE SELECT * FROM {source}")
+        for row in result.result_rows:
+            info = dict(zip(result.column_names, row))
+            name = f"{info['database']}.{info['table']}"
+            if name not in tables:
+                tables.append(name)
+    return tables
+
+
+def source_watermark(client, sources: list[str]) -> SourceWatermark | None:
+    """Marca de agua actual de las tablas fisicas detras de `sources`."""
+    tables = physical_tables(client, sources)
+    if not tables:
+        return None
+    result = client.query(_SOURCE_WATERMARK_SQL, parameters={"tables": tables})
+    if not result.result_rows:
+        return None
+    rows, level0 = result.result_rows[0]
+    return SourceWatermark(int(rows or 0), str(level0))
+
+
+def built_watermark(client, table: str) -> SourceWatermark | None:
+    """Marca de agua con la que se armo `table`; None si no existe o no la guardo."""
+    database, _, name = table.rpartition(".")
+    result = client.query(_TABLE_COMMENT_SQL, parameters={"db": database, "name": name})
+    if not result.result_rows:
+        return None
+    return SourceWatermark.decode(str(result.result_rows[0][0] or ""))
+
+
+def _is_current(client, table: str, sources: list[str]) -> bool:
+    built = built_watermark(client, table)
+    if built is None:
+        return False
+    current = source_watermark(client, sources)
+    if current is not None and current.newer_than(built):
+        logger.warning(
+            "%s se armo con %s y el origen tiene %s; se usan las vistas originales hasta reconstruirla",
+            table, built, current,
+        )
+        return False
+    return True
+
+
+def derived_table_available(client, table: str, sources: list[str]) -> bool:
+    """True si `table` existe y no es mas vieja que `sources` (cacheado); ante un error se asume que no."""
+    available = _exists_cache.get(table)
+    if available is None:
+        try:
+            available = _is_current(client, table, sources)
+        except Exception:
+            logger.warning("No se pudo verificar %s; se usan las vistas originales", table, exc_info=True)
+            available = False
+        _exists_cache.set(table, available)
+    return available
+
+
+def rebuild_derived_table(client, table: str, build_statements: list[str], sources: list[str]) -> int:
+    """Ejecuta `build_statements` (con `{staging}` como destino) y publica el resultado en `table`.
+
+    `sources` son las tablas o vistas que leen los statements. Su marca de agua se
+    lee antes de armar la tabla: si llegan datos durante la reconstruccion, la
+    tabla publicada ya queda como vieja.
+    Devuelve la cantidad de filas de la tabla publicada.
+    """
+    staging = f"{table}_new"
+    watermark = source_watermark(client, sources)
+    client.command(f"DROP TABLE IF EXISTS {staging}")
+    for statement in build_statements:
+        client.command(statement.replace("{staging}", staging))
+    # Solo se escribe en el DDL una marca con el formato esperado
+    if watermark is not None and SourceWatermark.decode(watermark.encode()) == watermark:
+        client.command(f"ALTER TABLE {staging} MODIFY COMMENT '{watermark.encode()}'")
+    else:
+        logger.warning("Sin marca de agua de origen para %s; no se usara hasta reconstruirla", table)
+
+    if _exists(client, table):
+        client.command(f"EXCHANGE TABLES {staging} AND {table}")
+        client.command(f"DROP TABLE IF EXISTS {staging}")
+    else:
+        client.command(f"RENAME TABLE {staging} TO {table}")
+    _exists_cache.set(table, True)
+
+    result = client.query(f"SELECT count() FROM {table}")
+    return result.result_rows[0][0] if result.result_rows else 0
+
+
+def clear_derived_table_cache() -> None:
+    _exists_cache.clear()
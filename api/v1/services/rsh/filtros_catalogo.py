@@ -0,0 +1,48 @@
+"""
+Filtros de texto sobre columnas de pocos valores, resueltos contra los catalogos.
+
+`area`, las clasificaciones IPM/PMT/NBI, `fase` y el nivel de inseguridad
+alimentaria se filtran por subcadena (`ILIKE '%valor%'`), que ClickHouse evalua
+fila por fila. Sus valores posibles son pocos y ya estan en los catalogos
+cacheados (`query_catalogos` via `catalog_service`): la subcadena se resuelve
+aqui contra esos valores y la consulta usa igualdad
+(`columna IN {param:Array(String)}`), que en columnas LowCardinality se evalua
+sobre el diccionario. Sin catalogo, o si el valor trae comodines de LIKE, se
+conserva el ILIKE.
+"""
+
+# Filtro -> catalogo de query_catalogos con sus valores
+CATALOG_FILTERS = {
+    "area": "areas",
+    "ipm_clasificacion": "clasificaciones_ipm",
+    "pmt_clasificacion": "clasificaciones_pmt",
+    "nbi_clasificacion": "clasificaciones_nbi",
+    "fase": "fases",
+    "nivel_inseguridad": "niveles_inseguridad",
+}
+
+_LIKE_WILDCARDS = ("%", "_", "\\")
+
+
+def catalog_matches(values: list[str], term: str) -> list[str]:
+    """Valores del catalogo que cumplen `ILIKE '%term%'`."""
+    term = term.lower()
+    return [value for value in values if term in value.lower()]
+
+
+def catalog_text_filter(
+    expr: str, name: str, value, catalogos: dict | None, filtro: str,
+) -> tuple[str, dict]:
+    """Condicion equivalente a `expr ILIKE '%value%'` y sus parametros.
+
+    Con el catalogo del filtro es `expr IN {name:Array(String)}` sobre los
+    valores que contienen la subcadena (`1 = 0` si ninguno la contiene).
+    """
+    value = str(value)
+    values = (catalogos or {}).get(CATALOG_FILTERS[filtro])
+    if values is None or any(char in value for char in _LIKE_WILDCARDS):
+        return f"{expr} ILIKE {{{name}:String}}", {name: f"%{value}%"}
+    matches = catalog_matches(values, value)
+    if not matches:
+        return "1 = 0", {}
+    return f"{expr} IN {{{name}:Array(String)}}", {name: matches}
@@ -0,0 +1,189 @@
+"""
+Jerarquia geografica departamento -> municipio -> lugar poblado en memoria.
+
+Los selects en cascada del panel de filtros se responden desde un arbol que se
+carga una vez desde ClickHouse (una sola lectura agrupada) y se reemplaza
+completo en cada recarga. Un hilo de fondo revisa cada
+GEO_TREE_REFRESH_SECONDS la version de datos (marca de agua de system.parts) y
+recarga solo si cambio. Si una recarga falla se conserva el arbol anterior; si
+nunca se pudo cargar, las consultas fallan con `GeoHierarchyUnavailable` (503
+en las rutas) hasta el siguiente intento, pasados GEO_TREE_RETRY_SECONDS. No hay
+respaldo estatico: los catalogos de `api/v1/data/guatemala.py` usan codigos de
+demo ("GUA") que no coinciden con los de RSH ("01", "0101").
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable
+
+from api.utils import validar_env_var_number
+from api.v1.services.dashboard.snapshots import dashboard_snapshots
+from api.v1.services.rsh.codigos import clean_code
+from api.v1.services.rsh.queries import query_jerarquia_geografica
+
+logger = logging.getLogger(__name__)
+
+SOURCE_CLICKHOUSE = "clickhouse"
+
+
+class GeoHierarchyUnavailable(RuntimeError):
+    """La jerarquia no se pudo cargar desde ClickHouse y no hay un arbol anterior."""
+
+
+@dataclass(frozen=True)
+class GeoTree:
+    departamentos: list[dict]
+    municipios: dict[str, list[dict]]
+    lugares: dict[str, list[dict]]
+    source: str
+    loaded_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    version: list | None = None
+
+
+def build_geo_tree(rows: list[dict], version: list | None = None) -> GeoTree:
+    """Arma el arbol (listas ordenadas por codigo) a partir de las filas agrupadas."""
+    departamentos: dict[str, str] = {}
+    municipios: dict[str, dict[str, str]] = {}
+    lugares: dict[str, dict[str, str]] = {}
+    for row in rows:
+        depto = clean_code(row["departamento_codigo"])
+        if not depto:
+            continue
+        departamentos.setdefault(depto, row["departamento"])
+        muni = clean_code(row["municipio_codigo"])
+        if not muni:
+            continue
+        municipios.setdefault(depto, {}).setdefault(muni, row["municipio"])
+        lugar = clean_code(row["lugarpoblado_codigo"])
+        if lugar:
+            lugares.setdefault(muni, {}).setdefault(lugar, row["lugar_poblado"])
+
+    def as_items(values: dict[str, str]) -> list[dict]:
+        return [{"codigo": c, "nombre": n} for c, n in sorted(values.items())]
+
+    return GeoTree(
+        departamentos=as_items(departamentos),
+        municipios={d: as_items(m) for d, m in municipios.items()},
+        lugares={m: as_items(lp) for m, lp in lugares.items()},
+        source=SOURCE_CLICKHOUSE,
+        version=version,
+    )
+
+
+class GeoHierarchy:
+    def __init__(self, refresh_interval: int, retry_interval: int, version_reader: Callable):
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self.version_reader = version_reader
+        self._tree: GeoTree | None = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.loads = 0
+        self.load_errors = 0
+
+    # ── Lectura ──────────────────────────────────────────────────────
+
+    def tree(self, client) -> GeoTree:
+        """Arbol actual; la primera vez (o tras un fallo, pasado el reintento) se carga con `client`.
+
+        Raises GeoHierarchyUnavailable si no hay arbol y la carga falla (o fallo hace
+        menos de GEO_TREE_RETRY_SECONDS).
+        """
+        tree = self._tree
+        if tree is not None:
+            return tree
+        with self._lock:
+            if self._tree is not None:
+                return self._tree
+            if time.monotonic() < self._retry_at:
+                raise GeoHierarchyUnavailable("Jerarquia geografica no disponible")
+            tree = self._load(client)
+            if tree is None:
+                raise GeoHierarchyUnavailable("Jerarquia geografica no disponible")
+            return tree
+
+    def municipios(self, client, departamento_codigo: str) -> list[dict]:
+        return self.tree(client).municipios.get(departamento_codigo.strip(), [])
+
+    def lugares_poblados(self, client, municipio_codigo: str) -> list[dict]:
+        return self.tree(client).lugares.get(municipio_codigo.strip(), [])
+
+    # ── Refresco ─────────────────────────────────────────────────────
+
+    def refresh(self, client) -> bool:
+        """Recarga si cambio la version de datos o si todavia no hay arbol."""
+        tree = self._tree
+        version = self.version_reader(client)
+        if tree is not None and tree.version == version:
+            return False
+        with self._lock:
+            self._load(client, version)
+        return True
+
+    def start(self, client_session) -> None:
+        """Inicia el hilo de carga/refresco; `client_session` entrega un cliente."""
+        if not self.refresh_interval or self._thread is not None:
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    with client_session() as client:
+                        self.refresh(client)
+                except Exception:
+                    self.load_errors += 1
+                    logger.exception("Error en el refresco de la jerarquia geografica")
+                self._stop.wait(self.refresh_interval)
+
+        self._thread = threading.Thread(target=loop, name="geo-hierarchy", daemon=True)
+        self._thread.start()
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tree = None
+            self._retry_at = 0.0
+
+    def stats(self) -> dict:
+        tree = self._tree
+        return {
+            "source": tree.source if tree else None,
+            "loaded_at": tree.loaded_at.isoformat() if tree else None,
+            "departamentos": len(tree.departamentos) if tree else 0,
+            "municipios": sum(len(m) for m in tree.municipios.values()) if tree else 0,
+            "lugares_poblados": sum(len(lp) for lp in tree.lugares.values()) if tree else 0,
+            "loads": self.loads,
+            "load_errors": self.load_errors,
+        }
+
+    # ── Internos ─────────────────────────────────────────────────────
+
+    def _load(self, client, version: list | None = None) -> GeoTree | None:
+        """Carga desde ClickHouse; si falla conserva el arbol anterior (None si no habia)."""
+        try:
+            if version is None:
+                version = self.version_reader(client)
+            tree = build_geo_tree(query_jerarquia_geografica(client), version)
+            self.loads += 1
+        except Exception:
+            self.load_errors += 1
+            logger.warning("No se pudo cargar la jerarquia geografica desde ClickHouse", exc_info=True)
+            self._retry_at = time.monotonic() + self.retry_interval
+            tree = self._tree
+        self._tree = tree
+        return tree
+
+
+geo_hierarchy = GeoHierarchy(
+    refresh_interval=validar_env_var_number("GEO_TREE_REFRESH_SECONDS", 600),
+    retry_interval=validar_env_var_number("GEO_TREE_RETRY_SECONDS", 60),
+    version_reader=dashboard_snapshots.read_watermark,
+)
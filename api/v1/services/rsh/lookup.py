@@ -0,0 +1,57 @@
+"""
+Busqueda masiva de hogares por lista de hogar_id o de CUI.
+
+Las listas pegadas por los usuarios se normalizan (espacios y guiones entre
+digitos fuera, ver `solo_digitos`), se resuelven en una sola consulta
+ClickHouse con los ids como parametro Array(Int64) y el resultado se devuelve
+en el orden de la lista, con los ids que no se encontraron y los que no son
+numeros enteros positivos.
+"""
+from api.v1.services.rsh.busqueda import CUI_DIGITOS, solo_digitos
+from api.v1.services.rsh.mappers import row_to_beneficiario_resumen
+from api.v1.services.rsh.queries import stream_beneficiarios_por_ids
+
+# Los ids viajan como Array(Int64): uno mas grande haria fallar toda la consulta
+_INT64_MAX = 2**63 - 1
+
+
+def parse_ids(raw_ids: list, campo: str = "hogar_id") -> tuple[list[int], list[str]]:
+    """`(ids unicos en orden de entrada, entradas invalidas)`.
+
+    Son invalidas las entradas que no son un entero positivo, las que no caben en
+    Int64 y, con `campo="cui"`, las de mas de CUI_DIGITOS digitos.
+    """
+    ids: dict[int, None] = {}
+    invalidos = []
+    for raw in raw_ids:
+        digitos = solo_digitos(raw)
+        if digitos is not None and not (campo == "cui" and len(digitos.lstrip("0")) > CUI_DIGITOS):
+            value = int(digitos)
+            if value <= _INT64_MAX:
+                ids.setdefault(value, None)
+                continue
+        if str(raw).strip():
+            invalidos.append(str(raw))
+    return list(ids), invalidos
+
+
+def lookup_beneficiarios(client, campo: str, raw_ids: list) -> dict:
+    """Resumen de los hogares de cada id (en orden de entrada) y los ids sin resultado."""
+    ids, invalidos = parse_ids(raw_ids, campo)
+    key = "cui_jefe_hogar" if campo == "cui" else "hogar_id"
+
+    por_id: dict[int, list[dict]] = {}
+    if ids:
+        for row in stream_beneficiarios_por_ids(client, campo, ids):
+            por_id.setdefault(row[key], []).append(row_to_beneficiario_resumen(row))
+
+    items = [
+        {"id": i, "beneficiarios": sorted(por_id[i], key=lambda b: b["hogar_id"])}
+        for i in ids if i in por_id
+    ]
+    return {
+        "items": items,
+        "encontrados": len(items),
+        "no_encontrados": [i for i in ids if i not in por_id],
+        "invalidos": invalidos,
+    }
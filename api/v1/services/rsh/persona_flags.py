@@ -0,0 +1,78 @@
+"""
+Banderas por hogar calculadas sobre sus personas.
+
+Los filtros `con_analfabetismo`, `con_menores_sin_escuela` y `sin_empleo`
+dependen de las personas de cada hogar. En lugar de recorrer
+rsh.w_personas_fecs_v2 en cada consulta se mantiene una tabla agregada (una
+fila por hogar con banderas UInt8) que se reconstruye con
+`scripts/rebuild_persona_flags.py` despues de cada carga de datos (ver
+`derived_tables` para la publicacion atomica).
+
+Mientras la tabla no exista o sea mas vieja que los datos de origen (o
+PERSONA_FLAGS_ENABLED=false) los filtros usan semi-joins directos sobre las
+personas con las mismas expresiones.
+"""
+from api.utils import validar_env_var_bool, validar_env_var_string
+from api.v1.services.rsh.derived_tables import derived_table_available, rebuild_derived_table
+
+PERSONA_FLAGS_ENABLED = validar_env_var_bool(validar_env_var_string("PERSONA_FLAGS_ENABLED"), True)
+PERSONA_FLAGS_TABLE = validar_env_var_string("PERSONA_FLAGS_TABLE", "rsh.hogar_flags_personas")
+PERSONAS_TABLE = "rsh.w_personas_fecs_v2"
+
+# Bandera -> condicion sobre una persona (alias ep); el hogar la tiene si alguna persona la cumple
+PERSONA_FLAGS = {
+    "con_analfabetismo": "lower(ep.pe1_descripcion) = 'no'",
+    "con_menores_sin_escuela": (
+        "ep.pd8_anios_cumplidos < 18 AND ep.pd8_anios_cumplidos >= 5 AND lower(ep.pe2_descripcion) = 'no'"
+    ),
+    "con_empleo": "lower(ep.ie1_descripcion) LIKE '%trabaj%'",
+}
+
+
+def persona_flags_table(client) -> str | None:
+    """Nombre de la tabla de banderas si esta habilitada y al dia; None si hay que usar personas."""
+    if not PERSONA_FLAGS_ENABLED or not derived_table_available(client, PERSONA_FLAGS_TABLE, [PERSONAS_TABLE]):
+        return None
+    return PERSONA_FLAGS_TABLE
+
+
+def persona_flag_conditions(flags_table: str | None, required: list[str], excluded: list[str]) -> list[str]:
+    """Condiciones sobre `p.hogar_id`: hogares con todas las banderas `required` y ninguna de `excluded`."""
+    conditions = []
+    if flags_table:
+        if required:
+            where = " AND ".join(f"pf.{flag} = 1" for flag in required)
+            conditions.append(f"p.hogar_id IN (SELECT pf.hogar_id FROM {flags_table} AS pf WHERE {where})")
+        if excluded:
+            where = " OR ".join(f"pf.{flag} = 1" for flag in excluded)
+            conditions.append(f"p.hogar_id NOT IN (SELECT pf.hogar_id FROM {flags_table} AS pf WHERE {where})")
+        return conditions
+
+    # Sin tabla agregada: un semi-join por bandera, basta con una persona que la cumpla
+    for flag in required:
+        conditions.append(
+            f"p.hogar_id IN (SELECT ep.hogar_id FROM {PERSONAS_TABLE} AS ep WHERE {PERSONA_FLAGS[flag]})"
+        )
+    for flag in excluded:
+        conditions.append(
+            f"p.hogar_id NOT IN (SELECT ep.hogar_id FROM {PERSONAS_TABLE} AS ep WHERE {PERSONA_FLAGS[flag]})"
+        )
+    return conditions
+
+
+def rebuild_persona_flags(client) -> int:
+    """Reconstruye la tabla de banderas y la publica de forma atomica. Devuelve cuantos hogares tiene."""
+    columns = ",\n            ".join(
+        f"toUInt8(max({condition})) AS {flag}" for flag, condition in PERSONA_FLAGS.items()
+    )
+    return rebuild_derived_table(client, PERSONA_FLAGS_TABLE, [f"""
+        CREATE TABLE {{staging}}
+        ENGINE = MergeTree
+        ORDER BY hogar_id
+        AS SELECT
+            ep.hogar_id AS hogar_id,
+            {columns},
+            now() AS actualizado_en
+        FROM {PERSONAS_TABLE} AS ep
+        GROUP BY ep.hogar_id
+    """], [PERSONAS_TABLE])
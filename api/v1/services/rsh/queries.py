@@ -1,29 +1,81 @@
 """Queries a ClickHouse para RSH."""
-from typing import Any
+import logging
+from functools import partial
+from typing import Any, Iterator
 
+from api.v1.config.ch_fanout import call_many
+from api.v1.services.catalogos import catalog_service
+from api.v1.services.paginacion import keyset_condition
+from api.v1.services.rsh.busqueda import busqueda_conditions, busqueda_table
+from api.v1.services.rsh.codigos import code_equals, code_in, code_operand, fixed_string_widths
+from api.v1.services.rsh.filtros_catalogo import CATALOG_FILTERS, catalog_text_filter
+from api.v1.services.rsh.persona_flags import persona_flag_conditions, persona_flags_table
 
-def build_filters(**kwargs) -> tuple[str, dict, set[str]]:
+logger = logging.getLogger(__name__)
+
+# Tablas que solo filtran: alias -> (tabla, clave en p, clave en la tabla)
+_SEMI_JOINS = {
+    "d": ("rsh.vw_hogares_datos_demograficos", "(p.hogar_id, p.anio)", "d.hogar_id, d.anio_captura"),
+    "i": ("rsh.vw_elcsa_hogar", "p.hogar_id", "i.hogar_id"),
+    "h": ("rsh.vw_hogar_fecs_v2", "p.hogar_id", "h.hogar_id"),
+}
+
+
+def _semi_join(alias: str, conditions: list[str]) -> str:
+    """`clave IN (SELECT ...)` con todas las condiciones de una tabla de filtro.
+
+    Las condiciones de una misma tabla van juntas para que, como con el JOIN,
+    las cumpla una misma fila de esa tabla.
+    """
+    table, outer_key, inner_key = _SEMI_JOINS[alias]
+    return (
+        f"{outer_key} IN (SELECT {inner_key} FROM {table} AS {alias} "
+        f"WHERE {' AND '.join(conditions)})"
+    )
+
+
+def build_filters(
+    code_widths: dict[str, int] | None = None,
+    persona_flags: str | None = None,
+    search_table: str | None = None,
+    catalogos: dict | None = None,
+    **kwargs,
+) -> tuple[str, dict]:
     """
     Construye cláusula WHERE y parámetros ClickHouse desde filtros.
 
+    `code_widths` son los anchos FixedString de vw_pobreza_hogars (ver
+    `fixed_string_widths`); sin ellos los códigos se comparan con trim().
+    `persona_flags` es la tabla de banderas por hogar (ver `persona_flags_table`);
+    sin ella los filtros sobre personas leen rsh.w_personas_fecs_v2.
+    `search_table` es la tabla de búsqueda por CUI/nombre (ver `busqueda_table`);
+    sin ella `buscar` filtra directo sobre la vista.
+    `catalogos` son los catálogos cacheados (ver `filter_catalogs`); con ellos
+    los filtros de texto de pocos valores se resuelven a igualdades.
+    Los filtros sobre demográficos, vivienda e inseguridad se expresan como
+    semi-joins (`p.hogar_id IN (SELECT ...)`): no hay JOIN ni multiplicación
+    de filas.
+
     Returns:
-        (where_clause, parameters, needed_joins)
-        - where_clause: string SQL con condiciones (sin 'WHERE')
+        (where_clause, parameters)
+        - where_clause: string SQL con condiciones (sin 'WHERE') sobre `p`
         - parameters: dict de parámetros para ClickHouse {nombre: valor}
-        - needed_joins: set de tablas requeridas ('demograficos', 'inseguridad')
     """
     conditions = []
     params = {}
-    joins_needed = set()
+    semi_joins: dict[str, list[str]] = {}
+    code_widths = code_widths or {}
+
+    def add_condition(condition: tuple[str, dict]) -> None:
+        conditions.append(condition[0])
+        params.update(condition[1])
 
-    # Filtros geográficos (requieren trim por FixedString)
+    # Filtros geográficos sobre la columna cruda (FixedString) para aprovechar índices
     if departamento := kwargs.get("departamento_codigo"):
-        conditions.append("trim(p.departamento_codigo) = {depto:String}")
-        params["depto"] = str(departamento).strip()
+        add_condition(code_equals("departamento_codigo", "depto", departamento, code_widths, alias="p."))
 
     if municipio := kwargs.get("municipio_codigo"):
-        conditions.append("trim(p.municipio_codigo) = {muni:String}")
-        params["muni"] = str(municipio).strip()
+        add_condition(code_equals("municipio_codigo", "muni", municipio, code_widths, alias="p."))
 
     if kwargs.get("solo_recientes"):
         raw_codes = kwargs.get("municipios_recientes_codigos") or ""
@@ -33,24 +85,20 @@ def build_filters(**kwargs) -> tuple[str, dict, set[str]]:
             if code.strip()
         ]
         if recent_codes:
-            conditions.append("has({municipios_recientes:Array(String)}, trim(p.municipio_codigo))")
-            params["municipios_recientes"] = recent_codes
+            add_condition(code_in("municipio_codigo", "municipios_recientes", recent_codes, code_widths, alias="p."))
         else:
             conditions.append("1 = 0")
 
     if lugar_poblado := kwargs.get("lugar_poblado_codigo"):
-        conditions.append("trim(p.lugarpoblado_codigo) = {lugar:String}")
-        params["lugar"] = str(lugar_poblado).strip()
+        add_condition(code_equals("lugarpoblado_codigo", "lugar", lugar_poblado, code_widths, alias="p."))
 
     # Área (rural/urbano)
     if area := kwargs.get("area"):
-        conditions.append("p.area ILIKE {area:String}")
-        params["area"] = f"%{area}%"
+        add_condition(catalog_text_filter("p.area", "area", area, catalogos, "area"))
 
     # Sexo del jefe de hogar (FixedString)
     if sexo := kwargs.get("sexo_jefe"):
-        conditions.append("trim(p.sexo_jefe_hogar) = {sexo:String}")
-        params["sexo"] = str(sexo).strip().upper()
+        add_condition(code_equals("sexo_jefe_hogar", "sexo", str(sexo).upper(), code_widths, alias="p."))
 
     # Rangos IPM
     if ipm_min := kwargs.get("ipm_min"):
@@ -63,16 +111,19 @@ def build_filters(**kwargs) -> tuple[str, dict, set[str]]:
 
     # Clasificaciones
     if ipm_clasificacion := kwargs.get("ipm_clasificacion"):
-        conditions.append("p.ipm_gt_clasificacion ILIKE {ipm_clase:String}")
-        params["ipm_clase"] = f"%{ipm_clasificacion}%"
+        add_condition(catalog_text_filter(
+            "p.ipm_gt_clasificacion", "ipm_clase", ipm_clasificacion, catalogos, "ipm_clasificacion",
+        ))
 
     if pmt_clasificacion := kwargs.get("pmt_clasificacion"):
-        conditions.append("p.pmt_clasificacion ILIKE {pmt_clase:String}")
-        params["pmt_clase"] = f"%{pmt_clasificacion}%"
+        add_condition(catalog_text_filter(
+            "p.pmt_clasificacion", "pmt_clase", pmt_clasificacion, catalogos, "pmt_clasificacion",
+        ))
 
     if nbi_clasificacion := kwargs.get("nbi_clasificacion"):
-        conditions.append("p.nbi_clasificacion ILIKE {nbi_clase:String}")
-        params["nbi_clase"] = f"%{nbi_clasificacion}%"
+        add_condition(catalog_text_filter(
+            "p.nbi_clasificacion", "nbi_clase", nbi_clasificacion, catalogos, "nbi_clasificacion",
+        ))
 
     # Año
     if anio := kwargs.get("anio"):
@@ -81,158 +132,85 @@ def build_filters(**kwargs) -> tuple[str, dict, set[str]]:
 
     # Fase
     if fase := kwargs.get("fase"):
-        conditions.append("p.fase ILIKE {fase:String}")
-        params["fase"] = f"%{fase}%"
+        add_condition(catalog_text_filter("p.fase", "fase", fase, catalogos, "fase"))
 
-    # Filtros que requieren JOIN con demograficos
+    # Filtros sobre demograficos (semi-join)
     if kwargs.get("tiene_menores_5"):
-        joins_needed.add("demograficos")
-        conditions.append("d.p_0_5 > 0")
+        semi_joins.setdefault("d", []).append("d.p_0_5 > 0")
 
     if kwargs.get("tiene_adultos_mayores"):
-        joins_needed.add("demograficos")
-        conditions.append("d.adultos_mayores > 0")
+        semi_joins.setdefault("d", []).append("d.adultos_mayores > 0")
 
     if kwargs.get("tiene_embarazadas"):
-        joins_needed.add("demograficos")
-        conditions.append("d.personas_embarazadas > 0")
+        semi_joins.setdefault("d", []).append("d.personas_embarazadas > 0")
 
     if kwargs.get("tiene_discapacidad"):
-        joins_needed.add("demograficos")
-        conditions.append("d.personas_con_dificultad > 0")
+        semi_joins.setdefault("d", []).append("d.personas_con_dificultad > 0")
 
-    # Filtros que requieren JOIN con entrevista_hogares
+    # Filtros sobre la vivienda del hogar (semi-join)
     if fuente_agua := kwargs.get("fuente_agua"):
-        joins_needed.add("hogares")
-        conditions.append("h.ch10_descripcion ILIKE {fuente_agua:String}")
+        semi_joins.setdefault("h", []).append("h.ch10_descripcion ILIKE {fuente_agua:String}")
         params["fuente_agua"] = f"%{fuente_agua}%"
 
     if tipo_sanitario := kwargs.get("tipo_sanitario"):
-        joins_needed.add("hogares")
-        conditions.append("h.ch13_descripcion ILIKE {tipo_sanitario:String}")
+        semi_joins.setdefault("h", []).append("h.ch13_descripcion ILIKE {tipo_sanitario:String}")
         params["tipo_sanitario"] = f"%{tipo_sanitario}%"
 
     if alumbrado_val := kwargs.get("alumbrado"):
-        joins_needed.add("hogares")
-        conditions.append("h.ch16_descripcion ILIKE {alumbrado:String}")
+        semi_joins.setdefault("h", []).append("h.ch16_descripcion ILIKE {alumbrado:String}")
         params["alumbrado"] = f"%{alumbrado_val}%"
 
     if combustible := kwargs.get("combustible_cocina"):
-        joins_needed.add("hogares")
-        conditions.append("h.ch06_descripcion ILIKE {combustible:String}")
+        semi_joins.setdefault("h", []).append("h.ch06_descripcion ILIKE {combustible:String}")
         params["combustible"] = f"%{combustible}%"
 
     if kwargs.get("tiene_internet"):
-        joins_needed.add("hogares")
-        conditions.append("lower(h.ch_18_bien_hogar_internet) = 'si'")
+        semi_joins.setdefault("h", []).append("lower(h.ch_18_bien_hogar_internet) = 'si'")
 
     if kwargs.get("tiene_computadora"):
-        joins_needed.add("hogares")
-        conditions.append("lower(h.ch_18_bien_hogar_compu_laptop) = 'si'")
+        semi_joins.setdefault("h", []).append("lower(h.ch_18_bien_hogar_compu_laptop) = 'si'")
 
     if kwargs.get("tiene_refrigerador"):
-        joins_needed.add("hogares")
-        conditions.append("lower(h.ch_18_bien_hogar_refrigerador) = 'si'")
+        semi_joins.setdefault("h", []).append("lower(h.ch_18_bien_hogar_refrigerador) = 'si'")
 
     if kwargs.get("con_hacinamiento"):
-        joins_needed.add("hogares")
-        conditions.append(
+        semi_joins.setdefault("h", []).append(
             "h.ch4_total_cuartos_utiliza_como_dormitorios > 0 AND "
             "h.ch2_cuantas_personas_residen_habitualmente_en_hogar / h.ch4_total_cuartos_utiliza_como_dormitorios > 3"
         )
 
-    # Filtros que requieren subquery en entrevista_personas
-    if kwargs.get("con_analfabetismo"):
-        conditions.append(
-            "EXISTS (SELECT 1 FROM rsh.w_personas_fecs_v2 AS ep "
-            "WHERE ep.hogar_id = p.hogar_id AND lower(ep.pe1_descripcion) = 'no')"
-        )
-
-    if kwargs.get("con_menores_sin_escuela"):
-        conditions.append(
-            "EXISTS (SELECT 1 FROM rsh.w_personas_fecs_v2 AS ep "
-            "WHERE ep.hogar_id = p.hogar_id AND ep.pd8_anios_cumplidos < 18 "
-            "AND ep.pd8_anios_cumplidos >= 5 AND lower(ep.pe2_descripcion) = 'no')"
-        )
-
-    if kwargs.get("sin_empleo"):
-        conditions.append(
-            "NOT EXISTS (SELECT 1 FROM rsh.w_personas_fecs_v2 AS ep "
-            "WHERE ep.hogar_id = p.hogar_id AND lower(ep.ie1_descripcion) LIKE '%trabaj%')"
-        )
+    # Filtros sobre las personas del hogar (tabla de banderas por hogar o semi-join)
+    conditions += persona_flag_conditions(
+        persona_flags,
+        required=[flag for flag in ("con_analfabetismo", "con_menores_sin_escuela") if kwargs.get(flag)],
+        excluded=["con_empleo"] if kwargs.get("sin_empleo") else [],
+    )
 
-    # Filtros que requieren JOIN con inseguridad
+    # Filtros sobre inseguridad alimentaria (semi-join)
     if nivel_inseg := kwargs.get("nivel_inseguridad"):
-        joins_needed.add("inseguridad")
-        conditions.append("i.nivel_inseguridad_alimentaria ILIKE {nivel_inseg:String}")
-        params["nivel_inseg"] = f"%{nivel_inseg}%"
-
-    # Búsqueda por nombre o CUI
-    if buscar := kwargs.get("buscar"):
-        # Buscar en nombre o CUI (convertir Int64 a string)
-        conditions.append(
-            "(p.nombre_jefe_hogar ILIKE {buscar:String} OR toString(p.cui_jefe_hogar) ILIKE {buscar:String})"
+        condition, condition_params = catalog_text_filter(
+            "i.nivel_inseguridad_alimentaria", "nivel_inseg", nivel_inseg, catalogos, "nivel_inseguridad",
         )
-        params["buscar"] = f"%{buscar}%"
-
-    where_clause = " AND ".join(conditions) if conditions else "1=1"
-    return where_clause, params, joins_needed
-
-
-def _build_joins(joins_needed: set[str]) -> str:
-    """Construye las cláusulas LEFT JOIN según las tablas requeridas."""
-    join_clauses = []
-
-    if "demograficos" in joins_needed:
-        join_clauses.append("""
-            LEFT JOIN rsh.vw_hogares_datos_demograficos AS d
-            ON p.hogar_id = d.hogar_id AND p.anio = d.anio_captura
-        """)
+        semi_joins.setdefault("i", []).append(condition)
+        params.update(condition_params)
 
-    if "inseguridad" in joins_needed:
-        join_clauses.append("""
-            LEFT JOIN rsh.vw_elcsa_hogar AS i
-            ON p.hogar_id = i.hogar_id
-        """)
-
-    if "hogares" in joins_needed:
-        join_clauses.append("""
-            LEFT JOIN rsh.vw_hogar_fecs_v2 AS h
-            ON p.hogar_id = h.hogar_id
-        """)
-
-    return "\n".join(join_clauses)
-
-
-def query_beneficiarios_lista(
-    client, offset: int = 0, limit: int = 100, **filter_kwargs
-) -> tuple[list[dict], int]:
-    """
-    Consulta lista paginada de beneficiarios con filtros.
+    # Búsqueda por CUI (igualdad o prefijo sobre el entero) o por palabras del nombre
+    if buscar := kwargs.get("buscar"):
+        search_conditions, search_params = busqueda_conditions(search_table, buscar)
+        conditions += search_conditions
+        params.update(search_params)
 
-    Returns:
-        (lista_beneficiarios, total_count)
-    """
-    where_clause, params, joins_needed = build_filters(**filter_kwargs)
-    joins = _build_joins(joins_needed)
+    conditions += [_semi_join(alias, table_conditions) for alias, table_conditions in semi_joins.items()]
 
-    # Query de conteo
-    count_query = f"""
-        SELECT count() as total
-        FROM rsh.vw_pobreza_hogars AS p
-        {joins}
-        WHERE {where_clause}
-    """
+    where_clause = " AND ".join(conditions) if conditions else "1=1"
+    return where_clause, params
 
-    count_result = client.query(count_query, parameters=params)
-    total = count_result.result_rows[0][0] if count_result.result_rows else 0
 
-    # Query de datos paginados
-    params["offset"] = offset
-    params["limit"] = limit
+# Orden natural de la lista (columnas devueltas por query_beneficiarios_lista)
+BENEFICIARIOS_SORT_KEYS = ("departamento_codigo", "municipio_codigo", "hogar_id")
+BENEFICIARIOS_CURSOR_TYPES = (str, str, int)
 
-    data_query = f"""
-        SELECT
+_BENEFICIARIOS_COLUMNS = """
             p.hogar_id,
             p.vivienda_id,
             p.departamento,
@@ -254,13 +232,86 @@ def query_beneficiarios_lista(
             p.cui_jefe_hogar,
             p.nombre_jefe_hogar,
             trim(p.sexo_jefe_hogar) as sexo_jefe_hogar,
-            p.anio
+            p.anio"""
+
+_BENEFICIARIOS_ORDER = "p.departamento_codigo, p.municipio_codigo, p.hogar_id"
+
+
+def filter_catalogs(client, filter_kwargs: dict) -> dict | None:
+    """Catalogos cacheados para `build_filters`, solo si se usa algun filtro que los necesite.
+
+    None (se filtra con ILIKE) si no se pudieron leer.
+    """
+    if not any(filter_kwargs.get(key) for key in CATALOG_FILTERS):
+        return None
+    try:
+        return catalog_service.get("rsh", query_catalogos, client).payload
+    except Exception:
+        logger.warning("No se pudieron leer los catalogos RSH; se filtra con ILIKE", exc_info=True)
+        return None
+
+
+def _beneficiarios_filters(client, filter_kwargs: dict) -> tuple[dict[str, int], str, dict]:
+    """Anchos de codigos, WHERE y parametros de la lista de beneficiarios."""
+    code_widths = fixed_string_widths(client, "vw_pobreza_hogars")
+    where_clause, params = build_filters(
+        code_widths,
+        persona_flags_table(client),
+        busqueda_table(client),
+        filter_catalogs(client, filter_kwargs),
+        **filter_kwargs,
+    )
+    return code_widths, where_clause, params
+
+
+def _count_beneficiarios(client, where_clause: str, params: dict) -> int:
+    count_query = f"""
+        SELECT count() as total
         FROM rsh.vw_pobreza_hogars AS p
-        {joins}
         WHERE {where_clause}
-        ORDER BY p.departamento_codigo, p.municipio_codigo, p.hogar_id
+    """
+    count_result = client.query(count_query, parameters=params)
+    return count_result.result_rows[0][0] if count_result.result_rows else 0
+
+
+def query_beneficiarios_lista(
+    client, offset: int = 0, limit: int = 100, cursor: list | None = None, **filter_kwargs
+) -> tuple[list[dict], int]:
+    """
+    Consulta lista paginada de beneficiarios con filtros.
+
+    Con `cursor` (valores de BENEFICIARIOS_SORT_KEYS de la ultima fila vista)
+    la pagina empieza despues de esa fila y se ignora `offset`.
+
+    Returns:
+        (lista_beneficiarios, total_count)
+    """
+    code_widths, where_clause, params = _beneficiarios_filters(client, filter_kwargs)
+    total = _count_beneficiarios(client, where_clause, params)
+
+    # Query de datos paginados: keyset con cursor, OFFSET sin el
+    params["limit"] = limit
+    page_where, page_clause = where_clause, "OFFSET {offset:Int32}"
+    if cursor is not None:
+        depto, muni, hogar_id = cursor
+        keyset, keyset_params = keyset_condition([
+            code_operand("departamento_codigo", "after_depto", depto, code_widths, alias="p."),
+            code_operand("municipio_codigo", "after_muni", muni, code_widths, alias="p."),
+            ("p.hogar_id", "{after_hogar:Int64}", {"after_hogar": hogar_id}),
+        ])
+        page_where = f"{where_clause} AND {keyset}"
+        params.update(keyset_params)
+        page_clause = ""
+    else:
+        params["offset"] = offset
+
+    data_query = f"""
+        SELECT{_BENEFICIARIOS_COLUMNS}
+        FROM rsh.vw_pobreza_hogars AS p
+        WHERE {page_where}
+        ORDER BY {_BENEFICIARIOS_ORDER}
         LIMIT {{limit:Int32}}
-        OFFSET {{offset:Int32}}
+        {page_clause}
     """
 
     data_result = client.query(data_query, parameters=params)
@@ -274,6 +325,69 @@ def query_beneficiarios_lista(
     return beneficiarios, total
 
 
+def count_beneficiarios(client, **filter_kwargs) -> int:
+    """Cantidad de beneficiarios que cumplen los filtros."""
+    _, where_clause, params = _beneficiarios_filters(client, filter_kwargs)
+    return _count_beneficiarios(client, where_clause, params)
+
+
+def stream_beneficiarios(client, limit: int | None = None, **filter_kwargs) -> Iterator[dict]:
+    """Beneficiarios que cumplen los filtros en el orden de la lista; sin `limit`, todos.
+
+    La consulta se envia al invocar la funcion (los errores salen antes de
+    empezar a responder) y las filas se leen bloque a bloque con
+    `query_row_block_stream`, sin materializar el resultado en memoria.
+    """
+    _, where_clause, params = _beneficiarios_filters(client, filter_kwargs)
+    limit_clause = ""
+    if limit is not None:
+        params["limit"] = limit
+        limit_clause = "LIMIT {limit:Int32}"
+    data_query = f"""
+        SELECT{_BENEFICIARIOS_COLUMNS}
+        FROM rsh.vw_pobreza_hogars AS p
+        WHERE {where_clause}
+        ORDER BY {_BENEFICIARIOS_ORDER}
+        {limit_clause}
+    """
+    stream = client.query_row_block_stream(data_query, parameters=params)
+    return _iter_stream_rows(stream)
+
+
+def stream_beneficiarios_por_ids(client, campo: str, ids: list[int]) -> Iterator[dict]:
+    """Beneficiarios cuyo `campo` ("hogar_id" o "cui") esta en `ids`, en una sola consulta.
+
+    Los ids viajan como un parametro Array(Int64) (no se expanden en el SQL).
+    Un CUI puede devolver varios hogares. Las filas salen sin orden definido.
+    """
+    if campo == "cui":
+        search_table = busqueda_table(client)
+        if search_table:
+            condition = (
+                f"p.hogar_id IN (SELECT bs.hogar_id FROM {search_table} AS bs "
+                "WHERE bs.cui_jefe_hogar IN {lookup_ids:Array(Int64)})"
+            )
+        else:
+            condition = "p.cui_jefe_hogar IN {lookup_ids:Array(Int64)}"
+    else:
+        condition = "p.hogar_id IN {lookup_ids:Array(Int64)}"
+    data_query = f"""
+        SELECT{_BENEFICIARIOS_COLUMNS}
+        FROM rsh.vw_pobreza_hogars AS p
+        WHERE {condition}
+    """
+    stream = client.query_row_block_stream(data_query, parameters={"lookup_ids": ids})
+    return _iter_stream_rows(stream)
+
+
+def _iter_stream_rows(stream) -> Iterator[dict]:
+    with stream:
+        column_names = stream.source.column_names
+        for block in stream:
+            for row in block:
+                yield dict(zip(column_names, row))
+
+
 def query_beneficiario_detalle(client, hogar_id: int) -> dict | None:
     """
     Consulta detalle completo de un beneficiario con todos los JOINs.
@@ -362,12 +476,21 @@ def query_stats(client, **filter_kwargs) -> dict:
     Returns:
         Diccionario con conteos, promedios y distribuciones.
     """
-    where_clause, params, joins_needed = build_filters(**filter_kwargs)
-    joins = _build_joins(joins_needed)
-
-    # Estadísticas generales
-    stats_query = f"""
+    where_clause, params = build_filters(
+        fixed_string_widths(client, "vw_pobreza_hogars"),
+        persona_flags_table(client),
+        busqueda_table(client),
+        filter_catalogs(client, filter_kwargs),
+        **filter_kwargs,
+    )
+
+    # Generales, por departamento y por clasificación IPM en una sola lectura filtrada.
+    # Con group_by_use_nulls las claves fuera del grouping set vienen NULL.
+    query = f"""
         SELECT
+            p.departamento as departamento,
+            trim(p.departamento_codigo) as departamento_codigo,
+            p.ipm_gt_clasificacion as ipm_gt_clasificacion,
             count() as total_hogares,
             round(avg(p.ipm_gt), 4) as ipm_promedio,
             countIf(trim(p.sexo_jefe_hogar) = 'F') as hogares_jefatura_femenina,
@@ -376,56 +499,52 @@ def query_stats(client, **filter_kwargs) -> dict:
             sum(p.hombres) as total_hombres,
             sum(p.mujeres) as total_mujeres
         FROM rsh.vw_pobreza_hogars AS p
-        {joins}
         WHERE {where_clause}
+        GROUP BY GROUPING SETS (
+            (),
+            (p.departamento, p.departamento_codigo),
+            (p.ipm_gt_clasificacion)
+        )
+        SETTINGS group_by_use_nulls = 1
     """
 
-    stats_result = client.query(stats_query, parameters=params)
-    stats = dict(zip(stats_result.column_names, stats_result.result_rows[0]))
-
-    # Distribución por departamento
-    depto_query = f"""
-        SELECT
-            p.departamento,
-            trim(p.departamento_codigo) as departamento_codigo,
-            count() as cantidad_hogares,
-            sum(p.numero_personas) as total_personas
-        FROM rsh.vw_pobreza_hogars AS p
-        {joins}
-        WHERE {where_clause}
-        GROUP BY p.departamento, p.departamento_codigo
-        ORDER BY cantidad_hogares DESC
-        LIMIT 22
-    """
-
-    depto_result = client.query(depto_query, parameters=params)
-    distribucion_depto = [
-        dict(zip(depto_result.column_names, row))
-        for row in depto_result.result_rows
-    ]
+    result = client.query(query, parameters=params)
 
-    # Distribución por clasificación IPM
-    ipm_query = f"""
-        SELECT
-            p.ipm_gt_clasificacion,
-            count() as cantidad_hogares,
-            round(avg(p.ipm_gt), 4) as ipm_promedio
-        FROM rsh.vw_pobreza_hogars AS p
-        {joins}
-        WHERE {where_clause}
-        GROUP BY p.ipm_gt_clasificacion
-        ORDER BY cantidad_hogares DESC
-    """
+    stats = {
+        "total_hogares": 0,
+        "ipm_promedio": 0,
+        "hogares_jefatura_femenina": 0,
+        "hogares_jefatura_masculina": 0,
+        "total_personas": 0,
+        "total_hombres": 0,
+        "total_mujeres": 0,
+    }
+    distribucion_depto = []
+    distribucion_ipm = []
+    for values in result.result_rows:
+        row = dict(zip(result.column_names, values))
+        if row["departamento"] is not None:
+            distribucion_depto.append({
+                "departamento": row["departamento"],
+                "departamento_codigo": row["departamento_codigo"],
+                "cantidad_hogares": row["total_hogares"],
+                "total_personas": row["total_personas"],
+            })
+        elif row["ipm_gt_clasificacion"] is not None:
+            distribucion_ipm.append({
+                "ipm_gt_clasificacion": row["ipm_gt_clasificacion"],
+                "cantidad_hogares": row["total_hogares"],
+                "ipm_promedio": row["ipm_promedio"],
+            })
+        else:
+            stats.update({key: row[key] for key in stats})
 
-    ipm_result = client.query(ipm_query, parameters=params)
-    distribucion_ipm = [
-        dict(zip(ipm_result.column_names, row))
-        for row in ipm_result.result_rows
-    ]
+    distribucion_depto.sort(key=lambda r: r["cantidad_hogares"], reverse=True)
+    distribucion_ipm.sort(key=lambda r: r["cantidad_hogares"], reverse=True)
 
     return {
         **stats,
-        "distribucion_departamentos": distribucion_depto,
+        "distribucion_departamentos": distribucion_depto[:22],
         "distribucion_ipm": distribucion_ipm,
     }
 
@@ -495,177 +614,93 @@ def query_dashboard(client) -> dict:
     }
 
 
+# (clave, vista, columna) de cada catalogo de valores simples
+_CATALOGOS_SIMPLES = [
+    ("clasificaciones_ipm", "vw_pobreza_hogars", "ipm_gt_clasificacion"),
+    ("clasificaciones_pmt", "vw_pobreza_hogars", "pmt_clasificacion"),
+    ("clasificaciones_nbi", "vw_pobreza_hogars", "nbi_clasificacion"),
+    ("areas", "vw_pobreza_hogars", "area"),
+    ("niveles_inseguridad", "vw_elcsa_hogar", "nivel_inseguridad_alimentaria"),
+    ("fases", "vw_pobreza_hogars", "fase"),
+    ("comunidades_linguisticas", "vw_hogares_datos_demograficos", "comunidad_linguistica"),
+    ("pueblos", "vw_hogares_datos_demograficos", "pueblo_de_pertenencia"),
+    ("fuentes_agua", "vw_hogar_fecs_v2", "ch10_descripcion"),
+    ("tipos_sanitario", "vw_hogar_fecs_v2", "ch13_descripcion"),
+    ("tipos_alumbrado", "vw_hogar_fecs_v2", "ch16_descripcion"),
+    ("combustibles_cocina", "vw_hogar_fecs_v2", "ch06_descripcion"),
+]
+
+
 def query_catalogos(client) -> dict:
     """
     Obtiene valores DISTINCT de catálogos desde datos reales.
 
+    Todos los catálogos viajan en una sola consulta (UNION ALL de los DISTINCT
+    por vista); ClickHouse ejecuta las ramas en paralelo.
+
     Returns:
         Diccionario con listas de valores únicos para cada catálogo.
     """
-    catalogos = {}
-
-    # Departamentos
-    depto_query = """
+    branches = ["""
         SELECT DISTINCT
+            'departamentos' as catalogo,
             trim(departamento_codigo) as codigo,
-            departamento as nombre
+            toString(departamento) as nombre
         FROM rsh.vw_pobreza_hogars
         WHERE departamento_codigo != ''
-        ORDER BY codigo
-    """
-    depto_result = client.query(depto_query)
-    catalogos["departamentos"] = [
-        {"codigo": row[0], "nombre": row[1]}
-        for row in depto_result.result_rows
-    ]
-
-    # Clasificaciones IPM
-    ipm_query = """
-        SELECT DISTINCT ipm_gt_clasificacion
-        FROM rsh.vw_pobreza_hogars
-        WHERE ipm_gt_clasificacion != ''
-        ORDER BY ipm_gt_clasificacion
-    """
-    ipm_result = client.query(ipm_query)
-    catalogos["clasificaciones_ipm"] = [row[0] for row in ipm_result.result_rows]
-
-    # Clasificaciones PMT
-    pmt_query = """
-        SELECT DISTINCT pmt_clasificacion
-        FROM rsh.vw_pobreza_hogars
-        WHERE pmt_clasificacion != ''
-        ORDER BY pmt_clasificacion
-    """
-    pmt_result = client.query(pmt_query)
-    catalogos["clasificaciones_pmt"] = [row[0] for row in pmt_result.result_rows]
-
-    # Clasificaciones NBI
-    nbi_query = """
-        SELECT DISTINCT nbi_clasificacion
-        FROM rsh.vw_pobreza_hogars
-        WHERE nbi_clasificacion != ''
-        ORDER BY nbi_clasificacion
-    """
-    nbi_result = client.query(nbi_query)
-    catalogos["clasificaciones_nbi"] = [row[0] for row in nbi_result.result_rows]
-
-    # Áreas
-    area_query = """
-        SELECT DISTINCT area
-        FROM rsh.vw_pobreza_hogars
-        WHERE area != ''
-        ORDER BY area
-    """
-    area_result = client.query(area_query)
-    catalogos["areas"] = [row[0] for row in area_result.result_rows]
-
-    # Niveles inseguridad alimentaria
-    inseg_query = """
-        SELECT DISTINCT nivel_inseguridad_alimentaria
-        FROM rsh.vw_elcsa_hogar
-        WHERE nivel_inseguridad_alimentaria != ''
-        ORDER BY nivel_inseguridad_alimentaria
-    """
-    inseg_result = client.query(inseg_query)
-    catalogos["niveles_inseguridad"] = [row[0] for row in inseg_result.result_rows]
-
-    # Fases
-    fase_query = """
-        SELECT DISTINCT fase
-        FROM rsh.vw_pobreza_hogars
-        WHERE fase != ''
-        ORDER BY fase
-    """
-    fase_result = client.query(fase_query)
-    catalogos["fases"] = [row[0] for row in fase_result.result_rows]
-
-    # Comunidades lingüísticas
-    comunidad_query = """
-        SELECT DISTINCT comunidad_linguistica
-        FROM rsh.vw_hogares_datos_demograficos
-        WHERE comunidad_linguistica != ''
-        ORDER BY comunidad_linguistica
-    """
-    comunidad_result = client.query(comunidad_query)
-    catalogos["comunidades_linguisticas"] = [row[0] for row in comunidad_result.result_rows]
-
-    # Pueblos de pertenencia
-    pueblo_query = """
-        SELECT DISTINCT pueblo_de_pertenencia
-        FROM rsh.vw_hogares_datos_demograficos
-        WHERE pueblo_de_pertenencia != ''
-        ORDER BY pueblo_de_pertenencia
-    """
-    pueblo_result = client.query(pueblo_query)
-    catalogos["pueblos"] = [row[0] for row in pueblo_result.result_rows]
-
-    # Fuentes de agua
-    agua_query = """
-        SELECT DISTINCT ch10_descripcion
-        FROM rsh.vw_hogar_fecs_v2
-        WHERE ch10_descripcion != ''
-        ORDER BY ch10_descripcion
-    """
-    agua_result = client.query(agua_query)
-    catalogos["fuentes_agua"] = [row[0] for row in agua_result.result_rows]
-
-    # Tipos sanitario
-    sanitario_query = """
-        SELECT DISTINCT ch13_descripcion
-        FROM rsh.vw_hogar_fecs_v2
-        WHERE ch13_descripcion != ''
-        ORDER BY ch13_descripcion
-    """
-    sanitario_result = client.query(sanitario_query)
-    catalogos["tipos_sanitario"] = [row[0] for row in sanitario_result.result_rows]
-
-    # Tipos alumbrado
-    alumbrado_query = """
-        SELECT DISTINCT ch16_descripcion
-        FROM rsh.vw_hogar_fecs_v2
-        WHERE ch16_descripcion != ''
-        ORDER BY ch16_descripcion
-    """
-    alumbrado_result = client.query(alumbrado_query)
-    catalogos["tipos_alumbrado"] = [row[0] for row in alumbrado_result.result_rows]
-
-    # Combustibles cocina
-    combustible_query = """
-        SELECT DISTINCT ch06_descripcion
-        FROM rsh.vw_hogar_fecs_v2
-        WHERE ch06_descripcion != ''
-        ORDER BY ch06_descripcion
-    """
-    combustible_result = client.query(combustible_query)
-    catalogos["combustibles_cocina"] = [row[0] for row in combustible_result.result_rows]
+    """]
+    for key, view, column in _CATALOGOS_SIMPLES:
+        branches.append(f"""
+        SELECT DISTINCT
+            '{key}' as catalogo,
+            toString({column}) as codigo,
+            '' as nombre
+        FROM rsh.{view}
+        WHERE {column} != ''
+    """)
+    query = f"""
+        SELECT catalogo, codigo, nombre
+        FROM ({" UNION ALL ".join(branches)})
+        ORDER BY catalogo, codigo
+    """
+    result = client.query(query)
+
+    catalogos = {"departamentos": [], **{key: [] for key, _, _ in _CATALOGOS_SIMPLES}}
+    for catalogo, codigo, nombre in result.result_rows:
+        if catalogo == "departamentos":
+            catalogos[catalogo].append({"codigo": codigo, "nombre": nombre})
+        else:
+            catalogos[catalogo].append(codigo)
 
     return catalogos
 
 
-def query_municipios(client, departamento_codigo: str) -> list[dict]:
+def query_jerarquia_geografica(client) -> list[dict]:
     """
-    Obtiene municipios filtrados por departamento.
+    Obtiene todas las combinaciones departamento/municipio/lugar poblado en una lectura.
 
-    Args:
-        departamento_codigo: Código de departamento (FixedString, será trimmeado)
+    Agrupa por las columnas FixedString sin trim() y limpia los códigos en Python.
 
     Returns:
-        Lista de diccionarios con {codigo, nombre}
+        Lista de diccionarios con códigos y nombres de los tres niveles.
     """
     query = """
-        SELECT DISTINCT
-            trim(municipio_codigo) as codigo,
-            municipio as nombre
+        SELECT
+            departamento_codigo,
+            any(departamento) as departamento,
+            municipio_codigo,
+            any(municipio) as municipio,
+            lugarpoblado_codigo,
+            any(lugar_poblado) as lugar_poblado
         FROM rsh.vw_pobreza_hogars
-        WHERE trim(departamento_codigo) = {depto:String}
-          AND municipio_codigo != ''
-        ORDER BY codigo
+        WHERE departamento_codigo != ''
+        GROUP BY departamento_codigo, municipio_codigo, lugarpoblado_codigo
     """
 
-    result = client.query(query, parameters={"depto": departamento_codigo.strip()})
+    result = client.query(query)
 
     return [
-        {"codigo": row[0], "nombre": row[1]}
+        dict(zip(result.column_names, row))
         for row in result.result_rows
     ]
 
@@ -707,34 +742,6 @@ def query_municipios_actualizados(client, last_checked_at) -> list[dict]:
     ]
 
 
-def query_lugares_poblados(client, municipio_codigo: str) -> list[dict]:
-    """
-    Obtiene lugares poblados filtrados por municipio.
-
-    Args:
-        municipio_codigo: Código de municipio (FixedString, será trimmeado)
-
-    Returns:
-        Lista de diccionarios con {codigo, nombre}
-    """
-    query = """
-        SELECT DISTINCT
-            trim(lugarpoblado_codigo) as codigo,
-            lugar_poblado as nombre
-        FROM rsh.vw_pobreza_hogars
-        WHERE trim(municipio_codigo) = {muni:String}
-          AND lugarpoblado_codigo != ''
-        ORDER BY codigo
-    """
-
-    result = client.query(query, parameters={"muni": municipio_codigo.strip()})
-
-    return [
-        {"codigo": row[0], "nombre": row[1]}
-        for row in result.result_rows
-    ]
-
-
 def query_personas_hogar(client, hogar_id: int) -> list[dict]:
     """Consulta las personas de un hogar desde entrevista_personas."""
     query = """
@@ -850,3 +857,23 @@ def query_vivienda_hogar(client, hogar_id: int) -> dict | None:
     if not result.result_rows:
         return None
     return dict(zip(result.column_names, result.result_rows[0]))
+
+
+# Secciones de la ficha de un hogar: nombre -> consulta
+HOGAR_BUNDLE_SECTIONS = {
+    "detalle": query_beneficiario_detalle,
+    "personas": query_personas_hogar,
+    "vivienda": query_vivienda_hogar,
+}
+
+
+def query_hogar_bundle(client, hogar_id: int, sections: list[str]) -> dict:
+    """Ejecuta en paralelo las consultas de las `sections` pedidas de un hogar.
+
+    Returns:
+        `{seccion: resultado crudo}` con el mismo formato de cada consulta.
+    """
+    return call_many({
+        section: partial(HOGAR_BUNDLE_SECTIONS[section], client, hogar_id)
+        for section in sections
+    })
@@ -4,7 +4,10 @@ from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.responses import RedirectResponse
 from api.config.app import APP_NAME, VERSION
-from api.v1.config.database import BaseSQL, sql_engine, BasePG, pg_sync_engine
+from api.v1.config.database import (
+    BaseSQL, sql_engine, BasePG, pg_sync_engine, PGSyncSessionLocal,
+    shared_ch_client, ch_client_session, ch_is_available,
+)
 from api.v1.middleware.response_wrapper import ResponseWrapperMiddleware
 from api.v1.middleware.encryption import ResponseEncryptionMiddleware
 from fastapi_pagination import add_pagination
@@ -26,6 +29,11 @@ from api.v1.routes import consulta_routes
 from api.v1.routes import datasource_routes
 from api.v1.routes import query_routes
 from api.v1.routes import dashboard_routes
+from api.v1.routes import monitor_routes
+from api.v1.services.query_engine.export_jobs import export_job_manager
+from api.v1.config import ch_fanout
+from api.v1.services.dashboard.snapshots import dashboard_snapshots, prime_dashboard_snapshots
+from api.v1.services.rsh.geografia import geo_hierarchy
 
 # Import models to register them with SQLAlchemy
 from api.v1.models import (
@@ -53,6 +61,26 @@ def _create_tables() -> None:
         logging.warning(f"create_all skipped (tables may already exist): {e}")
 
 
+def _start_dashboard_snapshots() -> None:
+    if not ch_is_available():
+        return
+    if PGSyncSessionLocal:
+        db = PGSyncSessionLocal()
+        try:
+            prime_dashboard_snapshots(db)
+        except Exception as e:
+            import logging
+            logging.warning(f"dashboard snapshots priming skipped: {e}")
+        finally:
+            db.close()
+    dashboard_snapshots.start(ch_client_session)
+
+
+def _start_geo_hierarchy() -> None:
+    if ch_is_available():
+        geo_hierarchy.start(ch_client_session)
+
+
 app = FastAPI(
     title=APP_NAME,
     version=VERSION,
@@ -73,6 +101,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Conteo de filas de las exportaciones de beneficiarios
+    expose_headers=["X-Total-Rows", "X-Rows-Written"],
 )
 
 
@@ -96,6 +126,7 @@ app.include_router(consulta_routes.router, prefix="/api/v1")
 app.include_router(datasource_routes.router, prefix="/api/v1")
 app.include_router(query_routes.router, prefix="/api/v1")
 app.include_router(dashboard_routes.router, prefix="/api/v1")
+app.include_router(monitor_routes.router, prefix="/api/v1")
 
 # Legacy/Example routes
 app.include_router(ticket_routes.router, prefix="/api/v1")
@@ -104,6 +135,19 @@ app.include_router(employee_routes.router, prefix="/api/v1")
 @app.on_event("startup")
 def startup() -> None:
     _create_tables()
+    # Archivos de exportacion que dejo un proceso anterior
+    export_job_manager.cleanup()
+    _start_dashboard_snapshots()
+    _start_geo_hierarchy()
+
+
+@app.on_event("shutdown")
+def shutdown() -> None:
+    export_job_manager.shutdown()
+    dashboard_snapshots.shutdown()
+    geo_hierarchy.shutdown()
+    ch_fanout.shutdown()
+    shared_ch_client.close()
 
 
 # Redirect / -> Swagger-UI documentation
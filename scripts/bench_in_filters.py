@@ -0,0 +1,72 @@
+"""
+Benchmark of `in` filters in the query engine: one placeholder per value vs a single
+Array(T) parameter. For each list size it times build_where and, when ClickHouse is
+reachable, the server round trip of a count() with each form. Use the crossover to
+tune QUERY_IN_ARRAY_THRESHOLD.
+
+From backend/: python scripts/bench_in_filters.py [table] [column] [TEXT|INTEGER]
+(default: rsh.vw_pobreza_hogars hogar_id INTEGER)
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.v1.config.database import ch_client_session
+from api.v1.models.data_source import DataSourceColumn
+from api.v1.services.query_engine import engine
+
+SIZES = (1, 8, 16, 32, 64, 128, 512, 2048, 8192)
+REPEAT = 5
+
+
+def _best(fn, repeat=REPEAT):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def _where(column, values, threshold):
+    engine.IN_ARRAY_THRESHOLD = threshold
+    filters = [{"column": column.column_name, "op": "in", "value": values}]
+    return engine.build_where(None, None, filters, {column.column_name: column})
+
+
+def bench(table, column_name, data_type):
+    column = DataSourceColumn(column_name=column_name, data_type=data_type)
+    original = engine.IN_ARRAY_THRESHOLD
+    try:
+        with ch_client_session() as client:
+            sample = [
+                row[0] for row in client.query(
+                    f"SELECT DISTINCT {column_name} FROM {table} LIMIT {max(SIZES)}"
+                ).result_rows
+            ]
+            print(f"{'n':>6} {'sql scalar':>11} {'sql array':>10} {'build scalar':>13} {'build array':>12} "
+                  f"{'ch scalar':>10} {'ch array':>9}")
+            for n in SIZES:
+                values = sample[:n]
+                row = [n]
+                forms = [max(SIZES) + 1, 0]  # thresholds that force each form
+                wheres = [_where(column, values, t) for t in forms]
+                row += [len(where) for where, _ in wheres]
+                row += [_best(lambda t=t: _where(column, values, t)) * 1e3 for t in forms]
+                for where, params in wheres:
+                    sql = f"SELECT count() FROM {table} WHERE {where}"
+                    row.append(_best(lambda: client.query(sql, parameters=params)) * 1e3)
+                print("{:>6} {:>11} {:>10} {:>11.3f}ms {:>10.3f}ms {:>8.1f}ms {:>7.1f}ms".format(*row))
+    finally:
+        engine.IN_ARRAY_THRESHOLD = original
+    print(f"Current QUERY_IN_ARRAY_THRESHOLD: {original}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    bench(
+        args[0] if len(args) > 0 else "rsh.vw_pobreza_hogars",
+        args[1] if len(args) > 1 else "hogar_id",
+        args[2] if len(args) > 2 else "INTEGER",
+    )
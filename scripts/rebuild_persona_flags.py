@@ -0,0 +1,25 @@
+"""
+Rebuilds the per-hogar person flags table used by the beneficiario filters
+(con_analfabetismo, con_menores_sin_escuela, sin_empleo).
+Run after each RSH data load, from backend/: python scripts/rebuild_persona_flags.py
+Until it runs, the API treats the table as stale and queries the source views.
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.v1.config.database import ch_client_session
+from api.v1.services.rsh.persona_flags import PERSONA_FLAGS_TABLE, rebuild_persona_flags
+
+
+def rebuild():
+    start = time.monotonic()
+    with ch_client_session() as client:
+        total = rebuild_persona_flags(client)
+    print(f"  {PERSONA_FLAGS_TABLE}: {total} hogares en {time.monotonic() - start:.1f}s.")
+    print("Done.")
+
+
+if __name__ == "__main__":
+    rebuild()
@@ -0,0 +1,24 @@
+"""
+Rebuilds the CUI / name search table used by `buscar` on the beneficiarios list.
+Run after each RSH data load, from backend/: python scripts/rebuild_search_index.py
+Until it runs, the API treats the table as stale and queries the source views.
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.v1.config.database import ch_client_session
+from api.v1.services.rsh.busqueda import BUSQUEDA_INDEX_TABLE, rebuild_search_index
+
+
+def rebuild():
+    start = time.monotonic()
+    with ch_client_session() as client:
+        total = rebuild_search_index(client)
+    print(f"  {BUSQUEDA_INDEX_TABLE}: {total} hogares en {time.monotonic() - start:.1f}s.")
+    print("Done.")
+
+
+if __name__ == "__main__":
+    rebuild()
@@ -21,7 +21,8 @@ from api.v1.models.role import Role
 load_dotenv()
 
 # ---------------------------------------------------------------------------
-# Table metadata: code, name, description
+# Table metadata: code, name, description, unique_key (columns that identify a row;
+# without it the Query Builder only paginates by offset)
 # ---------------------------------------------------------------------------
 TABLE_META = {
     "vw_beneficios_x_hogar": {
@@ -33,6 +34,7 @@ TABLE_META = {
             "datos demograficos, intervenciones realizadas (estufa, ecofiltro, "
             "letrina, etc.) y programas asociados (FODES, MAGA, MIDES)."
         ),
+        "unique_key": ["hogar_id"],
     },
     "vw_beneficios_x_persona": {
         "code": "BENEFICIOS_PERSONA",
@@ -43,6 +45,7 @@ TABLE_META = {
             "sexo, etnia, comunidad linguistica, ubicacion geografica e "
             "indicadores de pobreza del hogar al que pertenecen."
         ),
+        "unique_key": ["personas_id"],
     },
     "vw_elcsa_hogar": {
         "code": "ELCSA",
@@ -52,6 +55,7 @@ TABLE_META = {
             "Mide el nivel de inseguridad alimentaria por hogar: leve, "
             "moderada o severa, basado en el puntaje ELCSA."
         ),
+        "unique_key": ["hogar_id"],
     },
     "vw_fase": {
         "code": "FASE",
@@ -70,6 +74,7 @@ TABLE_META = {
             "trabajo, etnia, edad, sexo, parentesco, analfabetismo y "
             "agrupaciones por rangos de edad y ciclos de vida."
         ),
+        "unique_key": ["personas_id"],
     },
     "vw_hogar_fecs_v2": {
         "code": "HOGAR_FECS",
@@ -80,6 +85,7 @@ TABLE_META = {
             "agua, saneamiento, alumbrado, bienes del hogar, eliminacion de basura "
             "y seguridad alimentaria (preguntas SN1 a SN12)."
         ),
+        "unique_key": ["hogar_id"],
     },
     "vw_hogares_datos_demograficos": {
         "code": "HOGAR_DEMO",
@@ -90,6 +96,7 @@ TABLE_META = {
             "de edad (primera infancia, ninos, adolescentes, jovenes, adultos, "
             "adultos mayores) con cortes por sexo."
         ),
+        "unique_key": ["hogar_id", "anio_captura"],
     },
     "vw_pobreza_hogars": {
         "code": "POBREZA_HOGAR",
@@ -100,6 +107,7 @@ TABLE_META = {
             "y madre, geolocalizacion, fase del municipio e informacion "
             "de sincronizacion."
         ),
+        "unique_key": ["hogar_id"],
     },
     "vw_vivienda_carac": {
         "code": "VIVIENDA_CARAC",
@@ -130,6 +138,7 @@ TABLE_META = {
             "salud, embarazo, nutricion (dieta ayer), higiene, educacion "
             "(inscripcion, nivel, grado, abandono) e ingreso/empleo."
         ),
+        "unique_key": ["personas_id"],
     },
 }
 
@@ -555,6 +564,12 @@ def seed():
             db.add(ds)
             db.flush()
 
+            # A partial key is not unique: only flag it if every column is present
+            unique_key = set(meta.get("unique_key", []))
+            if not unique_key <= {row[0] for row in cols_result.result_rows}:
+                print(f"  Warning: {meta['code']} is missing unique key columns {sorted(unique_key)}")
+                unique_key = set()
+
             # Create columns
             for order, row in enumerate(cols_result.result_rows):
                 col_name = row[0]
@@ -582,6 +597,7 @@ def seed():
                     is_selectable=True,
                     is_filterable=True,
                     is_groupable=is_groupable,
+                    is_unique_key=col_name in unique_key,
                     display_order=order,
                 )
                 db.add(dsc)
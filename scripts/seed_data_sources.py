@@ -81,6 +81,7 @@ def seed():
                     is_selectable=True,
                     is_filterable=is_filterable,
                     is_groupable=is_groupable,
+                    is_unique_key=col_name == "hogar_id",
                     display_order=order,
                 )
                 db.add(dsc)
@@ -16,6 +16,13 @@ from api.v1.models.user_session import UserSession
 from api.v1.auth.password import hash_password
 from main import app
 from api.v1.config.database import get_sync_db_pg, get_ch_client
+from api.v1.services.query_engine.cache import count_cache, result_cache
+from api.v1.services.query_engine.metadata import metadata_cache
+from api.v1.services.catalogos import catalog_service
+from api.v1.services.dashboard.snapshots import dashboard_snapshots
+from api.v1.services.rsh.codigos import code_width_cache
+from api.v1.services.rsh.derived_tables import clear_derived_table_cache
+from api.v1.services.rsh.geografia import geo_hierarchy
 
 load_dotenv()
 
@@ -40,6 +47,14 @@ TestingSessionLocal = sessionmaker(
 @pytest.fixture(scope="function", autouse=True)
 def prepare_db():
     BasePG.metadata.create_all(bind=engine)
+    count_cache.clear()
+    result_cache.clear()
+    metadata_cache.clear()
+    dashboard_snapshots.clear()
+    catalog_service.clear()
+    geo_hierarchy.clear()
+    code_width_cache.clear()
+    clear_derived_table_cache()
     yield
     BasePG.metadata.drop_all(bind=engine)
 
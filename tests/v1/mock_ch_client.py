@@ -7,6 +7,7 @@ Imita la interfaz de clickhouse_connect: result.column_names, result.result_rows
 import re
 from datetime import datetime, timezone
 from dataclasses import dataclass, field
+from api.v1.services.rsh.busqueda import normalizar_nombre
 from tests.v1.rsh_mock_data import RSHMockDataset
 
 
@@ -17,21 +18,83 @@ class MockQueryResult:
     result_rows: list[tuple] = field(default_factory=list)
 
 
+_GROUPING_SETS_COLUMNS = [
+    "departamento", "codigo", "ipm", "nbi", "pmt", "cantidad", "cantidad_total",
+    "deptos", "munis", "lugares", "ipm_avg", "pmt_avg", "nbi_avg", "total_hombres", "total_mujeres",
+]
+
+
+def grouping_sets_result(rows: list[dict], extra_columns: list[str] | None = None) -> MockQueryResult:
+    """Resultado de la pasada GROUPING SETS del dashboard; claves ausentes quedan NULL (0 en conteos)."""
+    columns = _GROUPING_SETS_COLUMNS + list(extra_columns or [])
+    keys = {"departamento", "codigo", "ipm", "nbi", "pmt"}
+    return MockQueryResult(
+        column_names=columns,
+        result_rows=[tuple(row.get(col, None if col in keys else 0) for col in columns) for row in rows],
+    )
+
+
+def _text_match(param, value: str) -> bool:
+    """Filtro de texto: lista de valores (resuelto con catalogos) o patron ILIKE '%term%'."""
+    if isinstance(param, list):
+        return value in param
+    return param.strip("%").lower() in value.lower()
+
+
+class MockStreamContext:
+    """Imita clickhouse_connect StreamContext: iterable de bloques dentro de un `with`."""
+
+    def __init__(self, source: MockQueryResult, block_size: int = 1000):
+        self.source = source
+        self._blocks = (
+            source.result_rows[i:i + block_size]
+            for i in range(0, len(source.result_rows), block_size)
+        )
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.closed = True
+
+    def __iter__(self):
+        return self._blocks
+
+
 class MockClickHouseClient:
     """Mock client que parsea SQL y devuelve datos del RSHMockDataset."""
 
     def __init__(self, dataset: RSHMockDataset | None = None):
         self.dataset = dataset or RSHMockDataset(n_hogares=5000, personas_por_hogar=3)
         self._closed = False
+        self.commands: list[tuple[str, dict]] = []
 
     def close(self):
         self._closed = True
 
-    def query(self, sql: str, parameters: dict | None = None) -> MockQueryResult:
+    def command(self, cmd: str, parameters: dict | None = None, settings: dict | None = None):
+        """Registra comandos (p.ej. KILL QUERY) sin ejecutarlos."""
+        self.commands.append((cmd, parameters or {}))
+
+    def query_row_block_stream(
+        self, sql: str, parameters: dict | None = None, settings: dict | None = None,
+    ) -> MockStreamContext:
+        """Version streaming de query(): devuelve el resultado en bloques de filas."""
+        return MockStreamContext(self.query(sql, parameters))
+
+    def query(self, sql: str, parameters: dict | None = None, settings: dict | None = None) -> MockQueryResult:
         """Despacha la query al handler correcto segun patron SQL."""
         sql_clean = " ".join(sql.split()).lower()
         params = parameters or {}
 
+        # ── Marca de agua de snapshots (system.parts) ──
+        if "from system.parts" in sql_clean:
+            return MockQueryResult(
+                column_names=["modification_time", "rows", "parts"],
+                result_rows=[("2024-01-01 00:00:00", str(len(self.dataset.hogares)), "1")],
+            )
+
         # ── ClickHouse introspection ──
         if sql_clean.startswith("show tables"):
             return self._handle_show_tables()
@@ -53,10 +116,9 @@ class MockClickHouseClient:
             if "select count()" in sql_clean:
                 return self._handle_consulta_count(sql_clean, params)
 
-            # Lista for consulta (has limit+offset)
-            if "limit" in sql_clean and "offset" in sql_clean:
-                if "hogar_id" not in params or "offset" in params:
-                    return self._handle_consulta_lista(sql_clean, params)
+            # Lista for consulta (paginada por offset o por cursor)
+            if "limit" in params:
+                return self._handle_consulta_lista(sql_clean, params)
 
             # Detalle for consulta
             if "hogar_id" in params:
@@ -70,6 +132,10 @@ class MockClickHouseClient:
         if "uniq(departamento_codigo)" in sql_clean or "uniq(municipio_codigo)" in sql_clean:
             return self._handle_dashboard_global()
 
+        # ── Stats: pasada unica con GROUPING SETS ──
+        if "grouping sets" in sql_clean and "pobreza_hogar" in sql_clean:
+            return self._handle_stats_grouping_sets(sql_clean, params)
+
         # ── Stats: estadisticas generales (countIf before simple count) ──
         if "countif" in sql_clean and "pobreza_hogar" in sql_clean:
             return self._handle_stats_general(sql_clean, params)
@@ -78,12 +144,10 @@ class MockClickHouseClient:
         if "select count()" in sql_clean and "pobreza_hogar" in sql_clean:
             return self._handle_count(sql_clean, params)
 
-        # ── Beneficiarios lista: data (tiene LIMIT/OFFSET) ──
-        if "pobreza_hogar" in sql_clean and "limit" in sql_clean and "offset" in sql_clean:
-            # Detalle tiene hogar_id param, pero no offset
-            if "left join" in sql_clean and "hogares_datos_demograficos" in sql_clean and "hogares_inseguridad_alimentaria" in sql_clean:
-                if "hogar_id" in params and "offset" not in params:
-                    return self._handle_detalle(params)
+        # ── Beneficiarios lista: data (paginada por offset o por cursor, o completa para exportar) ──
+        if "pobreza_hogar" in sql_clean and (
+            "limit" in params or "lookup_ids" in params or "order by p.departamento_codigo" in sql_clean
+        ):
             return self._handle_lista(sql_clean, params)
 
         # ── Detalle de beneficiario ──
@@ -110,6 +174,14 @@ class MockClickHouseClient:
         if "hogares_inseguridad_alimentaria" in sql_clean and "group by" in sql_clean:
             return self._handle_inseguridad_distribucion()
 
+        # ── Jerarquia geografica completa ──
+        if "group by departamento_codigo, municipio_codigo, lugarpoblado_codigo" in sql_clean:
+            return self._handle_jerarquia_geografica()
+
+        # ── Catalogos: todos en una consulta (UNION ALL) ──
+        if "union all" in sql_clean and "as catalogo" in sql_clean:
+            return self._handle_catalogos_batch()
+
         # ── Catalogos: departamentos DISTINCT ──
         if "distinct" in sql_clean and "departamento_codigo" in sql_clean and "departamento" in sql_clean and "pobreza_hogar" in sql_clean:
             if "municipio_codigo" not in sql_clean:
@@ -224,8 +296,7 @@ class MockClickHouseClient:
         if "lugar" in params:
             filtered = [h for h in filtered if h["lugarpoblado_codigo"].strip() == params["lugar"]]
         if "area" in params:
-            term = params["area"].strip("%").lower()
-            filtered = [h for h in filtered if term in h["area"].lower()]
+            filtered = [h for h in filtered if _text_match(params["area"], h["area"])]
         if "sexo" in params:
             filtered = [h for h in filtered if h["sexo_jefe_hogar"].strip().upper() == params["sexo"].upper()]
         if "ipm_min" in params:
@@ -233,22 +304,30 @@ class MockClickHouseClient:
         if "ipm_max" in params:
             filtered = [h for h in filtered if h["ipm_gt"] <= params["ipm_max"]]
         if "ipm_clase" in params:
-            term = params["ipm_clase"].strip("%").lower()
-            filtered = [h for h in filtered if term in h["ipm_gt_clasificacion"].lower()]
+            filtered = [h for h in filtered if _text_match(params["ipm_clase"], h["ipm_gt_clasificacion"])]
         if "pmt_clase" in params:
-            term = params["pmt_clase"].strip("%").lower()
-            filtered = [h for h in filtered if term in h["pmt_clasificacion"].lower()]
+            filtered = [h for h in filtered if _text_match(params["pmt_clase"], h["pmt_clasificacion"])]
         if "nbi_clase" in params:
-            term = params["nbi_clase"].strip("%").lower()
-            filtered = [h for h in filtered if term in h["nbi_clasificacion"].lower()]
+            filtered = [h for h in filtered if _text_match(params["nbi_clase"], h["nbi_clasificacion"])]
         if "anio" in params:
             filtered = [h for h in filtered if h["anio"] == params["anio"]]
         if "fase" in params:
-            term = params["fase"].strip("%").lower()
-            filtered = [h for h in filtered if term in h.get("fase", "").lower()]
-        if "buscar" in params:
-            term = params["buscar"].strip("%").lower()
-            filtered = [h for h in filtered if term in h["nombre_jefe_hogar"].lower() or term in str(h["cui_jefe_hogar"])]
+            filtered = [h for h in filtered if _text_match(params["fase"], h.get("fase", ""))]
+        if "lookup_ids" in params:
+            ids = set(params["lookup_ids"])
+            key = "cui_jefe_hogar" if "cui_jefe_hogar in" in sql_clean else "hogar_id"
+            filtered = [h for h in filtered if h[key] in ids]
+        if "buscar_cui" in params:
+            filtered = [h for h in filtered if h["cui_jefe_hogar"] == params["buscar_cui"]]
+        if "buscar_cui_min" in params:
+            filtered = [
+                h for h in filtered
+                if params["buscar_cui_min"] <= h["cui_jefe_hogar"] <= params["buscar_cui_max"]
+            ]
+        for name, value in params.items():
+            if name.startswith("buscar_nombre_"):
+                term = normalizar_nombre(value.strip("%"))
+                filtered = [h for h in filtered if term in normalizar_nombre(h["nombre_jefe_hogar"])]
 
         # ── Filtros cross-table (vivienda bienes) - detectados por SQL patterns ──
         if "ch_18_bien_hogar_internet" in sql_clean:
@@ -337,22 +416,22 @@ class MockClickHouseClient:
 
         # ── Filtros cross-table (inseguridad) - params-based ──
         if "nivel_inseg" in params:
-            term = params["nivel_inseg"].strip("%").lower()
             hogar_ids = {h["hogar_id"] for h in filtered}
             valid = {i["hogar_id"] for i in self.dataset.inseguridad
-                     if i["hogar_id"] in hogar_ids and term in i.get("nivel_inseguridad_alimentaria", "").lower()}
+                     if i["hogar_id"] in hogar_ids
+                     and _text_match(params["nivel_inseg"], i.get("nivel_inseguridad_alimentaria", ""))}
             filtered = [h for h in filtered if h["hogar_id"] in valid]
 
-        # ── Filtros cross-table (personas via subqueries) - SQL patterns ──
+        # ── Filtros cross-table (personas via semi-joins) - SQL patterns ──
         if "ep.pe1_descripcion" in sql_clean and "'no'" in sql_clean:
-            # con_analfabetismo: EXISTS persona con pe1 = 'no'
+            # con_analfabetismo: hogar con alguna persona con pe1 = 'no'
             hogar_ids = {h["hogar_id"] for h in filtered}
             valid = {p["hogar_id"] for p in self.dataset.personas
                      if p["hogar_id"] in hogar_ids and p.get("pe1_descripcion", "").lower() == "no"}
             filtered = [h for h in filtered if h["hogar_id"] in valid]
 
         if "ep.pe2_descripcion" in sql_clean and "pd8_anios_cumplidos" in sql_clean:
-            # con_menores_sin_escuela: EXISTS persona <18, >=5, pe2='no'
+            # con_menores_sin_escuela: hogar con alguna persona <18, >=5, pe2='no'
             hogar_ids = {h["hogar_id"] for h in filtered}
             valid = set()
             for p in self.dataset.personas:
@@ -362,8 +441,8 @@ class MockClickHouseClient:
                     valid.add(p["hogar_id"])
             filtered = [h for h in filtered if h["hogar_id"] in valid]
 
-        if "not exists" in sql_clean and "ep.ie1_descripcion" in sql_clean:
-            # sin_empleo: NOT EXISTS persona con ie1 LIKE '%trabaj%'
+        if "not in" in sql_clean and "ep.ie1_descripcion" in sql_clean:
+            # sin_empleo: hogar NOT IN personas con ie1 LIKE '%trabaj%'
             hogar_ids = {h["hogar_id"] for h in filtered}
             employed = {p["hogar_id"] for p in self.dataset.personas
                         if p["hogar_id"] in hogar_ids and "trabaj" in p.get("ie1_descripcion", "").lower()}
@@ -382,21 +461,45 @@ class MockClickHouseClient:
     def _handle_consulta_lista(self, sql_clean: str, params: dict) -> MockQueryResult:
         """Lista paginada de beneficios_x_hogar."""
         filtered = self._apply_consulta_filters(self.dataset.beneficios_x_hogar, params, sql_clean)
-        offset = params.get("offset", 0)
-        limit = params.get("limit", 100)
-        page = filtered[offset: offset + limit]
+        page = self._page(filtered, params, ("ig3_departamento_codigo", "ig4_municipio_codigo", "hogar_id"))
 
+        # Columna de la query -> campo del dataset
         base_columns = [
-            "hogar_id", "ig3_departamento", "ig3_departamento_codigo",
-            "ig4_municipio", "ig4_municipio_codigo", "ig5_lugar_poblado",
-            "area", "numero_personas", "hombres", "mujeres",
-            "ipm_gt", "ipm_gt_clasificacion",
+            ("hogar_id", "hogar_id"),
+            ("ig3_departamento", "ig3_departamento"),
+            ("ig3_codigo_departamento", "ig3_departamento_codigo"),
+            ("ig4_municipio", "ig4_municipio"),
+            ("ig4_codigo_municipio", "ig4_municipio_codigo"),
+            ("ig6_lugar_poblado", "ig5_lugar_poblado"),
+            ("ig8_area", "area"),
+            ("personas", "numero_personas"),
+            ("hombres", "hombres"),
+            ("mujeres", "mujeres"),
+            ("ipm_gt", "ipm_gt"),
+            ("ipm_gt_clasificacion", "ipm_gt_clasificacion"),
         ]
-        interv_cols = [c for c in self._ALL_INTERVENTIONS if c in sql_clean]
+        interv_cols = [(c, c) for c in self._ALL_INTERVENTIONS if c in sql_clean]
         columns = base_columns + interv_cols
 
-        rows = [tuple(b.get(c) for c in columns) for b in page]
-        return MockQueryResult(column_names=columns, result_rows=rows)
+        rows = [
+            tuple(b[key].strip() if key.endswith("_codigo") else b.get(key) for _, key in columns)
+            for b in page
+        ]
+        return MockQueryResult(column_names=[name for name, _ in columns], result_rows=rows)
+
+    @staticmethod
+    def _page(filtered: list[dict], params: dict, sort_keys: tuple[str, str, str]) -> list[dict]:
+        """Ordena por (depto, muni, hogar_id) y pagina por cursor (after_*) o por offset; sin limit, todo."""
+        def key(row):
+            return (row[sort_keys[0]].strip(), row[sort_keys[1]].strip(), row[sort_keys[2]])
+
+        ordered = sorted(filtered, key=key)
+        limit = params.get("limit")
+        if "after_hogar" in params:
+            after = (params["after_depto"].strip(), params["after_muni"].strip(), params["after_hogar"])
+            return [row for row in ordered if key(row) > after][:limit]
+        offset = params.get("offset", 0)
+        return ordered[offset: offset + limit if limit is not None else None]
 
     def _handle_consulta_detalle(self, params: dict, sql_clean: str = "") -> MockQueryResult:
         """Detalle de un beneficio por hogar_id."""
@@ -472,9 +575,7 @@ class MockClickHouseClient:
 
     def _handle_lista(self, sql_clean: str, params: dict) -> MockQueryResult:
         filtered = self._apply_filters(self.dataset.hogares, params, sql_clean)
-        offset = params.get("offset", 0)
-        limit = params.get("limit", 100)
-        page = filtered[offset: offset + limit]
+        page = self._page(filtered, params, ("departamento_codigo", "municipio_codigo", "hogar_id"))
 
         columns = [
             "hogar_id", "vivienda_id", "departamento", "departamento_codigo",
@@ -616,6 +717,41 @@ class MockClickHouseClient:
 
         return MockQueryResult(column_names=columns, result_rows=[row])
 
+    def _handle_stats_grouping_sets(self, sql_clean: str, params: dict) -> MockQueryResult:
+        """Filas de (), (departamento) e (ipm_gt_clasificacion) con las claves ajenas en NULL."""
+        filtered = self._apply_filters(self.dataset.hogares, params, sql_clean)
+
+        def aggregate(hogares: list[dict]) -> tuple:
+            total = len(hogares)
+            fem = sum(1 for h in hogares if h["sexo_jefe_hogar"].strip() == "F")
+            return (
+                total,
+                round(sum(h["ipm_gt"] for h in hogares) / total, 4) if total else 0,
+                fem,
+                sum(1 for h in hogares if h["sexo_jefe_hogar"].strip() == "M"),
+                sum(h["numero_personas"] for h in hogares),
+                sum(h["hombres"] for h in hogares),
+                sum(h["mujeres"] for h in hogares),
+            )
+
+        deptos: dict[tuple, list[dict]] = {}
+        ipm_groups: dict[str, list[dict]] = {}
+        for h in filtered:
+            deptos.setdefault((h["departamento"], h["departamento_codigo"].strip()), []).append(h)
+            ipm_groups.setdefault(h["ipm_gt_clasificacion"], []).append(h)
+
+        rows = [(None, None, None, *aggregate(filtered))]
+        rows += [(depto, codigo, None, *aggregate(hs)) for (depto, codigo), hs in deptos.items()]
+        rows += [(None, None, clasif, *aggregate(hs)) for clasif, hs in ipm_groups.items()]
+
+        columns = [
+            "departamento", "departamento_codigo", "ipm_gt_clasificacion",
+            "total_hogares", "ipm_promedio",
+            "hogares_jefatura_femenina", "hogares_jefatura_masculina",
+            "total_personas", "total_hombres", "total_mujeres",
+        ]
+        return MockQueryResult(column_names=columns, result_rows=rows)
+
     def _handle_distribucion_departamentos(self, sql_clean: str, params: dict) -> MockQueryResult:
         filtered = self._apply_filters(self.dataset.hogares, params, sql_clean)
         deptos = {}
@@ -770,6 +906,39 @@ class MockClickHouseClient:
         rows = [(c, n) for c, n in sorted(seen.items())]
         return MockQueryResult(column_names=columns, result_rows=rows)
 
+    def _handle_jerarquia_geografica(self) -> MockQueryResult:
+        seen = {}
+        for h in self.dataset.hogares:
+            key = (h["departamento_codigo"], h["municipio_codigo"], h["lugarpoblado_codigo"])
+            seen.setdefault(key, (h["departamento"], h["municipio"], h["lugar_poblado"]))
+        columns = [
+            "departamento_codigo", "departamento", "municipio_codigo",
+            "municipio", "lugarpoblado_codigo", "lugar_poblado",
+        ]
+        rows = [(d, dn, m, mn, lp, lpn) for (d, m, lp), (dn, mn, lpn) in seen.items()]
+        return MockQueryResult(column_names=columns, result_rows=rows)
+
+    def _handle_catalogos_batch(self) -> MockQueryResult:
+        """Filas (catalogo, codigo, nombre) de todos los catalogos, ordenadas."""
+        sources = {
+            "clasificaciones_ipm": (self.dataset.hogares, "ipm_gt_clasificacion"),
+            "clasificaciones_pmt": (self.dataset.hogares, "pmt_clasificacion"),
+            "clasificaciones_nbi": (self.dataset.hogares, "nbi_clasificacion"),
+            "areas": (self.dataset.hogares, "area"),
+            "niveles_inseguridad": (self.dataset.inseguridad, "nivel_inseguridad_alimentaria"),
+            "fases": (self.dataset.hogares, "fase"),
+            "comunidades_linguisticas": (self.dataset.demograficos, "comunidad_linguistica"),
+            "pueblos": (self.dataset.demograficos, "pueblo_de_pertenencia"),
+            "fuentes_agua": (self.dataset.viviendas, "ch10_descripcion"),
+            "tipos_sanitario": (self.dataset.viviendas, "ch13_descripcion"),
+            "tipos_alumbrado": (self.dataset.viviendas, "ch16_descripcion"),
+            "combustibles_cocina": (self.dataset.viviendas, "ch06_descripcion"),
+        }
+        rows = [("departamentos", c, n) for c, n in self._handle_catalogo_departamentos().result_rows]
+        for key, (records, column) in sources.items():
+            rows += [(key, v, "") for v in set(r.get(column) for r in records) if v]
+        return MockQueryResult(column_names=["catalogo", "codigo", "nombre"], result_rows=sorted(rows))
+
     def _handle_catalogo_distinct(self, sql_clean: str) -> MockQueryResult:
         """Maneja queries DISTINCT para catalogos varios."""
 
@@ -0,0 +1,70 @@
+"""
+Tests de las exportaciones completas de beneficiarios (streaming CSV / Excel write_only).
+No necesitan BD: usan el mock de ClickHouse.
+"""
+from io import BytesIO
+
+import pytest
+from openpyxl import load_workbook
+
+from api.v1.services.beneficiario.export import COLUMNS, generate_csv_streaming, generate_excel_streaming
+from api.v1.services.rsh.codigos import code_width_cache
+from api.v1.services.rsh.mappers import row_to_beneficiario_resumen
+from api.v1.services.rsh.queries import count_beneficiarios, stream_beneficiarios
+from tests.v1.mock_ch_client import MockClickHouseClient
+from tests.v1.rsh_mock_data import RSHMockDataset
+
+
+class StreamingClient(MockClickHouseClient):
+    def __init__(self, dataset):
+        super().__init__(dataset)
+        self.streamed = []
+
+    def query_row_block_stream(self, sql, parameters=None, settings=None):
+        self.streamed.append(sql)
+        return super().query_row_block_stream(sql, parameters, settings)
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    return RSHMockDataset(n_hogares=2500, personas_por_hogar=1)
+
+
+@pytest.fixture
+def client(dataset):
+    code_width_cache.clear()
+    return StreamingClient(dataset)
+
+
+def _resumenes(rows):
+    return (row_to_beneficiario_resumen(r) for r in rows)
+
+
+class TestStreamBeneficiarios:
+    def test_streams_all_rows_without_limit(self, client, dataset):
+        rows = list(stream_beneficiarios(client))
+        assert len(rows) == len(dataset.hogares) == count_beneficiarios(client)
+        assert len(client.streamed) == 1
+        assert "LIMIT" not in client.streamed[0]
+
+    def test_limit_and_filters(self, client, dataset):
+        depto = dataset.hogares[0]["departamento_codigo"].strip()
+        rows = list(stream_beneficiarios(client, limit=5, departamento_codigo=depto))
+        assert len(rows) == 5
+        assert all(r["departamento_codigo"].strip() == depto for r in rows)
+
+
+class TestStreamingFormats:
+    def test_csv_chunks_cover_every_row(self, client, dataset):
+        chunks = list(generate_csv_streaming(_resumenes(stream_beneficiarios(client))))
+        assert len(chunks) > 2
+        lines = b"".join(chunks).decode("utf-8-sig").splitlines()
+        assert lines[0] == ",".join(COLUMNS)
+        assert len(lines) == len(dataset.hogares) + 1
+
+    def test_excel_reports_rows_and_splits_sheets(self, client, dataset):
+        buf, written = generate_excel_streaming(_resumenes(stream_beneficiarios(client)), max_rows_per_sheet=1000)
+        assert written == len(dataset.hogares)
+        wb = load_workbook(BytesIO(buf.read()), read_only=True)
+        assert wb.sheetnames == ["Beneficiarios", "Beneficiarios (2)", "Beneficiarios (3)"]
+        assert sum(len(list(ws.iter_rows())) - 1 for ws in wb.worksheets) == written
@@ -0,0 +1,101 @@
+"""
+Unit tests for the catalog cache (TTL + data-version revalidation) and ETag handling.
+No database needed.
+"""
+from fastapi import FastAPI, Request, Response, status
+from fastapi.testclient import TestClient
+
+from api.v1.middleware.response_wrapper import ResponseWrapperMiddleware
+from api.v1.services.catalogos import CatalogService, etag_matches
+
+
+class VersionedLoader:
+    def __init__(self):
+        self.version = ["v1"]
+        self.payload = {"areas": ["Rural", "Urbana"]}
+        self.loads = 0
+
+    def read_version(self, client):
+        return self.version
+
+    def __call__(self, client):
+        self.loads += 1
+        return dict(self.payload)
+
+
+class TestCatalogService:
+    def test_serves_from_cache_within_ttl(self):
+        loader = VersionedLoader()
+        service = CatalogService(ttl=300, version_reader=loader.read_version)
+        first = service.get("rsh", loader, client=None)
+        second = service.get("rsh", loader, client=None)
+        assert loader.loads == 1
+        assert second.etag == first.etag
+        assert service.stats()["hits"] == 1
+
+    def test_expired_entry_revalidates_without_reload(self):
+        loader = VersionedLoader()
+        service = CatalogService(ttl=0, version_reader=loader.read_version)
+        first = service.get("rsh", loader, client=None)
+        second = service.get("rsh", loader, client=None)
+        assert loader.loads == 1
+        assert second.etag == first.etag
+        assert service.stats()["revalidations"] == 1
+
+    def test_version_change_reloads_and_changes_etag(self):
+        loader = VersionedLoader()
+        service = CatalogService(ttl=0, version_reader=loader.read_version)
+        first = service.get("rsh", loader, client=None)
+        loader.version = ["v2"]
+        loader.payload = {"areas": ["Rural"]}
+        second = service.get("rsh", loader, client=None)
+        assert loader.loads == 2
+        assert second.etag != first.etag
+
+    def test_unreadable_version_reloads(self):
+        loader = VersionedLoader()
+
+        def failing(client):
+            raise RuntimeError("sin system.parts")
+
+        service = CatalogService(ttl=0, version_reader=failing)
+        service.get("rsh", loader, client=None)
+        service.get("rsh", loader, client=None)
+        assert loader.loads == 2
+
+
+def _app(service, loader):
+    app = FastAPI()
+    app.add_middleware(ResponseWrapperMiddleware)
+
+    @app.get("/catalogos")
+    def catalogos(request: Request, response: Response):
+        entry = service.get("rsh", loader, client=None)
+        if etag_matches(request, entry.etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=entry.headers)
+        response.headers.update(entry.headers)
+        return entry.payload
+
+    return TestClient(app)
+
+
+class TestEtag:
+    def test_etag_survives_wrapper_and_returns_304(self):
+        loader = VersionedLoader()
+        client = _app(CatalogService(ttl=300, version_reader=loader.read_version), loader)
+        resp = client.get("/catalogos")
+        assert resp.status_code == 200
+        assert resp.json()["data"] == {"areas": ["Rural", "Urbana"]}
+        etag = resp.headers["etag"]
+        assert resp.headers["cache-control"] == "private, no-cache"
+
+        cached = client.get("/catalogos", headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.content == b""
+        assert cached.headers["etag"] == etag
+
+    def test_stale_etag_gets_full_response(self):
+        loader = VersionedLoader()
+        client = _app(CatalogService(ttl=300, version_reader=loader.read_version), loader)
+        resp = client.get("/catalogos", headers={"If-None-Match": 'W/"otro", "tambien-otro"'})
+        assert resp.status_code == 200
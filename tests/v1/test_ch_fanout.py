@@ -0,0 +1,146 @@
+"""
+Unit tests for concurrent ClickHouse fan-out (query_many) and the dashboard builders using it.
+No database needed.
+"""
+import threading
+import time
+
+import pytest
+
+from api.v1.config import ch_fanout
+from api.v1.config.ch_fanout import query_many
+from api.v1.services.dashboard.queries import query_rsh_global_stats, query_rsh_institutional_stats
+from tests.v1.mock_ch_client import MockQueryResult, grouping_sets_result
+
+
+class SlowClient:
+    """Cliente que tarda `delay` por consulta y registra la concurrencia maxima."""
+
+    def __init__(self, delay=0.05, fail_on=None):
+        self.delay = delay
+        self.fail_on = fail_on
+        self._lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.calls = []
+
+    def query(self, sql, parameters=None, settings=None):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.calls.append((sql, parameters))
+        try:
+            time.sleep(self.delay)
+            if self.fail_on and self.fail_on in sql:
+                raise RuntimeError("boom")
+            return MockQueryResult(column_names=["sql"], result_rows=[(sql,)])
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class TestQueryMany:
+    def test_results_by_key(self):
+        client = SlowClient(delay=0)
+        results = query_many(client, {"a": ("SELECT 1", None), "b": ("SELECT 2", {"x": 1})})
+        assert results["a"].result_rows == [("SELECT 1",)]
+        assert results["b"].result_rows == [("SELECT 2",)]
+        assert ("SELECT 2", {"x": 1}) in client.calls
+
+    def test_runs_concurrently_within_limit(self):
+        client = SlowClient(delay=0.05)
+        queries = {str(i): (f"SELECT {i}", None) for i in range(8)}
+        start = time.monotonic()
+        query_many(client, queries, max_concurrency=4)
+        elapsed = time.monotonic() - start
+        assert client.max_active == 4
+        assert elapsed < 8 * 0.05
+
+    def test_error_propagates(self):
+        client = SlowClient(delay=0, fail_on="SELECT 3")
+        with pytest.raises(RuntimeError, match="boom"):
+            query_many(client, {str(i): (f"SELECT {i}", None) for i in range(5)})
+
+    def test_works_after_shutdown(self):
+        ch_fanout.shutdown()
+        results = query_many(SlowClient(delay=0), {"a": ("SELECT 1", None)})
+        assert results["a"].result_rows == [("SELECT 1",)]
+
+
+class DashboardClient:
+    """Devuelve la pasada GROUPING SETS con dos departamentos; el resto, filas genericas."""
+
+    def __init__(self):
+        self.calls = []
+
+    def query(self, sql, parameters=None, settings=None):
+        self.calls.append(sql)
+        if "GROUPING SETS" in sql:
+            extra = ["bono_x", "total_intervenciones"] if "bono_x" in sql else []
+            return grouping_sets_result([
+                {"cantidad": 10, "cantidad_total": 12, "deptos": 1, "total_hombres": 4, "bono_x": 7,
+                 "total_intervenciones": 7},
+                {"ipm": "Pobre", "cantidad": 6},
+                {"ipm": "No pobre", "cantidad": 4},
+                {"ipm": "", "cantidad": 0},
+                {"nbi": "Con NBI", "cantidad": 10},
+                {"pmt": "Extrema", "cantidad": 3},
+                {"departamento": "Guatemala", "codigo": "01", "cantidad": 10, "cantidad_total": 10,
+                 "bono_x": 7, "total_intervenciones": 7},
+                {"departamento": "Escuintla", "codigo": "05", "cantidad": 0, "cantidad_total": 2},
+                {"departamento": "Guatemala", "codigo": "01", "ipm": "Pobre", "cantidad": 6},
+                {"departamento": "Guatemala", "codigo": "01", "ipm": "No pobre", "cantidad": 4},
+                {"departamento": "Escuintla", "codigo": "05", "ipm": "Pobre", "cantidad": 0},
+                {"departamento": "Guatemala", "codigo": "01", "pmt": "Extrema", "cantidad": 3},
+            ], extra)
+        return MockQueryResult(column_names=["total_hogares", "x"], result_rows=[(10, 1)])
+
+
+class TestDashboardGroupingSets:
+    def test_global_stats_single_scan(self):
+        client = DashboardClient()
+        stats = query_rsh_global_stats(client)
+        assert sum("vw_pobreza_hogars" in sql and "GROUPING SETS" in sql for sql in client.calls) == 1
+        assert stats["total_hogares"] == 10
+        assert stats["total_hombres"] == 4
+        assert stats["por_ipm"] == [
+            {"ipm_gt_clasificacion": "Pobre", "cantidad": 6},
+            {"ipm_gt_clasificacion": "No pobre", "cantidad": 4},
+        ]
+        assert stats["por_nbi"] == [{"clasificacion": "Con NBI", "cantidad": 10}]
+        assert stats["ipm_por_departamento"] == [
+            {"departamento": "Guatemala", "codigo": "01", "clasificacion": "Pobre", "cantidad": 6},
+            {"departamento": "Guatemala", "codigo": "01", "clasificacion": "No pobre", "cantidad": 4},
+        ]
+        assert stats["nbi_por_departamento"] == []
+        for key in ("inseguridad", "beneficiarios_por_institucion", "municipios_finalizados", "total_personas"):
+            assert key in stats
+
+    def test_institutional_stats_with_interventions(self):
+        client = DashboardClient()
+        stats = query_rsh_institutional_stats(
+            client, ["prog_fodes"], intervention_columns=["bono_x"], departamento_codigo="01",
+        )
+        pobreza_sql = next(sql for sql in client.calls if "GROUPING SETS" in sql)
+        assert "countIf(trim(ig3_codigo_departamento) = {depto:String})" in pobreza_sql
+        assert stats["total_hogares"] == 10
+        assert stats["bonos"] == {"bono_x": 7, "total_intervenciones": 7}
+        assert stats["bonos_por_departamento"] == [
+            {"departamento": "Guatemala", "codigo": "01", "bono_x": 7, "total_intervenciones": 7},
+        ]
+        # por_departamento no se acota al departamento filtrado
+        assert stats["por_departamento"] == [
+            {"departamento": "Guatemala", "codigo": "01", "cantidad": 10},
+            {"departamento": "Escuintla", "codigo": "05", "cantidad": 2},
+        ]
+
+    def test_missing_total_row_defaults_to_zero(self):
+        class EmptyClient(DashboardClient):
+            def query(self, sql, parameters=None, settings=None):
+                if "GROUPING SETS" in sql:
+                    return grouping_sets_result([])
+                return super().query(sql, parameters, settings)
+
+        stats = query_rsh_institutional_stats(EmptyClient(), ["prog_fodes"])
+        assert stats["total_hogares"] == 0
+        assert stats["por_departamento"] == []
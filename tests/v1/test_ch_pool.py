@@ -0,0 +1,112 @@
+"""
+Unit tests for the shared (pooled) ClickHouse client.
+No database or ClickHouse server needed.
+"""
+import threading
+
+from urllib3 import PoolManager
+
+from api.v1.config.ch_pool import SharedClickHouseClient
+
+
+class FakeClient:
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.closed = False
+        self.pings = 0
+
+    def ping(self):
+        self.pings += 1
+        return self.healthy
+
+    def close(self):
+        self.closed = True
+
+
+def _factory(clients, pool_mgr=None):
+    def factory():
+        client = FakeClient()
+        clients.append(client)
+        return client, pool_mgr
+    return factory
+
+
+class TestSharedClickHouseClient:
+    def test_client_is_created_once_and_shared(self):
+        clients = []
+        shared = SharedClickHouseClient(_factory(clients), health_interval=0)
+        assert shared.get() is shared.get()
+        assert len(clients) == 1
+        assert clients[0].pings == 0
+
+    def test_failed_health_check_recreates_client(self):
+        clients = []
+        shared = SharedClickHouseClient(_factory(clients), health_interval=1)
+        first = shared.get()
+        first.healthy = False
+        shared._last_check -= 2
+        second = shared.get()
+        assert second is not first
+        assert first.closed
+        assert shared.stats()["health_failures"] == 1
+        assert shared.stats()["clients_created"] == 2
+
+    def test_healthy_client_is_kept(self):
+        clients = []
+        shared = SharedClickHouseClient(_factory(clients), health_interval=1)
+        first = shared.get()
+        shared._last_check -= 2
+        assert shared.get() is first
+        assert first.pings == 1
+
+    def test_close(self):
+        clients = []
+        shared = SharedClickHouseClient(_factory(clients))
+        shared.get()
+        shared.close()
+        assert clients[0].closed
+        assert shared.stats()["active"] is False
+
+    def test_close_clears_pool_manager(self):
+        pool_mgr = PoolManager(maxsize=4)
+        pool_mgr.connection_from_host("ch.local", port=8123, scheme="http")
+        shared = SharedClickHouseClient(_factory([], pool_mgr))
+        shared.get()
+        shared.close()
+        assert len(pool_mgr.pools) == 0
+
+    def test_ping_runs_outside_lock(self):
+        clients = []
+        shared = SharedClickHouseClient(_factory(clients), health_interval=1)
+        first = shared.get()
+        started, release = threading.Event(), threading.Event()
+
+        def slow_ping():
+            started.set()
+            release.wait(5)
+            return True
+
+        first.ping = slow_ping
+        shared._last_check -= 2
+        pinger = threading.Thread(target=shared.get)
+        pinger.start()
+        assert started.wait(5)
+        # Mientras un caller hace el ping, los demas reciben el cliente actual sin esperar
+        assert shared.get() is first
+        release.set()
+        pinger.join(5)
+        assert len(clients) == 1
+
+    def test_pool_stats(self):
+        pool_mgr = PoolManager(maxsize=4)
+        pool_mgr.connection_from_host("ch.local", port=8123, scheme="http")
+        shared = SharedClickHouseClient(_factory([], pool_mgr))
+        shared.get()
+        pools = shared.stats()["pools"]
+        assert pools == [{
+            "host": "ch.local:8123",
+            "maxsize": 4,
+            "connections_created": 0,
+            "idle": 0,
+            "requests": 0,
+        }]
@@ -0,0 +1,158 @@
+"""
+Unit tests for ClickHouse query tracking and cancellation (query_id + KILL QUERY).
+No database needed; the HTTP test uses a minimal FastAPI app.
+"""
+import asyncio
+import time
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from api.v1.config import ch_tracking, database
+from api.v1.config.ch_tracking import (
+    CANCEL_DISCONNECT, CANCEL_TIMEOUT, QueryTracker, TrackedClient, ch_timeout,
+    kill_queries, route_timeout, watch_request,
+)
+from tests.v1.mock_ch_client import MockQueryResult
+
+
+class RecordingClient:
+    def __init__(self):
+        self.calls = []
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def query(self, sql, parameters=None, settings=None):
+        self.calls.append(("query", sql, settings))
+        return MockQueryResult(column_names=["x"], result_rows=[(1,)])
+
+    def query_row_block_stream(self, sql, parameters=None, settings=None):
+        self.calls.append(("stream", sql, settings))
+
+    def command(self, cmd, parameters=None, settings=None):
+        self.calls.append(("command", cmd, parameters))
+
+
+class FakeRequest:
+    def __init__(self, disconnect_after: int | None = None):
+        self.scope = {}
+        self._polls = 0
+        self._disconnect_after = disconnect_after
+
+    async def is_disconnected(self):
+        self._polls += 1
+        return self._disconnect_after is not None and self._polls >= self._disconnect_after
+
+
+@pytest.fixture(autouse=True)
+def _fast_poll(monkeypatch):
+    monkeypatch.setattr(ch_tracking, "CH_DISCONNECT_POLL", 0.01)
+
+
+class TestTrackedClient:
+    def test_each_query_gets_query_id(self):
+        raw = RecordingClient()
+        tracker = QueryTracker()
+        client = TrackedClient(raw, tracker)
+        client.query("SELECT 1", settings={"max_threads": 2})
+        client.query("SELECT 2")
+        ids = [call[2]["query_id"] for call in raw.calls]
+        assert len(set(ids)) == 2
+        assert tracker.query_ids == ids
+        assert raw.calls[0][2]["max_threads"] == 2
+
+    def test_stream_cancels_on_client_close(self):
+        raw = RecordingClient()
+        TrackedClient(raw, QueryTracker()).query_row_block_stream("SELECT 1")
+        assert raw.calls[0][2]["cancel_http_readonly_queries_on_client_close"] == 1
+
+    def test_request_settings_apply_to_every_query(self):
+        raw = RecordingClient()
+        client = TrackedClient(raw, QueryTracker(), {"max_execution_time": 130})
+        client.query("SELECT 1")
+        client.query_row_block_stream("SELECT 2")
+        assert raw.calls[0][2]["max_execution_time"] == 130
+        # Los streams se leen despues de responder: sin limite de la ruta
+        assert "max_execution_time" not in raw.calls[1][2]
+
+    def test_other_attributes_pass_through(self):
+        raw = RecordingClient()
+        TrackedClient(raw, QueryTracker()).close()
+        assert raw.closed
+
+
+class TestKillQueries:
+    def test_kill_by_query_ids(self):
+        raw = RecordingClient()
+        kill_queries(raw, ["a", "b"])
+        kind, sql, params = raw.calls[0]
+        assert kind == "command"
+        assert sql.startswith("KILL QUERY WHERE query_id IN")
+        assert params == {"ids": ["a", "b"]}
+
+    def test_no_ids_no_command(self):
+        raw = RecordingClient()
+        kill_queries(raw, [])
+        assert raw.calls == []
+
+
+class TestWatchRequest:
+    def test_disconnect_kills_issued_queries(self):
+        tracker = QueryTracker()
+        query_id = tracker.new_query_id()
+        killed = []
+        asyncio.run(watch_request(FakeRequest(disconnect_after=2), tracker, None, killed.append))
+        assert tracker.cancelled == CANCEL_DISCONNECT
+        assert killed == [[query_id]]
+
+    def test_timeout_kills_issued_queries(self):
+        tracker = QueryTracker()
+        tracker.new_query_id()
+        killed = []
+        asyncio.run(watch_request(FakeRequest(), tracker, 0.03, killed.append))
+        assert tracker.cancelled == CANCEL_TIMEOUT
+        assert len(killed[0]) == 1
+
+
+class TestRouteTimeout:
+    def test_decorator_and_default(self, monkeypatch):
+        @ch_timeout(30)
+        def endpoint():
+            pass
+
+        class Route:
+            pass
+
+        route = Route()
+        route.endpoint = endpoint
+        request = FakeRequest()
+        request.scope["route"] = route
+        assert route_timeout(request) == 30
+
+        monkeypatch.setattr(ch_tracking, "CH_QUERY_TIMEOUT", 0)
+        assert route_timeout(FakeRequest()) is None
+
+
+class TestGetChClient:
+    def test_timeout_returns_504_and_kills_query(self, monkeypatch):
+        raw = RecordingClient()
+        killed = []
+        monkeypatch.setattr(database, "_open_ch_client", lambda: raw)
+        monkeypatch.setattr(database, "_ch_is_mock", lambda: True)
+        monkeypatch.setattr(database, "_kill_ch_queries", killed.append)
+
+        app = FastAPI()
+
+        @app.get("/slow")
+        @ch_timeout(0.05)
+        def slow(client=Depends(database.get_ch_client)):
+            client.tracker.new_query_id()
+            time.sleep(0.3)
+            raise RuntimeError("Code: 394. QUERY_WAS_CANCELLED")
+
+        response = TestClient(app, raise_server_exceptions=False).get("/slow")
+        assert response.status_code == 504
+        assert len(killed) == 1 and len(killed[0]) == 1
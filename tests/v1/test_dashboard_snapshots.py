@@ -0,0 +1,131 @@
+"""
+Unit tests for materialized dashboard snapshots (watermark-based refresh, disk persistence).
+No database needed.
+"""
+from datetime import timedelta
+
+import pytest
+
+from api.v1.services.dashboard import snapshots
+from api.v1.services.dashboard.snapshots import (
+    DashboardSnapshotStore, institutional_builder, institutional_key,
+)
+from tests.v1.mock_ch_client import MockQueryResult, grouping_sets_result
+
+
+class WatermarkClient:
+    def __init__(self, watermark=("2024-01-01 00:00:00", "100", "3")):
+        self.watermark = watermark
+
+    def query(self, sql, parameters=None, settings=None):
+        if "system.parts" in sql:
+            return MockQueryResult(column_names=["t", "rows", "parts"], result_rows=[self.watermark])
+        if "GROUPING SETS" in sql:
+            return grouping_sets_result([
+                {"cantidad": 8, "cantidad_total": 8},
+                {"departamento": "Guatemala", "codigo": "01", "cantidad": 5, "cantidad_total": 5},
+                {"departamento": "Escuintla", "codigo": "05", "cantidad": 3, "cantidad_total": 3},
+            ])
+        return MockQueryResult(column_names=["total"], result_rows=[(0,)])
+
+
+class CountingBuilder:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, client):
+        self.calls += 1
+        return {"total_hogares": self.calls}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DashboardSnapshotStore(snapshot_dir=str(tmp_path), refresh_interval=0, max_age=3600, database="rsh")
+
+
+class TestDashboardSnapshotStore:
+    def test_first_get_computes_then_serves_snapshot(self, store):
+        builder = CountingBuilder()
+        client = WatermarkClient()
+        first = store.get("global", builder, client)
+        second = store.get("global", builder, client)
+        assert builder.calls == 1
+        assert second is first
+        assert first.payload == {"total_hogares": 1}
+        assert first.generated_at is not None
+        assert store.stats()["hits"] == 1 and store.stats()["misses"] == 1
+
+    def test_refresh_only_when_watermark_moves(self, store):
+        builder = CountingBuilder()
+        client = WatermarkClient()
+        store.get("global", builder, client)
+        assert store.refresh(client) == 0
+        client.watermark = ("2024-02-01 00:00:00", "150", "4")
+        assert store.refresh(client) == 1
+        assert store.get("global", builder, client).payload == {"total_hogares": 2}
+
+    def test_refresh_when_older_than_max_age(self, store):
+        builder = CountingBuilder()
+        client = WatermarkClient()
+        snapshot = store.get("global", builder, client)
+        store._snapshots["global"] = snapshots.DashboardSnapshot(
+            payload=snapshot.payload,
+            generated_at=snapshot.generated_at - timedelta(hours=2),
+            watermark=snapshot.watermark,
+        )
+        assert store.refresh(client) == 1
+
+    def test_snapshot_survives_restart_on_disk(self, store, tmp_path):
+        builder = CountingBuilder()
+        store.get("global", builder, WatermarkClient())
+        restarted = DashboardSnapshotStore(str(tmp_path), refresh_interval=0, max_age=3600, database="rsh")
+        snapshot = restarted.get("global", builder, WatermarkClient())
+        assert builder.calls == 1
+        assert snapshot.payload == {"total_hogares": 1}
+
+    def test_registered_keys_are_precomputed(self, store):
+        builder = CountingBuilder()
+        store.register("global", builder)
+        assert store.refresh(WatermarkClient()) == 1
+        assert builder.calls == 1
+
+
+class TestInstitutionalSnapshots:
+    def test_general_snapshot_registers_departamentos(self, store, monkeypatch):
+        monkeypatch.setattr(snapshots, "dashboard_snapshots", store)
+        monkeypatch.setattr(snapshots, "PRECOMPUTE_DEPARTAMENTOS", True)
+        base = (["prog_fodes"], "OR", [])
+        store.register(institutional_key(*base), institutional_builder(*base))
+        refreshed = store.refresh(WatermarkClient())
+        # general + un snapshot por cada departamento de por_departamento
+        assert refreshed == 3
+        assert institutional_key(*base, "01") in store._snapshots
+        assert institutional_key(*base, "05") in store._snapshots
+
+    def test_unregistered_key_is_computed_on_the_fly(self, store, tmp_path):
+        builder = CountingBuilder()
+        store.get("inst:zzz", builder, WatermarkClient(), register=False)
+        store.get("inst:zzz", builder, WatermarkClient(), register=False)
+        assert builder.calls == 2
+        assert store.stats()["registered"] == 0
+        assert not list(tmp_path.iterdir())
+
+    def test_key_depends_on_departamento(self):
+        base = (["prog_fodes"], "OR", ["bono_x"])
+        assert institutional_key(*base) != institutional_key(*base, "01")
+
+
+def test_departamento_validation_tolerates_missing_geo_tree(monkeypatch):
+    from api.v1.routes import dashboard_routes
+    from api.v1.services.rsh.geografia import GeoHierarchyUnavailable, GeoTree
+
+    tree = GeoTree(departamentos=[{"codigo": "01", "nombre": "Guatemala"}], municipios={}, lugares={}, source="clickhouse")
+    monkeypatch.setattr(dashboard_routes.geo_hierarchy, "tree", lambda client: tree)
+    assert dashboard_routes._departamento_valido(None, "01")
+    assert not dashboard_routes._departamento_valido(None, "GUA")
+
+    def unavailable(client):
+        raise GeoHierarchyUnavailable("caido")
+
+    monkeypatch.setattr(dashboard_routes.geo_hierarchy, "tree", unavailable)
+    assert dashboard_routes._departamento_valido(None, "01")
@@ -0,0 +1,177 @@
+"""
+Unit tests for the asynchronous Query Builder export jobs.
+ClickHouse is replaced by a MagicMock client; files go to a tmp spool dir.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+from uuid import uuid4
+from unittest.mock import MagicMock
+
+import pytest
+
+from api.v1.services.query_engine import export_jobs
+from api.v1.services.query_engine.cache import count_cache
+from api.v1.services.query_engine.export_jobs import ExportJobManager, JOB_DONE, JOB_EXPIRED
+
+
+def _col(name):
+    col = MagicMock()
+    col.column_name = name
+    col.data_type = "INTEGER"
+    return col
+
+
+def _make_ds():
+    ds = MagicMock()
+    ds.id = uuid4()
+    ds.ch_table = "rsh.beneficios_x_hogar"
+    ds.base_filter_columns = []
+    ds.base_filter_logic = "OR"
+    ds.columns_def = [_col("hogar_id")]
+    return ds
+
+
+def _make_client(n_rows, gate=None):
+    client = MagicMock()
+    count_result = MagicMock()
+    count_result.result_rows = [[n_rows]]
+    client.query.return_value = count_result
+
+    def block_stream(sql, parameters=None):
+        if gate is not None:
+            gate.wait(5)
+        stream = MagicMock()
+        stream.source.column_names = ["hogar_id"]
+        stream.__enter__.return_value = stream
+        stream.__iter__.return_value = iter([[(i,) for i in range(n_rows)]])
+        return stream
+
+    client.query_row_block_stream.side_effect = block_stream
+    return client
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    count_cache.clear()
+    mgr = ExportJobManager(
+        spool_dir=str(tmp_path), max_workers=1, max_pending=5,
+        max_spool_bytes=10 * 1024 * 1024, retention=3600,
+    )
+    yield mgr
+    mgr.shutdown()
+    count_cache.clear()
+
+
+def _use_client(monkeypatch, client):
+    @contextmanager
+    def session():
+        yield client
+    monkeypatch.setattr(export_jobs, "ch_client_session", session)
+
+
+def _wait(job, timeout=5):
+    deadline = time.time() + timeout
+    while job.finished_at is None and time.time() < deadline:
+        time.sleep(0.01)
+
+
+META = [{"column_name": "hogar_id", "label": "Hogar", "data_type": "INTEGER"}]
+
+
+def _submit(manager, ds, user_id, formato="csv"):
+    return manager.submit(
+        user_id, ds, ds.columns_def, [], None, None, META, formato, "Consulta", f"consulta.{formato}",
+    )
+
+
+def test_csv_job_writes_spool_file(manager, monkeypatch):
+    _use_client(monkeypatch, _make_client(3))
+    job = _submit(manager, _make_ds(), uuid4())
+    _wait(job)
+
+    assert job.status == JOB_DONE
+    assert job.rows_written == 3
+    assert job.total_rows == 3
+    assert job.progress == 1.0
+    with open(job.path, encoding="utf-8-sig") as f:
+        assert f.read().split("\n")[:2] == ["Hogar", "0"]
+
+
+def test_identical_requests_share_job(manager, monkeypatch):
+    gate = threading.Event()
+    _use_client(monkeypatch, _make_client(2, gate=gate))
+    ds = _make_ds()
+    user_a, user_b = uuid4(), uuid4()
+
+    first = _submit(manager, ds, user_a)
+    second = _submit(manager, ds, user_b)
+    gate.set()
+    _wait(first)
+
+    assert first is second
+    assert first.user_ids == {user_a, user_b}
+
+
+def test_spool_budget_expires_oldest(manager, monkeypatch):
+    _use_client(monkeypatch, _make_client(50))
+    manager.max_spool_bytes = 1
+
+    job = _submit(manager, _make_ds(), uuid4())
+    _wait(job)
+    manager.cleanup()
+
+    assert job.status == JOB_EXPIRED
+    assert job.path is None
+
+
+def test_cleanup_removes_orphan_spool_files(manager, tmp_path):
+    orphan = tmp_path / f"{uuid4().hex}.csv"
+    orphan.write_bytes(b"x" * 10)
+    other = tmp_path / "notas.txt"
+    other.write_text("no es de un job")
+
+    manager.cleanup()
+
+    assert not orphan.exists()
+    assert other.exists()
+
+
+def test_cleanup_keeps_file_while_downloading(manager, monkeypatch):
+    _use_client(monkeypatch, _make_client(50))
+    job = _submit(manager, _make_ds(), uuid4())
+    _wait(job)
+
+    path = manager.acquire_download(job)
+    manager.max_spool_bytes = 1
+    manager.cleanup()
+    assert job.status == JOB_DONE
+    assert os.path.exists(path)
+
+    manager.release_download(job.id)
+    manager.cleanup()
+    assert job.status == JOB_EXPIRED
+    assert not os.path.exists(path)
+    assert manager.acquire_download(job) is None
+
+
+def test_jobs_run_after_shutdown(manager, monkeypatch):
+    _use_client(monkeypatch, _make_client(2))
+    manager.shutdown()
+    job = _submit(manager, _make_ds(), uuid4())
+    _wait(job)
+    assert job.status == JOB_DONE
+
+
+def test_finished_job_is_not_reused(manager, monkeypatch):
+    _use_client(monkeypatch, _make_client(2))
+    ds = _make_ds()
+    first = _submit(manager, ds, uuid4())
+    _wait(first)
+    second = _submit(manager, ds, uuid4())
+    _wait(second)
+
+    assert second is not first
+    assert first.status == second.status == JOB_DONE
+    assert first.path != second.path
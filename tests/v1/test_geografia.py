@@ -0,0 +1,104 @@
+"""
+Unit tests for the in-memory geographic hierarchy (cascade lookups).
+No database needed.
+"""
+import pytest
+
+from api.v1.services.rsh.geografia import (
+    SOURCE_CLICKHOUSE, GeoHierarchy, GeoHierarchyUnavailable, build_geo_tree,
+)
+from tests.v1.mock_ch_client import MockClickHouseClient
+from tests.v1.rsh_mock_data import RSHMockDataset
+
+
+class CountingClient(MockClickHouseClient):
+    def __init__(self, dataset):
+        super().__init__(dataset)
+        self.tree_queries = 0
+        self.fail = False
+
+    def query(self, sql, parameters=None, settings=None):
+        if "lugarpoblado_codigo" in sql and "GROUP BY" in sql:
+            if self.fail:
+                raise ConnectionError("clickhouse caido")
+            self.tree_queries += 1
+        return super().query(sql, parameters, settings)
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    return RSHMockDataset(n_hogares=300, personas_por_hogar=2)
+
+
+@pytest.fixture
+def client(dataset):
+    return CountingClient(dataset)
+
+
+@pytest.fixture
+def hierarchy(client):
+    return GeoHierarchy(refresh_interval=0, retry_interval=60, version_reader=lambda c: ["v1"])
+
+
+class TestGeoHierarchy:
+    def test_cascade_matches_dataset_and_loads_once(self, hierarchy, client, dataset):
+        hogar = dataset.hogares[0]
+        municipios = hierarchy.municipios(client, hogar["departamento_codigo"])
+        esperados = sorted({
+            h["municipio_codigo"].strip() for h in dataset.hogares
+            if h["departamento_codigo"] == hogar["departamento_codigo"]
+        })
+        assert [m["codigo"] for m in municipios] == esperados
+        lugares = hierarchy.lugares_poblados(client, hogar["municipio_codigo"] + "  ")
+        assert hogar["lugarpoblado_codigo"].strip() in [lp["codigo"] for lp in lugares]
+        assert client.tree_queries == 1
+        assert hierarchy.stats()["source"] == SOURCE_CLICKHOUSE
+
+    def test_unknown_code_returns_empty(self, hierarchy, client):
+        assert hierarchy.municipios(client, "ZZ") == []
+
+    def test_refresh_only_when_version_changes(self, client):
+        version = ["v1"]
+        hierarchy = GeoHierarchy(refresh_interval=0, retry_interval=60, version_reader=lambda c: list(version))
+        assert hierarchy.refresh(client) is True
+        assert hierarchy.refresh(client) is False
+        version[0] = "v2"
+        assert hierarchy.refresh(client) is True
+        assert client.tree_queries == 2
+
+    def test_unavailable_without_a_loaded_tree(self, hierarchy, client):
+        client.fail = True
+        with pytest.raises(GeoHierarchyUnavailable):
+            hierarchy.municipios(client, "01")
+        assert hierarchy.stats()["source"] is None
+        # No reintenta en cada request mientras no venza el reintento
+        client.fail = False
+        with pytest.raises(GeoHierarchyUnavailable):
+            hierarchy.municipios(client, "01")
+        assert client.tree_queries == 0
+        hierarchy._retry_at = 0.0
+        assert hierarchy.municipios(client, "ZZ") == []
+        assert client.tree_queries == 1
+
+    def test_failed_reload_keeps_previous_tree(self, client, dataset):
+        version = ["v1"]
+        hierarchy = GeoHierarchy(refresh_interval=0, retry_interval=60, version_reader=lambda c: list(version))
+        hierarchy.refresh(client)
+        client.fail = True
+        version[0] = "v2"
+        hierarchy.refresh(client)
+        depto = dataset.hogares[0]["departamento_codigo"]
+        assert hierarchy.municipios(client, depto)
+        assert hierarchy.stats()["source"] == SOURCE_CLICKHOUSE
+
+
+def test_build_geo_tree_strips_fixedstring_padding():
+    tree = build_geo_tree([
+        {"departamento_codigo": "01\x00", "departamento": "Guatemala", "municipio_codigo": "0101 ",
+         "municipio": "Guatemala", "lugarpoblado_codigo": b"010101", "lugar_poblado": "Zona 1"},
+        {"departamento_codigo": "01", "departamento": "Guatemala", "municipio_codigo": "",
+         "municipio": "", "lugarpoblado_codigo": "", "lugar_poblado": ""},
+    ])
+    assert tree.departamentos == [{"codigo": "01", "nombre": "Guatemala"}]
+    assert tree.municipios == {"01": [{"codigo": "0101", "nombre": "Guatemala"}]}
+    assert tree.lugares == {"0101": [{"codigo": "010101", "nombre": "Zona 1"}]}
@@ -0,0 +1,115 @@
+"""
+Tests de paginacion por cursor (keyset) para las listas de beneficiarios y consulta.
+No necesitan BD: usan el mock de ClickHouse.
+"""
+import pytest
+
+from api.v1.services.consulta.queries import CONSULTA_SORT_KEYS, query_consulta_lista
+from api.v1.services.paginacion import decode_cursor, encode_cursor, keyset_condition, next_cursor
+from api.v1.services.rsh.codigos import code_width_cache
+from api.v1.services.rsh.queries import (
+    BENEFICIARIOS_CURSOR_TYPES,
+    BENEFICIARIOS_SORT_KEYS,
+    query_beneficiarios_lista,
+)
+from tests.v1.mock_ch_client import MockClickHouseClient
+from tests.v1.rsh_mock_data import RSHMockDataset
+
+
+class RecordingClient(MockClickHouseClient):
+    def __init__(self, dataset):
+        super().__init__(dataset)
+        self.sqls = []
+
+    def query(self, sql, parameters=None, settings=None):
+        self.sqls.append(sql)
+        return super().query(sql, parameters, settings)
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    return RSHMockDataset(n_hogares=120, personas_por_hogar=2)
+
+
+@pytest.fixture
+def client(dataset):
+    code_width_cache.clear()
+    return RecordingClient(dataset)
+
+
+def _walk(fetch, limit, sort_keys, types):
+    """Recorre todas las paginas siguiendo next_cursor."""
+    seen, cursor = [], None
+    while True:
+        rows, total = fetch(limit=limit, cursor=decode_cursor(cursor, types) if cursor else None)
+        seen += rows
+        cursor = next_cursor(rows, limit, sort_keys)
+        if cursor is None:
+            return seen, total
+
+
+class TestCursor:
+    def test_roundtrip(self):
+        cursor = encode_cursor(["01", "0101", 123])
+        assert decode_cursor(cursor, (str, str, int)) == ["01", "0101", 123]
+
+    @pytest.mark.parametrize("cursor", ["%%%", encode_cursor(["01", "0101"]), encode_cursor(["01", "0101", "x"])])
+    def test_invalid_cursor(self, cursor):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor, (str, str, int))
+
+    def test_last_page_has_no_cursor(self):
+        assert next_cursor([{"a": 1}], 2, ("a",)) is None
+        assert next_cursor([{"a": 1}, {"a": 2}], 2, ("a",)) == encode_cursor([2])
+
+    def test_keyset_condition_expands_per_column(self):
+        condition, params = keyset_condition([
+            ("a", "{a:String}", {"a": "x"}),
+            ("b", "{b:Int64}", {"b": 1}),
+        ])
+        assert condition == "(a > {a:String} OR (a = {a:String} AND b > {b:Int64}))"
+        assert params == {"a": "x", "b": 1}
+
+
+class TestBeneficiariosKeyset:
+    def test_cursor_pages_match_offset_order(self, client):
+        offset_rows, total = query_beneficiarios_lista(client, limit=500)
+        seen, cursor_total = _walk(
+            lambda **kw: query_beneficiarios_lista(client, **kw),
+            25, BENEFICIARIOS_SORT_KEYS, BENEFICIARIOS_CURSOR_TYPES,
+        )
+        assert cursor_total == total
+        assert [r["hogar_id"] for r in seen] == [r["hogar_id"] for r in offset_rows]
+
+    def test_cursor_query_has_no_offset(self, client):
+        rows, _ = query_beneficiarios_lista(client, limit=10)
+        after = decode_cursor(next_cursor(rows, 10, BENEFICIARIOS_SORT_KEYS), BENEFICIARIOS_CURSOR_TYPES)
+        client.sqls.clear()
+        query_beneficiarios_lista(client, limit=10, cursor=after, area="rural")
+        data_sql = client.sqls[-1]
+        assert "OFFSET" not in data_sql
+        assert "p.hogar_id > {after_hogar:Int64}" in data_sql
+
+
+class TestConsultaKeyset:
+    def test_cursor_pages_match_offset_order(self, client):
+        args = (["prog_fodes"], "OR", ["estufa_mejorada", "ecofiltro"])
+        offset_rows, total = query_consulta_lista(client, *args, limit=500)
+        seen, cursor_total = _walk(
+            lambda **kw: query_consulta_lista(client, *args, **kw),
+            10, CONSULTA_SORT_KEYS, (str, str, int),
+        )
+        assert cursor_total == total > 0
+        assert [r["hogar_id"] for r in seen] == [r["hogar_id"] for r in offset_rows]
+
+    def test_keyset_uses_qualified_columns(self, client):
+        args = (["prog_fodes"], "OR", ["estufa_mejorada", "ecofiltro"])
+        rows, _ = query_consulta_lista(client, *args, limit=5)
+        after = decode_cursor(next_cursor(rows, 5, CONSULTA_SORT_KEYS), (str, str, int))
+        client.sqls.clear()
+        query_consulta_lista(client, *args, limit=5, cursor=after)
+        data_sql = client.sqls[-1]
+        # El alias del SELECT (trim) no debe reemplazar a la columna en ORDER BY ni en el keyset
+        assert "ORDER BY b.ig3_codigo_departamento, b.ig4_codigo_municipio, b.hogar_id" in data_sql
+        assert "b.hogar_id > {after_hogar:Int64}" in data_sql
+        assert " ig3_codigo_departamento >" not in data_sql
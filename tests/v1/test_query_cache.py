@@ -0,0 +1,138 @@
+"""
+Unit tests for the in-process Query Builder caches.
+No database or HTTP client needed.
+"""
+import pytest
+from uuid import uuid4
+from unittest.mock import MagicMock
+
+from api.v1.services.query_engine.cache import (
+    TTLCache, cached_result, count_cache, result_cache, invalidate_datasource,
+    query_fingerprint, normalize_filters,
+)
+from api.v1.services.query_engine.metadata import MetadataCache
+from api.v1.models.data_source import ColumnDataType, ColumnCategory
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    count_cache.clear()
+    result_cache.clear()
+    yield
+    count_cache.clear()
+    result_cache.clear()
+
+
+class TestTTLCache:
+    def test_hit_and_miss_counters(self):
+        cache = TTLCache(max_entries=10, ttl=60)
+        assert cache.get("a") is None
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+    def test_lru_eviction_by_entries(self):
+        cache = TTLCache(max_entries=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # "b" queda como el menos usado
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.stats()["evictions"] == 1
+
+    def test_expired_entry_is_a_miss(self):
+        cache = TTLCache(max_entries=10, ttl=0)
+        cache.set("a", 1)
+        assert cache.get("a") is None
+        assert cache.get("a", max_age=60) == 1
+
+    def test_memory_budget_evicts_oldest(self):
+        cache = TTLCache(max_entries=10, ttl=60, max_bytes=100)
+        cache.set("a", 1, size=60)
+        cache.set("b", 2, size=60)
+        assert cache.get("a") is None
+        assert cache.get("b") == 2
+        assert cache.stats()["bytes"] == 60
+
+    def test_entry_larger_than_budget_not_stored(self):
+        cache = TTLCache(max_entries=10, ttl=60, max_bytes=100)
+        cache.set("a", 1, size=500)
+        assert cache.stats()["entries"] == 0
+
+    def test_invalidate_tag(self):
+        cache = TTLCache(max_entries=10, ttl=60)
+        cache.set("a", 1, tag="ds1")
+        cache.set("b", 2, tag="ds2")
+        assert cache.invalidate_tag("ds1") == 1
+        assert cache.get("a") is None
+        assert cache.get("b") == 2
+
+
+class TestResultCache:
+    def test_cached_result_computes_once(self):
+        compute = MagicMock(return_value=([{"hogar_id": 1}], 1, None))
+        first = cached_result("k", "ds1", compute)
+        second = cached_result("k", "ds1", compute)
+        assert first == second
+        assert compute.call_count == 1
+
+    def test_invalidate_datasource_clears_results_and_counts(self):
+        cached_result("k", "ds1", lambda: ([], 0, None))
+        count_cache.set("c", (10, True), tag="ds1")
+        invalidate_datasource("ds1")
+        assert result_cache.get("k") is None
+        assert count_cache.get("c") is None
+
+    def test_fingerprint_ignores_filter_order(self):
+        f1 = {"column": "a", "op": "eq", "value": 1}
+        f2 = {"column": "b", "op": "eq", "value": 2}
+        assert query_fingerprint(normalize_filters([f1, f2])) == query_fingerprint(normalize_filters([f2, f1]))
+
+
+class TestMetadataCache:
+    def _make_db(self, ds_id, role_id):
+        col = MagicMock()
+        col.column_name = "hogar_id"
+        col.data_type = ColumnDataType.INTEGER
+        col.category = ColumnCategory.DIMENSION
+        col.display_order = 1
+        ds = MagicMock()
+        ds.id = ds_id
+        ds.base_filter_columns = ["prog_fodes"]
+        ds.base_filter_logic = "OR"
+        ds.institution_id = None
+        ds.columns_def = [col]
+
+        db = MagicMock()
+        ds_query = MagicMock()
+        ds_query.options.return_value.filter.return_value.all.return_value = [ds]
+        grants_query = MagicMock()
+        grants_query.all.return_value = [(role_id, ds_id)]
+        db.query.side_effect = lambda *args: grants_query if len(args) == 2 else ds_query
+        return db
+
+    def test_hot_path_does_not_query_db(self):
+        ds_id, role_id = uuid4(), uuid4()
+        db = self._make_db(ds_id, role_id)
+        cache = MetadataCache(ttl=300)
+
+        snap = cache.get_datasource(db, ds_id)
+        calls = db.query.call_count
+        assert cache.get_datasource(db, ds_id) is snap
+        assert ds_id in cache.role_datasource_ids(db, role_id)
+        assert db.query.call_count == calls
+        assert snap.columns_def[0].column_name == "hogar_id"
+        assert snap.base_filter_columns == ["prog_fodes"]
+
+    def test_bump_forces_reload(self):
+        ds_id, role_id = uuid4(), uuid4()
+        db = self._make_db(ds_id, role_id)
+        cache = MetadataCache(ttl=300)
+
+        cache.list_datasources(db)
+        cache.bump()
+        cache.list_datasources(db)
+        assert cache.loads == 2
@@ -7,7 +7,11 @@ from unittest.mock import MagicMock
 from fastapi import HTTPException
 
 from api.v1.services.query_engine.validators import validate_columns, validate_filters, validate_group_by, validate_aggregations
-from api.v1.services.query_engine.engine import build_select, build_select_grouped, build_group_by, build_where, execute_query
+from api.v1.services.query_engine import engine
+from api.v1.services.query_engine.engine import build_select, build_select_grouped, build_group_by, build_where, execute_query, execute_query_keyset, stream_query
+from api.v1.services.query_engine.cursor import encode_cursor, decode_cursor
+from api.v1.services.query_engine.cache import count_cache
+from api.v1.services.query_engine.export import generate_csv_streaming, generate_excel
 from api.v1.models.data_source import ColumnDataType, ColumnCategory
 
 
@@ -15,7 +19,7 @@ from api.v1.models.data_source import ColumnDataType, ColumnCategory
 
 def _make_col(name, label=None, data_type=ColumnDataType.TEXT,
               category=ColumnCategory.DIMENSION,
-              is_selectable=True, is_filterable=True, is_groupable=False):
+              is_selectable=True, is_filterable=True, is_groupable=False, is_unique_key=False):
     col = MagicMock()
     col.column_name = name
     col.label = label or name.replace("_", " ").title()
@@ -24,12 +28,30 @@ def _make_col(name, label=None, data_type=ColumnDataType.TEXT,
     col.is_selectable = is_selectable
     col.is_filterable = is_filterable
     col.is_groupable = is_groupable
+    col.is_unique_key = is_unique_key
     col.display_order = 0
     return col
 
 
+def _make_page_client(count, rows, col_names):
+    """Cliente mock: una sola query devuelve la pagina con el total en la columna _total."""
+    client = MagicMock()
+    data_result = MagicMock()
+    data_result.column_names = list(col_names) + ["_total"]
+    data_result.result_rows = [list(r) + [count] for r in rows]
+    client.query = MagicMock(return_value=data_result)
+    return client
+
+
+@pytest.fixture(autouse=True)
+def _clear_count_cache():
+    count_cache.clear()
+    yield
+    count_cache.clear()
+
+
 SAMPLE_COLUMNS = [
-    _make_col("hogar_id", data_type=ColumnDataType.INTEGER),
+    _make_col("hogar_id", data_type=ColumnDataType.INTEGER, is_unique_key=True),
     _make_col("departamento"),
     _make_col("municipio"),
     _make_col("estufa_mejorada", data_type=ColumnDataType.BOOLEAN,
@@ -166,6 +188,13 @@ class TestBuildWhere:
         assert params["p_0_1"] == "02"
         assert params["p_0_2"] == "03"
 
+    def test_large_in_filter_uses_array_param(self, monkeypatch):
+        monkeypatch.setattr(engine, "IN_ARRAY_THRESHOLD", 2)
+        filters = [{"column": "hogar_id", "op": "in", "value": [1, 2, 3]}]
+        where, params = build_where(None, None, filters, self._col_map())
+        assert where == "hogar_id IN {p_0:Array(Int64)}"
+        assert params == {"p_0": [1, 2, 3]}
+
     def test_base_filter_plus_user_filters(self):
         filters = [{"column": "departamento", "op": "eq", "value": "01"}]
         where, params = build_where(["prog_fodes"], "OR", filters, self._col_map())
@@ -190,14 +219,11 @@ class TestExecuteQuery:
         return ds
 
     def _make_ch_client(self, count=42, rows=None, col_names=None):
-        client = MagicMock()
-        count_result = MagicMock()
-        count_result.result_rows = [[count]]
-        data_result = MagicMock()
-        data_result.column_names = col_names or ["hogar_id", "departamento"]
-        data_result.result_rows = rows or [[1, "Guatemala"], [2, "Escuintla"]]
-        client.query = MagicMock(side_effect=[count_result, data_result])
-        return client
+        return _make_page_client(
+            count,
+            rows or [[1, "Guatemala"], [2, "Escuintla"]],
+            col_names or ["hogar_id", "departamento"],
+        )
 
     def test_returns_rows_and_total(self):
         ds = self._make_ds()
@@ -211,21 +237,66 @@ class TestExecuteQuery:
         assert rows[0]["hogar_id"] == 1
         assert rows[0]["departamento"] == "Guat"
 
-    def test_calls_count_and_data_queries(self):
+    def test_count_and_page_in_single_round_trip(self):
         ds = self._make_ds(base_filter_columns=["prog_fodes"])
-        ch = self._make_ch_client()
+        ch = self._make_ch_client(count=42, rows=[[1]], col_names=["hogar_id"])
         cols = [_make_col("hogar_id", data_type=ColumnDataType.INTEGER)]
 
-        execute_query(ch, ds, cols, [], 0, 20)
+        rows, total = execute_query(ch, ds, cols, [], 0, 20)
 
-        assert ch.query.call_count == 2
-        count_sql = ch.query.call_args_list[0][0][0]
-        data_sql = ch.query.call_args_list[1][0][0]
-        assert "count()" in count_sql
-        assert "prog_fodes = 1" in count_sql
-        assert "SELECT hogar_id" in data_sql
+        assert ch.query.call_count == 1
+        data_sql = ch.query.call_args_list[0][0][0]
+        assert "WITH (SELECT count() FROM rsh.beneficios_x_hogar WHERE prog_fodes = 1) AS _total" in data_sql
+        assert "SELECT hogar_id, _total" in data_sql
         assert "LIMIT" in data_sql
         assert "OFFSET" in data_sql
+        assert total == 42
+        assert rows == [{"hogar_id": 1}]
+
+    def test_cached_total_skips_count(self):
+        ds = self._make_ds()
+        cols = [_make_col("hogar_id", data_type=ColumnDataType.INTEGER)]
+        execute_query(self._make_ch_client(count=42, rows=[[1]], col_names=["hogar_id"]), ds, cols, [], 0, 20)
+
+        ch = MagicMock()
+        data_result = MagicMock()
+        data_result.column_names = ["hogar_id"]
+        data_result.result_rows = [[21]]
+        ch.query = MagicMock(return_value=data_result)
+        rows, total = execute_query(ch, ds, cols, [], 20, 20)
+
+        assert total == 42
+        assert "_total" not in ch.query.call_args_list[0][0][0]
+
+    def test_count_mode_none_skips_total(self):
+        ds = self._make_ds()
+        ch = MagicMock()
+        data_result = MagicMock()
+        data_result.column_names = ["hogar_id"]
+        data_result.result_rows = [[1]]
+        ch.query = MagicMock(return_value=data_result)
+        cols = [_make_col("hogar_id", data_type=ColumnDataType.INTEGER)]
+
+        rows, total = execute_query(ch, ds, cols, [], 0, 20, count_mode="none")
+
+        assert total is None
+        assert "count()" not in ch.query.call_args_list[0][0][0]
+
+    def test_empty_page_falls_back_to_count(self):
+        ds = self._make_ds()
+        ch = MagicMock()
+        empty = MagicMock()
+        empty.column_names = ["hogar_id", "_total"]
+        empty.result_rows = []
+        count_result = MagicMock()
+        count_result.result_rows = [[7]]
+        ch.query = MagicMock(side_effect=[empty, count_result])
+        cols = [_make_col("hogar_id", data_type=ColumnDataType.INTEGER)]
+
+        rows, total = execute_query(ch, ds, cols, [], 100, 20)
+
+        assert rows == []
+        assert total == 7
 
     def test_passes_offset_and_limit(self):
         ds = self._make_ds()
@@ -234,7 +305,7 @@ class TestExecuteQuery:
 
         execute_query(ch, ds, cols, [], 40, 20)
 
-        params = ch.query.call_args_list[1][1]["parameters"]
+        params = ch.query.call_args_list[0][1]["parameters"]
         assert params["_offset"] == 40
         assert params["_limit"] == 20
 
@@ -297,14 +368,11 @@ class TestExecuteQueryGroupBy:
         return ds
 
     def _make_ch_client(self, count=42, rows=None, col_names=None):
-        client = MagicMock()
-        count_result = MagicMock()
-        count_result.result_rows = [[count]]
-        data_result = MagicMock()
-        data_result.column_names = col_names or ["hogar_id", "departamento"]
-        data_result.result_rows = rows or [[1, "Guatemala"], [2, "Escuintla"]]
-        client.query = MagicMock(side_effect=[count_result, data_result])
-        return client
+        return _make_page_client(
+            count,
+            rows or [[1, "Guatemala"], [2, "Escuintla"]],
+            col_names or ["hogar_id", "departamento"],
+        )
 
     def test_execute_with_group_by(self):
         ds = self._make_ds()
@@ -323,13 +391,203 @@ class TestExecuteQueryGroupBy:
 
         assert total == 3
         assert len(rows) == 3
-        # Verify GROUP BY in SQL
-        count_sql = ch.query.call_args_list[0][0][0]
-        assert "GROUP BY" in count_sql
-        data_sql = ch.query.call_args_list[1][0][0]
+        # Verify GROUP BY in SQL (count de grupos como subconsulta escalar)
+        data_sql = ch.query.call_args_list[0][0][0]
+        assert "WITH (SELECT count() FROM (SELECT departamento FROM" in data_sql
         assert "GROUP BY departamento" in data_sql
         assert "COUNT(*)" in data_sql
 
+    def test_approx_grouped_count_uses_uniq(self):
+        ds = self._make_ds()
+        ch = self._make_ch_client(count=3, rows=[["Guatemala", 100]], col_names=["departamento", "count"])
+
+        execute_query(
+            ch, ds, [_make_col("departamento")], [], 0, 10,
+            group_by=["departamento"],
+            aggregations=[{"column": "*", "function": "COUNT"}],
+            count_mode="approx",
+        )
+
+        data_sql = ch.query.call_args_list[0][0][0]
+        assert "WITH (SELECT uniq(departamento) FROM rsh.beneficios_x_hogar" in data_sql
+
+
+# ==================== keyset pagination ====================
+
+class TestExecuteQueryKeyset:
+    def _make_ds(self):
+        ds = MagicMock()
+        ds.ch_table = "rsh.beneficios_x_hogar"
+        ds.base_filter_columns = []
+        ds.base_filter_logic = "OR"
+        ds.columns_def = SAMPLE_COLUMNS
+        return ds
+
+    def _make_ch_client(self, count, rows, col_names):
+        return _make_page_client(count, rows, col_names)
+
+    def test_first_page_returns_cursor_and_hides_key(self):
+        ds = self._make_ds()
+        ch = self._make_ch_client(
+            5,
+            [["Guatemala", 1], ["Guatemala", 2], ["Escuintla", 3]],
+            ["departamento", "hogar_id"],
+        )
+        cols = [_make_col("departamento")]
+
+        rows, total, next_cursor = execute_query_keyset(ch, ds, cols, [], 2)
+
+        assert total == 5
+        assert rows == [{"departamento": "Guatemala"}, {"departamento": "Guatemala"}]
+        assert decode_cursor(next_cursor, ["hogar_id"]) == [2]
+        data_sql = ch.query.call_args_list[0][0][0]
+        params = ch.query.call_args_list[0][1]["parameters"]
+        assert "SELECT departamento, hogar_id, _total" in data_sql
+        assert "ORDER BY hogar_id LIMIT" in data_sql
+        assert "OFFSET" not in data_sql
+        assert params["_limit"] == 3
+
+    def test_cursor_adds_tuple_condition(self):
+        ds = self._make_ds()
+        ch = self._make_ch_client(5, [["Escuintla", 3]], ["departamento", "hogar_id"])
+        cols = [_make_col("departamento")]
+        cursor = encode_cursor(["hogar_id"], [2])
+
+        rows, _, next_cursor = execute_query_keyset(ch, ds, cols, [], 2, cursor)
+
+        assert next_cursor is None
+        assert len(rows) == 1
+        data_sql = ch.query.call_args_list[0][0][0]
+        params = ch.query.call_args_list[0][1]["parameters"]
+        assert "(hogar_id) > ({_k_0:Int64})" in data_sql
+        assert params["_k_0"] == 2
+
+    def test_cursor_from_other_query_rejected(self):
+        ds = self._make_ds()
+        ch = MagicMock()
+        cursor = encode_cursor(["municipio", "hogar_id"], ["x", 1])
+
+        with pytest.raises(ValueError):
+            execute_query_keyset(ch, ds, [_make_col("departamento")], [], 2, cursor)
+
+    def test_datasource_without_unique_key_rejected(self):
+        ds = self._make_ds()
+        ds.columns_def = [c for c in SAMPLE_COLUMNS if not c.is_unique_key]
+
+        with pytest.raises(ValueError):
+            execute_query_keyset(MagicMock(), ds, [_make_col("departamento")], [], 2)
+
+    def test_composite_key_orders_by_all_key_columns(self):
+        ds = self._make_ds()
+        ds.columns_def = SAMPLE_COLUMNS + [
+            _make_col("personas_id", data_type=ColumnDataType.INTEGER, is_unique_key=True),
+        ]
+        ch = self._make_ch_client(1, [["Guatemala", 1, 10]], ["departamento", "hogar_id", "personas_id"])
+
+        execute_query_keyset(ch, ds, [_make_col("departamento")], [], 2)
+
+        assert "ORDER BY hogar_id, personas_id LIMIT" in ch.query.call_args_list[0][0][0]
+
+    def test_garbage_cursor_rejected(self):
+        with pytest.raises(ValueError):
+            decode_cursor("%%%not-base64", ["hogar_id"])
+
+    def test_grouped_orders_by_group_tuple(self):
+        ds = self._make_ds()
+        ch = self._make_ch_client(1, [["Guatemala", "Mixco", 7]], ["departamento", "municipio", "count"])
+
+        rows, _, _ = execute_query_keyset(
+            ch, ds, [_make_col("departamento")], [], 10,
+            group_by=["departamento", "municipio"],
+            aggregations=[{"column": "*", "function": "COUNT"}],
+        )
+
+        assert rows == [{"departamento": "Guatemala", "municipio": "Mixco", "count": 7}]
+        data_sql = ch.query.call_args_list[0][0][0]
+        assert "GROUP BY departamento, municipio ORDER BY departamento, municipio" in data_sql
+
+
+# ==================== stream_query ====================
+
+class TestStreamQuery:
+    def _make_ds(self):
+        ds = MagicMock()
+        ds.ch_table = "rsh.beneficios_x_hogar"
+        ds.base_filter_columns = ["prog_fodes"]
+        ds.base_filter_logic = "OR"
+        ds.columns_def = SAMPLE_COLUMNS
+        return ds
+
+    def _make_stream(self, blocks, col_names):
+        stream = MagicMock()
+        stream.source.column_names = col_names
+        stream.__enter__.return_value = stream
+        stream.__iter__.return_value = iter(blocks)
+        return stream
+
+    def test_streams_blocks_without_count_or_limit(self):
+        ds = self._make_ds()
+        ch = MagicMock()
+        ch.query_row_block_stream.return_value = self._make_stream(
+            [[(1, "Guat"), (2, "Esc")], [(3, "Xela")]], ["hogar_id", "departamento"],
+        )
+        cols = [_make_col("hogar_id", data_type=ColumnDataType.INTEGER), _make_col("departamento")]
+
+        rows = stream_query(ch, ds, cols, [])
+
+        # La consulta se envia al invocar, antes de consumir filas
+        ch.query_row_block_stream.assert_called_once()
+        sql = ch.query_row_block_stream.call_args[0][0]
+        assert "prog_fodes = 1" in sql
+        assert "ORDER BY hogar_id" in sql
+        assert "LIMIT" not in sql
+        ch.query.assert_not_called()
+
+        assert list(rows) == [
+            {"hogar_id": 1, "departamento": "Guat"},
+            {"hogar_id": 2, "departamento": "Esc"},
+            {"hogar_id": 3, "departamento": "Xela"},
+        ]
+
+    def test_grouped_stream_sql(self):
+        ds = self._make_ds()
+        ch = MagicMock()
+        ch.query_row_block_stream.return_value = self._make_stream([], ["departamento", "count"])
+
+        rows = stream_query(
+            ch, ds, [_make_col("departamento")], [],
+            group_by=["departamento"],
+            aggregations=[{"column": "*", "function": "COUNT"}],
+        )
+
+        assert list(rows) == []
+        sql = ch.query_row_block_stream.call_args[0][0]
+        assert "GROUP BY departamento ORDER BY departamento" in sql
+
+
+class TestExportWriters:
+    META = [
+        {"column_name": "hogar_id", "label": "Hogar", "data_type": "INTEGER"},
+        {"column_name": "departamento", "label": "Departamento", "data_type": "TEXT"},
+    ]
+
+    def _rows(self, n):
+        return ({"hogar_id": i, "departamento": "Guatemala"} for i in range(n))
+
+    def test_csv_accepts_generator(self):
+        data = b"".join(generate_csv_streaming(self._rows(2500), self.META)).decode("utf-8-sig")
+        lines = data.strip().split("\n")
+        assert lines[0] == "Hogar,Departamento"
+        assert len(lines) == 2501
+
+    def test_excel_accepts_generator_and_sets_widths(self):
+        from openpyxl import load_workbook
+
+        buf = generate_excel(self._rows(150), self.META, title="Consulta")
+        ws = load_workbook(buf).active
+        assert ws.max_row == 151
+        assert ws.column_dimensions["B"].width == len("Departamento") + 4
+
 
 # ==================== validate_group_by ====================
 
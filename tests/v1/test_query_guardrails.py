@@ -0,0 +1,195 @@
+"""
+Unit tests for Query Builder cost guardrails (EXPLAIN ESTIMATE pre-flight).
+No database or HTTP client needed.
+"""
+import pytest
+from unittest.mock import MagicMock
+
+from api.v1.services.query_engine import guardrails
+from api.v1.services.query_engine.guardrails import (
+    CostEstimate, CostLimits, estimate_query, evaluate, limits_for_role, downgrade_count_mode,
+    VERDICT_OK, VERDICT_DOWNGRADE, VERDICT_REJECT,
+)
+from api.v1.models.data_source import ColumnDataType
+
+
+def _make_col(name, data_type=ColumnDataType.TEXT):
+    col = MagicMock()
+    col.column_name = name
+    col.data_type = data_type
+    return col
+
+
+COLUMNS = [_make_col("hogar_id", ColumnDataType.INTEGER), _make_col("departamento")]
+
+
+def _make_ds():
+    ds = MagicMock()
+    ds.ch_table = "rsh.beneficios_x_hogar"
+    ds.base_filter_columns = []
+    ds.base_filter_logic = "OR"
+    ds.columns_def = COLUMNS
+    return ds
+
+
+def _result(column_names, rows):
+    result = MagicMock()
+    result.column_names = column_names
+    result.result_rows = rows
+    return result
+
+
+def _make_client(explain_rows, stats_row=(800, 4000, 100)):
+    client = MagicMock()
+
+    def query(sql, parameters=None):
+        if sql.startswith("EXPLAIN ESTIMATE"):
+            return _result(["database", "table", "parts", "rows", "marks"], explain_rows)
+        return _result(["selected", "total", "rows"], [list(stats_row)])
+
+    client.query = MagicMock(side_effect=query)
+    return client
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    guardrails.estimate_cache.clear()
+    guardrails._table_stats_cache.clear()
+    yield
+    guardrails.estimate_cache.clear()
+    guardrails._table_stats_cache.clear()
+
+
+class TestEstimateQuery:
+    def test_sums_rows_marks_parts(self):
+        client = _make_client([["rsh", "beneficios_x_hogar", 3, 1000, 5], ["rsh", "beneficios_x_hogar", 1, 500, 2]])
+        est = estimate_query(client, _make_ds(), COLUMNS, [])
+        assert est.rows == 1500
+        assert est.marks == 7
+        assert est.parts == 4
+        # 800 bytes de columnas referenciadas / 100 filas = 8 bytes por fila
+        assert est.bytes == 1500 * 8
+
+    def test_explains_data_sql_with_filter_params(self):
+        client = _make_client([["rsh", "beneficios_x_hogar", 1, 10, 1]])
+        estimate_query(client, _make_ds(), COLUMNS, [{"column": "departamento", "op": "eq", "value": "Guatemala"}])
+        sql, = client.query.call_args_list[0].args
+        assert sql.startswith("EXPLAIN ESTIMATE SELECT hogar_id, departamento FROM rsh.beneficios_x_hogar")
+        assert "departamento = {p_0:String}" in sql
+        assert client.query.call_args_list[0].kwargs["parameters"] == {"p_0": "Guatemala"}
+
+    def test_estimate_is_cached(self):
+        client = _make_client([["rsh", "beneficios_x_hogar", 1, 10, 1]])
+        first = estimate_query(client, _make_ds(), COLUMNS, [])
+        calls = client.query.call_count
+        assert estimate_query(client, _make_ds(), COLUMNS, []) == first
+        assert client.query.call_count == calls
+
+    def test_bytes_unknown_when_stats_fail(self):
+        client = MagicMock()
+
+        def query(sql, parameters=None):
+            if sql.startswith("EXPLAIN ESTIMATE"):
+                return _result(["database", "table", "parts", "rows", "marks"], [["rsh", "t", 1, 10, 1]])
+            raise RuntimeError("ACCESS_DENIED")
+
+        client.query = MagicMock(side_effect=query)
+        est = estimate_query(client, _make_ds(), COLUMNS, [])
+        assert est.rows == 10
+        assert est.bytes is None
+
+
+class TestEvaluate:
+    def test_within_limits(self):
+        assert evaluate(CostEstimate(100, 1, 1, 1000), CostLimits(1000, 500, None)) == VERDICT_OK
+
+    def test_downgrade(self):
+        assert evaluate(CostEstimate(600, 1, 1, 1000), CostLimits(1000, 500, None)) == VERDICT_DOWNGRADE
+
+    def test_reject_by_rows(self):
+        assert evaluate(CostEstimate(2000, 1, 1, 1000), CostLimits(1000, 500, None)) == VERDICT_REJECT
+
+    def test_reject_by_bytes(self):
+        assert evaluate(CostEstimate(10, 1, 1, 5000), CostLimits(None, None, 1000)) == VERDICT_REJECT
+
+    def test_no_limits(self):
+        assert evaluate(CostEstimate(10**12, 1, 1, None), CostLimits(None, None, None)) == VERDICT_OK
+
+    def test_downgrade_count_mode(self):
+        assert downgrade_count_mode("exact", grouped=False) == "none"
+        assert downgrade_count_mode("exact", grouped=True) == "approx"
+        assert downgrade_count_mode("none", grouped=True) == "none"
+
+
+class TestLimitsForRole:
+    def test_role_override_and_default(self, monkeypatch):
+        monkeypatch.setenv("QUERY_MAX_ROWS_TO_READ", "1000")
+        monkeypatch.setenv("QUERY_MAX_ROWS_TO_READ__ANALYST", "50")
+        monkeypatch.setenv("QUERY_MAX_BYTES_TO_READ_MB", "2")
+        assert limits_for_role("ANALYST").max_rows == 50
+        assert limits_for_role("INSTITUTIONAL").max_rows == 1000
+        assert limits_for_role(None).max_bytes == 2 * 1024 * 1024
+
+    def test_role_override_zero_disables(self, monkeypatch):
+        monkeypatch.setenv("QUERY_MAX_ROWS_TO_READ", "1000")
+        monkeypatch.setenv("QUERY_MAX_ROWS_TO_READ__ADMIN", "0")
+        assert limits_for_role("ADMIN").max_rows is None
+
+
+class TestExportGuardrails:
+    @pytest.fixture(autouse=True)
+    def _enabled(self, monkeypatch):
+        monkeypatch.setattr(guardrails, "GUARDRAILS_ENABLED", True)
+
+    def _user(self):
+        user = MagicMock()
+        user.role.code = "analyst"
+        return user
+
+    def test_export_over_limit_is_rejected(self, monkeypatch):
+        from fastapi import HTTPException
+        from api.v1.routes.query_routes import _check_export_guardrails
+
+        monkeypatch.setenv("QUERY_MAX_ROWS_TO_READ", "1000")
+        client = _make_client([["rsh", "beneficios_x_hogar", 1, 5000, 1]])
+        with pytest.raises(HTTPException) as exc:
+            _check_export_guardrails(client, _make_ds(), self._user(), COLUMNS, [], None, None)
+        assert exc.value.status_code == 400
+
+    def test_export_ignores_downgrade_limit(self, monkeypatch):
+        from api.v1.routes.query_routes import _check_export_guardrails
+
+        monkeypatch.setenv("QUERY_DOWNGRADE_ROWS_TO_READ", "1000")
+        client = _make_client([["rsh", "beneficios_x_hogar", 1, 5000, 1]])
+        _check_export_guardrails(client, _make_ds(), self._user(), COLUMNS, [], None, None)
+        # Sin limite de rechazo no hace falta estimar
+        client.query.assert_not_called()
+
+
+class TestGuardrailsAfterResultCache:
+    def test_cache_hit_skips_estimate(self, monkeypatch):
+        from uuid import uuid4
+        from api.v1.routes import query_routes
+        from api.v1.services.query_engine.cache import result_cache
+
+        monkeypatch.setattr(guardrails, "GUARDRAILS_ENABLED", True)
+        monkeypatch.setenv("QUERY_DOWNGRADE_ROWS_TO_READ", "1000")
+        monkeypatch.setattr(query_routes, "execute_query", lambda *args, **kwargs: ([{"hogar_id": 1}], None))
+        client = _make_client([["rsh", "beneficios_x_hogar", 1, 5000, 1]])
+        ds = _make_ds()
+        ds.id = uuid4()
+        user = MagicMock()
+        user.role.code = "analyst"
+
+        result_cache.clear()
+        try:
+            first = query_routes._run_query(client, ds, user, COLUMNS, [], count_mode="exact")
+            calls = client.query.call_count
+            second = query_routes._run_query(client, ds, user, COLUMNS, [], count_mode="exact")
+        finally:
+            result_cache.clear()
+
+        # La primera pagina se degrada (sin total); la segunda sale del cache sin EXPLAIN
+        assert first[3] == second[3] == "none"
+        assert calls > 0
+        assert client.query.call_count == calls
@@ -69,14 +69,18 @@ def _seed_datasource(db_session, institution_id=None, code="QRY_DS"):
 
 
 def _mock_ch_client(count=5, rows=None, col_names=None):
-    """Create a mock ClickHouse client that returns predictable data."""
+    """Create a mock ClickHouse client that returns predictable data.
+
+    The engine fetches the page and the total in one query, so the total
+    travels in the extra `_total` column of every row.
+    """
     client = MagicMock()
-    count_result = MagicMock()
-    count_result.result_rows = [[count]]
     data_result = MagicMock()
-    data_result.column_names = col_names or ["hogar_id", "departamento"]
-    data_result.result_rows = rows or [[1, "Guatemala"], [2, "Escuintla"]]
-    client.query = MagicMock(side_effect=[count_result, data_result])
+    data_result.column_names = (col_names or ["hogar_id", "departamento"]) + ["_total"]
+    data_result.result_rows = [
+        list(r) + [count] for r in (rows or [[1, "Guatemala"], [2, "Escuintla"]])
+    ]
+    client.query = MagicMock(return_value=data_result)
     return client
 
 
@@ -164,8 +168,8 @@ class TestExecuteQuery:
             )
             assert resp.status_code == 200
             # Verify filter was passed to ClickHouse
-            count_sql = mock_ch.query.call_args_list[0][0][0]
-            assert "departamento =" in count_sql
+            data_sql = mock_ch.query.call_args_list[0][0][0]
+            assert "departamento =" in data_sql
         finally:
             app.dependency_overrides.pop(get_ch_client, None)
 
@@ -3,6 +3,9 @@ Tests para endpoints RSH de beneficiarios con mock ClickHouse.
 """
 from datetime import datetime, timedelta, timezone
 import pytest
+from fastapi.testclient import TestClient
+
+from main import app
 from api.v1.models.user_query_checkpoint import UserQueryCheckpoint
 
 BASE = "/api/v1/beneficiarios"
@@ -333,6 +336,50 @@ class TestVivienda:
         assert resp.status_code == 404
 
 
+# ========================= TestBundle ===============================
+
+class TestBundle:
+    """Tests para la ficha completa de un hogar en una sola respuesta."""
+
+    def test_bundle_completo(self, authenticated_ch_client, mock_ch):
+        hogar_id = mock_ch.dataset.get_first_hogar_id()
+        resp = authenticated_ch_client.get(f"{BASE}/{hogar_id}/bundle")
+        assert resp.status_code == 200
+        data = resp.json()["data"]
+        assert data["hogar_id"] == hogar_id
+        assert data["detalle"]["hogar_id"] == hogar_id
+        assert len(data["personas"]) > 0
+        assert "fuente_agua" in data["vivienda"]
+
+    def test_bundle_include(self, authenticated_ch_client, mock_ch):
+        hogar_id = mock_ch.dataset.get_first_hogar_id()
+        resp = authenticated_ch_client.get(f"{BASE}/{hogar_id}/bundle", params={"include": "personas,vivienda"})
+        assert resp.status_code == 200
+        data = resp.json()["data"]
+        assert "detalle" not in data
+        assert len(data["personas"]) > 0
+        assert data["vivienda"] is not None
+
+    def test_bundle_include_invalido(self, authenticated_ch_client, mock_ch):
+        hogar_id = mock_ch.dataset.get_first_hogar_id()
+        resp = authenticated_ch_client.get(f"{BASE}/{hogar_id}/bundle", params={"include": "detalle,foo"})
+        assert resp.status_code == 400
+
+    def test_bundle_despues_de_reiniciar_lifespan(self, authenticated_ch_client, mock_ch):
+        # El shutdown de la app cierra los pools de threads; deben recrearse en el siguiente uso
+        for _ in range(2):
+            with TestClient(app):
+                pass
+        hogar_id = mock_ch.dataset.get_first_hogar_id()
+        resp = authenticated_ch_client.get(f"{BASE}/{hogar_id}/bundle")
+        assert resp.status_code == 200
+        assert resp.json()["data"]["detalle"]["hogar_id"] == hogar_id
+
+    def test_bundle_hogar_inexistente(self, authenticated_ch_client, mock_ch):
+        resp = authenticated_ch_client.get(f"{BASE}/{mock_ch.dataset.get_nonexistent_hogar_id()}/bundle")
+        assert resp.status_code == 404
+
+
 # ========================= TestExport ===============================
 
 class TestExport:
@@ -354,10 +401,19 @@ class TestExport:
         assert resp.status_code == 200
         assert len(resp.content) > 0
 
+    def test_export_csv_completo(self, authenticated_ch_client, mock_ch):
+        resp = authenticated_ch_client.get(f"{BASE}/export/csv")
+        assert resp.status_code == 200
+        total = len(mock_ch.dataset.hogares)
+        assert "x-total-rows" not in resp.headers
+        lines = resp.content.decode("utf-8-sig").splitlines()
+        assert len(lines) == total + 1
+
     def test_export_pdf(self, authenticated_ch_client, mock_ch):
         resp = authenticated_ch_client.get(f"{BASE}/export/pdf")
         assert resp.status_code == 200
         assert resp.headers["content-type"] == "application/pdf"
+        assert 0 < int(resp.headers["x-rows-written"]) <= int(resp.headers["x-total-rows"])
         assert "attachment" in resp.headers.get("content-disposition", "")
         assert len(resp.content) > 0
 
@@ -417,3 +473,29 @@ class TestMappers:
         assert "radio" in result
         assert "preocupacion_alimentos" in result
         assert isinstance(result["personas_hogar"], int)
+
+
+class TestLookup:
+    """Tests para la busqueda masiva por lista de hogar_id o CUI."""
+
+    def test_lookup_hogar_ids(self, authenticated_ch_client, mock_ch):
+        hogar_ids = [h["hogar_id"] for h in mock_ch.dataset.hogares[:3]][::-1]
+        missing = mock_ch.dataset.get_nonexistent_hogar_id()
+        resp = authenticated_ch_client.post(
+            f"{BASE}/lookup", json={"ids": hogar_ids + [missing, "abc"]},
+        )
+        assert resp.status_code == 200
+        data = resp.json()["data"]
+        assert [item["id"] for item in data["items"]] == hogar_ids
+        assert data["no_encontrados"] == [missing]
+        assert data["invalidos"] == ["abc"]
+
+    def test_lookup_cui(self, authenticated_ch_client, mock_ch):
+        cui = mock_ch.dataset.hogares[0]["cui_jefe_hogar"]
+        resp = authenticated_ch_client.post(f"{BASE}/lookup", json={"campo": "cui", "ids": [str(cui)]})
+        assert resp.status_code == 200
+        assert resp.json()["data"]["items"][0]["beneficiarios"][0]["cui_jefe_hogar"] == cui
+
+    def test_lookup_demasiados_ids(self, authenticated_ch_client):
+        resp = authenticated_ch_client.post(f"{BASE}/lookup", json={"ids": list(range(5001))})
+        assert resp.status_code == 400
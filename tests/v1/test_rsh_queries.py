@@ -0,0 +1,418 @@
+"""
+Unit tests for RSH query builders against the mock ClickHouse client.
+No database needed.
+"""
+import pytest
+
+from api.v1.services.catalogos import catalog_service
+from api.v1.services.rsh.busqueda import BUSQUEDA_INDEX_TABLE, rebuild_search_index
+from api.v1.services.rsh.lookup import lookup_beneficiarios, parse_ids
+from api.v1.services.rsh.derived_tables import clear_derived_table_cache, derived_table_available
+from api.v1.services.rsh.codigos import clean_code, code_in, code_width_cache, fixed_string_widths
+from api.v1.services.rsh.filtros_catalogo import catalog_text_filter
+from api.v1.services.rsh.persona_flags import PERSONA_FLAGS_TABLE, PERSONAS_TABLE, rebuild_persona_flags
+from api.v1.services.rsh.queries import (
+    build_filters,
+    query_beneficiarios_lista,
+    query_catalogos,
+    query_hogar_bundle,
+    query_personas_hogar,
+    query_stats,
+)
+from tests.v1.mock_ch_client import MockClickHouseClient, MockQueryResult
+from tests.v1.rsh_mock_data import RSHMockDataset
+
+
+class CountingClient(MockClickHouseClient):
+    def __init__(self, dataset):
+        super().__init__(dataset)
+        self.sqls = []
+
+    def query(self, sql, parameters=None, settings=None):
+        # Metadatos cacheados (anchos de codigos, estado de tablas derivadas) no cuentan
+        if not any(table in sql for table in ("system.columns", "system.tables", "system.parts")):
+            self.sqls.append(sql)
+        return super().query(sql, parameters, settings)
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    return RSHMockDataset(n_hogares=300, personas_por_hogar=3)
+
+
+@pytest.fixture
+def client(dataset):
+    code_width_cache.clear()
+    catalog_service.clear()
+    return CountingClient(dataset)
+
+
+class TestQueryStats:
+    def test_single_filtered_scan(self, client, dataset):
+        stats = query_stats(client)
+        assert len(client.sqls) == 1
+        assert "GROUPING SETS" in client.sqls[0]
+        assert stats["total_hogares"] == len(dataset.hogares)
+        assert stats["total_personas"] == sum(h["numero_personas"] for h in dataset.hogares)
+
+    def test_distributions_sorted_and_consistent(self, client, dataset):
+        stats = query_stats(client)
+        deptos = stats["distribucion_departamentos"]
+        ipm = stats["distribucion_ipm"]
+        assert [d["cantidad_hogares"] for d in deptos] == sorted((d["cantidad_hogares"] for d in deptos), reverse=True)
+        assert len(deptos) <= 22
+        assert set(deptos[0]) == {"departamento", "departamento_codigo", "cantidad_hogares", "total_personas"}
+        assert sum(r["cantidad_hogares"] for r in ipm) == stats["total_hogares"]
+        assert set(ipm[0]) == {"ipm_gt_clasificacion", "cantidad_hogares", "ipm_promedio"}
+
+    def test_filter_applies_to_every_grouping(self, client, dataset):
+        depto = dataset.hogares[0]["departamento_codigo"]
+        stats = query_stats(client, departamento_codigo=depto)
+        esperado = sum(1 for h in dataset.hogares if h["departamento_codigo"] == depto)
+        assert stats["total_hogares"] == esperado
+        assert [d["departamento_codigo"] for d in stats["distribucion_departamentos"]] == [depto.strip()]
+        assert sum(r["cantidad_hogares"] for r in stats["distribucion_ipm"]) == esperado
+
+
+class TestQueryCatalogos:
+    def test_single_round_trip(self, client, dataset):
+        catalogos = query_catalogos(client)
+        assert len(client.sqls) == 1
+        assert "UNION ALL" in client.sqls[0]
+        codigos = sorted({h["departamento_codigo"].strip() for h in dataset.hogares})
+        assert [d["codigo"] for d in catalogos["departamentos"]] == codigos
+        assert catalogos["clasificaciones_ipm"] == sorted({h["ipm_gt_clasificacion"] for h in dataset.hogares})
+        for key in ("areas", "niveles_inseguridad", "pueblos", "fuentes_agua", "combustibles_cocina"):
+            assert catalogos[key] == sorted(catalogos[key])
+
+
+class TestHogarBundle:
+    def test_runs_requested_sections(self, client, dataset):
+        hogar_id = dataset.get_first_hogar_id()
+        bundle = query_hogar_bundle(client, hogar_id, ["personas", "vivienda"])
+        assert set(bundle) == {"personas", "vivienda"}
+        assert bundle["personas"] == query_personas_hogar(client, hogar_id)
+        assert bundle["vivienda"] is not None
+        assert len(client.sqls) == 3
+
+
+class TestLookup:
+    def test_parse_ids_normalizes_and_dedupes(self):
+        ids, invalidos = parse_ids(["1234 56789 0101", 7, "1234-56789-0101", "abc", " ", "7"])
+        assert ids == [1234567890101, 7]
+        assert invalidos == ["abc"]
+
+    def test_parse_ids_rejects_unicode_digits_and_sign(self):
+        ids, invalidos = parse_ids(["²", "12³", "-5", "5", "+5"])
+        assert ids == [5]
+        assert invalidos == ["²", "12³", "-5", "+5"]
+
+    def test_parse_ids_rejects_out_of_range(self):
+        ids, invalidos = parse_ids(["99999999999999999999", str(2**63 - 1), str(2**63)])
+        assert ids == [2**63 - 1]
+        assert invalidos == ["99999999999999999999", str(2**63)]
+        ids, invalidos = parse_ids(["12345678901234", "1234567890123"], "cui")
+        assert ids == [1234567890123]
+        assert invalidos == ["12345678901234"]
+
+    def test_lookup_with_oversized_id_does_not_query_it(self, client, dataset):
+        hogar_id = dataset.hogares[0]["hogar_id"]
+        result = lookup_beneficiarios(client, "hogar_id", [hogar_id, "99999999999999999999"])
+        assert result["encontrados"] == 1
+        assert result["invalidos"] == ["99999999999999999999"]
+
+    def test_hogar_ids_in_input_order(self, client, dataset):
+        hogar_ids = [h["hogar_id"] for h in dataset.hogares[:5]][::-1]
+        result = lookup_beneficiarios(client, "hogar_id", hogar_ids + [999999999, "x"])
+        assert [item["id"] for item in result["items"]] == hogar_ids
+        assert result["encontrados"] == 5
+        assert result["no_encontrados"] == [999999999]
+        assert result["invalidos"] == ["x"]
+        assert len(client.sqls) == 1
+        assert "{lookup_ids:Array(Int64)}" in client.sqls[0]
+
+    def test_cuis(self, client, dataset):
+        cuis = [h["cui_jefe_hogar"] for h in dataset.hogares[10:13]]
+        result = lookup_beneficiarios(client, "cui", [str(c) for c in cuis])
+        assert [item["id"] for item in result["items"]] == cuis
+        for item in result["items"]:
+            assert all(b["cui_jefe_hogar"] == item["id"] for b in item["beneficiarios"])
+
+
+class TestCatalogFilters:
+    CATALOGOS = {"clasificaciones_ipm": ["No Pobre", "Pobre", "Pobreza Extrema"]}
+
+    def test_substring_resolved_to_catalog_values(self):
+        condition, params = catalog_text_filter("p.ipm_gt_clasificacion", "ipm_clase", "extrema", self.CATALOGOS, "ipm_clasificacion")
+        assert condition == "p.ipm_gt_clasificacion IN {ipm_clase:Array(String)}"
+        assert params == {"ipm_clase": ["Pobreza Extrema"]}
+
+    def test_no_match_filters_everything(self):
+        assert catalog_text_filter("p.ipm_gt_clasificacion", "ipm_clase", "zz", self.CATALOGOS, "ipm_clasificacion") == ("1 = 0", {})
+
+    @pytest.mark.parametrize("catalogos, value", [(None, "pobre"), (CATALOGOS, "po_re")])
+    def test_falls_back_to_ilike(self, catalogos, value):
+        condition, params = catalog_text_filter("p.ipm_gt_clasificacion", "ipm_clase", value, catalogos, "ipm_clasificacion")
+        assert condition == "p.ipm_gt_clasificacion ILIKE {ipm_clase:String}"
+        assert params == {"ipm_clase": f"%{value}%"}
+
+    def test_lista_uses_cached_catalog(self, client, dataset):
+        rows, total = query_beneficiarios_lista(client, limit=500, ipm_clasificacion="pobre", area="rur")
+        assert "ILIKE" not in client.sqls[-1]
+        assert "p.area IN {area:Array(String)}" in client.sqls[-1]
+        expected = [h for h in dataset.hogares if "pobre" in h["ipm_gt_clasificacion"].lower() and h["area"] == "Rural"]
+        assert total == len(rows) == len(expected)
+
+
+class TestSemiJoinFilters:
+    def test_filter_only_tables_become_semi_joins(self):
+        where, _ = build_filters(
+            tiene_menores_5=True, tiene_adultos_mayores=True, fuente_agua="chorro", sin_empleo=True,
+        )
+        assert where.count("FROM rsh.vw_hogares_datos_demograficos AS d") == 1
+        assert (
+            "(p.hogar_id, p.anio) IN (SELECT d.hogar_id, d.anio_captura FROM rsh.vw_hogares_datos_demograficos AS d "
+            "WHERE d.p_0_5 > 0 AND d.adultos_mayores > 0)"
+        ) in where
+        assert "p.hogar_id IN (SELECT h.hogar_id FROM rsh.vw_hogar_fecs_v2 AS h" in where
+        assert "p.hogar_id NOT IN (SELECT ep.hogar_id FROM rsh.w_personas_fecs_v2 AS ep" in where
+        assert "EXISTS" not in where
+
+    def test_lista_has_no_joins(self, client, dataset):
+        rows, total = query_beneficiarios_lista(client, limit=500, tiene_menores_5=True, nivel_inseguridad="severa")
+        assert all("JOIN" not in sql for sql in client.sqls)
+        demograficos = {d["hogar_id"] for d in dataset.demograficos if d["p_0_5"] > 0}
+        inseguridad = {
+            i["hogar_id"] for i in dataset.inseguridad
+            if "severa" in i["nivel_inseguridad_alimentaria"].lower()
+        }
+        assert total == len(rows) == len(demograficos & inseguridad)
+
+
+
+class DDLClient:
+    """Registra comandos DDL; `exists` indica si la tabla derivada ya existe.
+
+    `source` es la marca de agua de origen (filas, ultima parte de nivel 0 en
+    system.parts) y `comment` el COMMENT de la tabla derivada en system.tables
+    (None: la tabla no existe). EXPLAIN ESTIMATE resuelve cualquier origen a
+    `physical`.
+    """
+
+    def __init__(self, exists, source=(1000, "2024-05-01 10:00:00"), comment=None, physical=("rsh", "personas")):
+        self.exists = exists
+        self.source = source
+        self.comment = comment
+        self.physical = physical
+        self.commands = []
+        self.queries = 0
+        self.parts_params = None
+
+    def command(self, cmd, parameters=None, settings=None):
+        self.commands.append(" ".join(cmd.split()))
+
+    def query(self, sql, parameters=None, settings=None):
+        self.queries += 1
+        if sql.startswith("EXISTS TABLE"):
+            return MockQueryResult(column_names=["result"], result_rows=[(int(self.exists),)])
+        if sql.startswith("EXPLAIN ESTIMATE"):
+            return MockQueryResult(
+                column_names=["database", "table", "parts", "rows", "marks"],
+                result_rows=[(*self.physical, 1, 10, 1)],
+            )
+        if "FROM system.parts" in sql:
+            self.parts_params = parameters
+            return MockQueryResult(column_names=["rows", "level0"], result_rows=[self.source])
+        if "FROM system.tables" in sql:
+            rows = [] if self.comment is None else [(self.comment,)]
+            return MockQueryResult(column_names=["comment"], result_rows=rows)
+        return MockQueryResult(column_names=["count()"], result_rows=[(42,)])
+
+
+BUILT = "rsh_derived:rows=1000;level0=2024-05-01 10:00:00"
+
+
+class TestDerivedTables:
+    @pytest.fixture(autouse=True)
+    def _clear_cache(self):
+        clear_derived_table_cache()
+        yield
+        clear_derived_table_cache()
+
+    def test_current_table_is_available(self):
+        client = DDLClient(True, comment=BUILT)
+        assert derived_table_available(client, PERSONA_FLAGS_TABLE, [PERSONAS_TABLE])
+        # Solo se miran las tablas fisicas que lee la tabla derivada
+        assert client.parts_params == {"tables": ["rsh.personas"]}
+
+    def test_merges_do_not_make_it_stale(self):
+        # Un merge reemplaza partes de nivel 0 por otras de nivel mayor: mismas filas, nivel 0 mas viejo
+        client = DDLClient(True, source=(1000, "1970-01-01 00:00:00"), comment=BUILT)
+        assert derived_table_available(client, PERSONA_FLAGS_TABLE, [PERSONAS_TABLE])
+
+    @pytest.mark.parametrize("source", [(1200, "2024-05-01 10:00:00"), (1000, "2024-05-02 08:00:00")])
+    def test_table_older_than_source_falls_back(self, source):
+        client = DDLClient(True, source=source, comment=BUILT)
+        assert not derived_table_available(client, PERSONA_FLAGS_TABLE, [PERSONAS_TABLE])
+        # El resultado queda cacheado
+        queries = client.queries
+        assert not derived_table_available(client, PERSONA_FLAGS_TABLE, [PERSONAS_TABLE])
+        assert client.queries == queries
+
+    @pytest.mark.parametrize("comment", [None, "", "rsh_derived:source_watermark=2024-05-01 10:00:00"])
+    def test_missing_table_or_watermark_falls_back(self, comment):
+        client = DDLClient(comment is not None, comment=comment)
+        assert not derived_table_available(client, PERSONA_FLAGS_TABLE, [PERSONAS_TABLE])
+
+    def test_rebuild_stores_source_watermark(self):
+        client = DDLClient(False)
+        rebuild_persona_flags(client)
+        assert f"ALTER TABLE {PERSONA_FLAGS_TABLE}_new MODIFY COMMENT '{BUILT}'" in client.commands
+
+
+class TestPersonaFlags:
+    def test_filters_use_flags_table(self):
+        where, _ = build_filters(
+            None, PERSONA_FLAGS_TABLE, con_analfabetismo=True, con_menores_sin_escuela=True, sin_empleo=True,
+        )
+        assert "w_personas_fecs_v2" not in where
+        assert (
+            f"p.hogar_id IN (SELECT pf.hogar_id FROM {PERSONA_FLAGS_TABLE} AS pf "
+            "WHERE pf.con_analfabetismo = 1 AND pf.con_menores_sin_escuela = 1)"
+        ) in where
+        assert f"p.hogar_id NOT IN (SELECT pf.hogar_id FROM {PERSONA_FLAGS_TABLE} AS pf WHERE pf.con_empleo = 1)" in where
+
+    def test_without_table_filters_read_personas(self):
+        where, _ = build_filters(con_analfabetismo=True)
+        assert "FROM rsh.w_personas_fecs_v2 AS ep WHERE lower(ep.pe1_descripcion) = 'no'" in where
+
+    @pytest.mark.parametrize("exists, publish", [(True, "EXCHANGE TABLES"), (False, "RENAME TABLE")])
+    def test_rebuild_swaps_staging_table(self, exists, publish):
+        client = DDLClient(exists)
+        assert rebuild_persona_flags(client) == 42
+        assert client.commands[0] == f"DROP TABLE IF EXISTS {PERSONA_FLAGS_TABLE}_new"
+        assert client.commands[1].startswith(f"CREATE TABLE {PERSONA_FLAGS_TABLE}_new ENGINE = MergeTree ORDER BY hogar_id")
+        assert "GROUP BY ep.hogar_id" in client.commands[1]
+        assert client.commands[2].startswith(f"ALTER TABLE {PERSONA_FLAGS_TABLE}_new MODIFY COMMENT")
+        assert client.commands[3].startswith(publish)
+
+
+class TestBusqueda:
+    def test_full_cui_is_exact_match(self):
+        where, params = build_filters(buscar="1234 56789-0101")
+        assert where == "p.cui_jefe_hogar = {buscar_cui:Int64}"
+        assert params == {"buscar_cui": 1234567890101}
+
+    def test_partial_cui_is_integer_range(self):
+        where, params = build_filters(None, None, BUSQUEDA_INDEX_TABLE, buscar="2615")
+        assert "toString" not in where
+        assert (
+            f"p.hogar_id IN (SELECT bs.hogar_id FROM {BUSQUEDA_INDEX_TABLE} AS bs "
+            "WHERE bs.cui_jefe_hogar BETWEEN {buscar_cui_min:Int64} AND {buscar_cui_max:Int64})"
+        ) == where
+        assert params == {"buscar_cui_min": 2615000000000, "buscar_cui_max": 2615999999999}
+
+    def test_too_many_digits_matches_nothing(self):
+        assert build_filters(buscar="12345678901234") == ("1 = 0", {})
+
+    @pytest.mark.parametrize("buscar", ["²", "12³4", "-5", "5-"])
+    def test_non_ascii_or_signed_digits_search_by_name(self, buscar):
+        where, params = build_filters(buscar=buscar)
+        assert "cui" not in where
+        assert params == {"buscar_nombre_0": f"%{buscar}%"}
+
+    def test_name_tokens_are_normalized(self):
+        where, params = build_filters(None, None, BUSQUEDA_INDEX_TABLE, buscar="  José  PÉREZ ")
+        assert where == (
+            f"p.hogar_id IN (SELECT bs.hogar_id FROM {BUSQUEDA_INDEX_TABLE} AS bs "
+            "WHERE bs.nombre_norm LIKE {buscar_nombre_0:String} AND bs.nombre_norm LIKE {buscar_nombre_1:String})"
+        )
+        assert params == {"buscar_nombre_0": "%jose%", "buscar_nombre_1": "%perez%"}
+
+    def test_lista_by_cui_prefix_and_name(self, client, dataset):
+        hogar = dataset.hogares[0]
+        prefix = str(hogar["cui_jefe_hogar"])[:6]
+        rows, total = query_beneficiarios_lista(client, limit=500, buscar=prefix)
+        assert hogar["hogar_id"] in {r["hogar_id"] for r in rows}
+        assert all(str(r["cui_jefe_hogar"]).startswith(prefix) for r in rows)
+
+        palabras = hogar["nombre_jefe_hogar"].split()
+        rows, total = query_beneficiarios_lista(client, limit=500, buscar=f"{palabras[-1]} {palabras[0]}")
+        assert hogar["hogar_id"] in {r["hogar_id"] for r in rows}
+
+    @pytest.mark.parametrize("exists, publish", [(True, "EXCHANGE TABLES"), (False, "RENAME TABLE")])
+    def test_rebuild_creates_ngram_index(self, exists, publish):
+        client = DDLClient(exists)
+        assert rebuild_search_index(client) == 42
+        assert client.commands[1].startswith(f"CREATE TABLE {BUSQUEDA_INDEX_TABLE}_new")
+        assert "TYPE ngrambf_v1(3, 65536, 3, 0)" in client.commands[1]
+        assert client.commands[2].startswith(f"INSERT INTO {BUSQUEDA_INDEX_TABLE}_new SELECT")
+        assert client.commands[4].startswith(publish)
+
+
+class ColumnsClient:
+    """Responde system.columns con anchos FixedString de vw_pobreza_hogars."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = 0
+
+    def query(self, sql, parameters=None, settings=None):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("sin system.columns")
+        return MockQueryResult(
+            column_names=["name", "type"],
+            result_rows=[
+                ("departamento_codigo", "FixedString(2)"),
+                ("municipio_codigo", "LowCardinality(FixedString(4))"),
+                ("sexo_jefe_hogar", "FixedString(1)"),
+                ("area", "String"),
+            ],
+        )
+
+
+class TestCodeFilters:
+    @pytest.fixture(autouse=True)
+    def _clear(self):
+        code_width_cache.clear()
+
+    def test_widths_cached_per_table(self):
+        client = ColumnsClient()
+        widths = fixed_string_widths(client, "vw_pobreza_hogars")
+        fixed_string_widths(client, "vw_pobreza_hogars")
+        assert widths == {"departamento_codigo": 2, "municipio_codigo": 4, "sexo_jefe_hogar": 1}
+        assert client.calls == 1
+
+    def test_geo_filters_compare_raw_column(self):
+        widths = fixed_string_widths(ColumnsClient(), "vw_pobreza_hogars")
+        where, params = build_filters(widths, departamento_codigo=" 1 ", municipio_codigo="0101", sexo_jefe="f")
+        assert "trim(" not in where
+        assert "p.departamento_codigo = {depto:FixedString(2)}" in where
+        assert "p.municipio_codigo = {muni:FixedString(4)}" in where
+        assert params["depto"] == "1"
+        assert params["muni"] == "0101"
+        assert params["sexo"] == "F"
+
+    def test_value_wider_than_column_matches_nothing(self):
+        widths = fixed_string_widths(ColumnsClient(), "vw_pobreza_hogars")
+        where, params = build_filters(widths, departamento_codigo="0123")
+        assert "1 = 0" in where
+        assert "depto" not in params
+
+    def test_unknown_widths_fall_back_to_trim(self):
+        widths = fixed_string_widths(ColumnsClient(fail=True), "vw_pobreza_hogars")
+        assert widths == {}
+        where, params = build_filters(widths, departamento_codigo="01", lugar_poblado_codigo="010101")
+        assert "trim(p.departamento_codigo) = {depto:String}" in where
+        assert "trim(p.lugarpoblado_codigo) = {lugar:String}" in where
+
+    def test_code_in_expands_typed_placeholders(self):
+        condition, params = code_in("municipio_codigo", "munis", ["0101", "12", "99999"], {"municipio_codigo": 4}, "p.")
+        assert condition == "p.municipio_codigo IN ({munis_0:FixedString(4)}, {munis_1:FixedString(4)})"
+        assert params == {"munis_0": "0101", "munis_1": "12"}
+
+    def test_clean_code_strips_fixedstring_padding(self):
+        assert clean_code(b"01\x00\x00") == "01"
+        assert clean_code(" 12\x00 ") == "12"
+        assert clean_code(None) == ""